@@ -14,11 +14,14 @@ from colordb.exceptions import InvalidColorTypeString
 
 color_types = defaultdict(lambda: {})
 
+# ASCII codes of hex digits, for ColorArray.hex()
+HEX_DIGITS = numpy.frombuffer('0123456789ABCDEF', dtype=numpy.uint8)
+
 def ColorType(name, *args, **kwargs):
     global color_types
     dtype = numpy.dtype(kwargs.pop('dtype', 'uint8'))
     ndtype = dtype.name
-    if name not in color_types[ndtype].keys():
+    if name not in color_types[ndtype]:
         __channels__ = channels = split_abbreviations(name)
         #print "*** %s" % name
         if not len(channels) > 0:
@@ -26,6 +29,12 @@ def ColorType(name, *args, **kwargs):
                 ColorType() called without a format string
                 specifying at least one channel (as a capital letter).""")
         
+        # hash() weights each channel by 256 ** index, whatever the dtype
+        weights = tuple(256 ** i for i in xrange(len(channels)))
+        # Channel width in bits for packing (integer dtypes only)
+        bits = dtype.kind in 'biu' and dtype.itemsize * 8 or None
+        hexformat = ''.join(['%0', str(len(channels) * 2), 'X'])
+        
         class Color(namedtuple(name, " ".join(channels))):
             
             __slots__ = ()
@@ -52,11 +61,35 @@ def ColorType(name, *args, **kwargs):
             def _cast(self, new_dtype=None):
                 if new_dtype is None:
                     new_dtype = numpy.dtype('uint8')
-                if numpy.dtype(new_dtype) in numpy.cast.keys():
+                new_dtype = numpy.dtype(new_dtype)
+                if new_dtype in numpy.cast.keys():
                     NewColorType = ColorType(name, dtype=new_dtype)
                     return NewColorType(*map(new_dtype.type, tuple(self)))
                 return self
             
+            @property
+            def packed(self):
+                """ The channels packed into one integer at their full
+                    width, first channel in the lowest bits. """
+                if bits is None:
+                    raise TypeError("%s values of dtype %s can't be packed" %
+                                    (name, dtype))
+                mask = (1 << bits) - 1
+                value = 0
+                for i, channel in enumerate(self):
+                    value |= (int(channel) & mask) << (i * bits)
+                return value
+            
+            @classmethod
+            def _unpack(cls, value):
+                """ The inverse of packed. """
+                if bits is None:
+                    raise TypeError("%s values of dtype %s can't be packed" %
+                                    (name, dtype))
+                mask = (1 << bits) - 1
+                return cls(*[dtype.type((value >> (i * bits)) & mask) \
+                    for i in xrange(len(__channels__))])
+            
             @property
             def name(self):
                 return self.__class__.__name__
@@ -66,9 +99,10 @@ def ColorType(name, *args, **kwargs):
                 return self.__dtype__
             
             def __hash__(self):
-                return sum(map(
-                    lambda chn: chn[1]*(256**chn[0]),
-                    zip(xrange(len(self)), self)))
+                value = 0
+                for channel, weight in zip(self, weights):
+                    value += channel * weight
+                return int(value)
             
             def __int__(self):
                 return int(hash(self))
@@ -86,52 +120,199 @@ def ColorType(name, *args, **kwargs):
                     for i in xrange(len(self))])
             
             def __eq__(self, other):
-                return (hash(self) == hash(other)) and \
-                    (self.name == other.name)
+                return isinstance(other, tuple) and \
+                    getattr(other, 'name', None) == name and \
+                    tuple.__eq__(self, other)
             
             def __ne__(self, other):
-                return (hash(self) != hash(other)) or \
-                    (self.name != other.name)
+                return not self.__eq__(other)
             
             def __nonzero__(self):
-                return numpy.any(self)
+                return any(self)
             
             def __oct__(self):
                 return '0%0o' % hash(self)
             
             def __hex__(self):
-                return ''.join(['0x%0', str(len(__channels__)*2), 'X']) % hash(self)
+                return '0x' + hexformat % hash(self)
             
             def __str__(self):
-                return ''.join(['#%0', str(len(__channels__)*2), 'X']) % hash(self)
-                #return ('#%%0 %iX' % len(self)*2) % hash(self)
+                return '#' + hexformat % hash(self)
             
             def __unicode__(self):
-                return u''.join([u'#%0', unicode(len(__channels__)*2), u'X']) % hash(self)
-                #return (u'#%%0 %iX' % len(self)*2) % hash(self)
-            
-            def __array_interface__(self):
-                """ Many more details available:
-                    http://docs.scipy.org/doc/numpy/reference/arrays.interface.html#python-side """
-                return dict(
-                    version=3,
-                    data=(id(self), True),
-                    shape=(len(__channels__),),
-                    typestr='%s%s%s' % (
-                        self.dtype.byteorder,
-                        self.dtype.kind,
-                        self.dtype.itemsize),
-                    descr=[(channel, self.dtype.str) \
-                        for channel in __channels__])
+                return u'#' + unicode(hexformat % hash(self))
+            
+            def __array__(self, dtype=None):
+                return numpy.array(tuple(self), dtype=dtype or self.dtype)
         
         Color.__name__ = name
         Color.__dtype__ = dtype
+        Color.__bits__ = bits
         color_types[ndtype][name] = Color
         return Color
     
     return color_types[ndtype][name]
 
 
+class ColorArray(object):
+    """
+    An array of ColorType(name, dtype=dtype) colors, stored as a
+    structured NumPy array with one field per channel.
+    
+    Hashing, packing, comparison, deduplication, hex formatting and
+    dtype casting work on the whole array at once. Indexing with an
+    integer returns a color, any other index a ColorArray.
+    """
+    
+    def __init__(self, name, data=(), dtype='uint8'):
+        self.type = ColorType(name, dtype=dtype)
+        self.dtype = numpy.dtype([(channel, self.type.__dtype__) \
+            for channel in self.type._fields])
+        if isinstance(data, ColorArray):
+            data = data.array
+        if isinstance(data, numpy.ndarray) and data.dtype.names:
+            self.array = numpy.empty(len(data), dtype=self.dtype)
+            for channel in self.type._fields:
+                self.array[channel] = data[channel]
+        else:
+            data = numpy.array(data, dtype=self.type.__dtype__)
+            self.array = data.reshape(-1, len(self.type._fields)).view(
+                self.dtype).reshape(-1)
+    
+    @classmethod
+    def from_packed(cls, name, packed, dtype='uint8'):
+        """ The inverse of ColorArray.packed(). """
+        colors = cls(name, dtype=dtype)
+        packed = numpy.asarray(packed, dtype=numpy.uint64).reshape(-1)
+        bits = colors._packed_bits()
+        mask = numpy.uint64((1 << bits) - 1)
+        colors.array = numpy.empty(len(packed), dtype=colors.dtype)
+        for i, channel in enumerate(colors.type._fields):
+            colors.array[channel] = (packed >> numpy.uint64(i * bits)) & mask
+        return colors
+    
+    def __len__(self):
+        return len(self.array)
+    
+    def __iter__(self):
+        for values in self.array.tolist():
+            yield self.type(*values)
+    
+    def __getitem__(self, key):
+        if isinstance(key, (int, long, numpy.integer)):
+            return self.type(*self.array[key].tolist())
+        return ColorArray(self.type.__name__, self.array[key],
+                          self.type.__dtype__)
+    
+    def __repr__(self):
+        return "ColorArray(%s, dtype=%s, %i colors)" % (
+            self.type.__name__, self.type.__dtype__, len(self))
+    
+    def __array__(self, dtype=None):
+        if dtype is None:
+            return self.array
+        return self.array.astype(dtype)
+    
+    __hash__ = None
+    
+    def __eq__(self, other):
+        """ Elementwise comparison with a ColorArray or a color. """
+        if isinstance(other, ColorArray):
+            other_name = other.type.__name__
+            other = other.values
+        else:
+            other_name = getattr(other, 'name', None)
+            other = tuple(other)
+        if other_name != self.type.__name__:
+            return numpy.zeros(len(self), dtype=bool)
+        return (self.values == other).all(axis=-1)
+    
+    def __ne__(self, other):
+        return ~self.__eq__(other)
+    
+    @property
+    def values(self):
+        """ The channel values as a (colors, channels) array. """
+        return numpy.ascontiguousarray(self.array).view(
+            self.type.__dtype__).reshape(-1, len(self.type._fields))
+    
+    def tolist(self):
+        return list(self)
+    
+    def astype(self, dtype):
+        """ Cast the channel values (without scaling), like Color._cast. """
+        return ColorArray(self.type.__name__, self.values.astype(dtype), dtype)
+    
+    def hashes(self):
+        """ hash() of each color. """
+        dtype = self.type.__dtype__
+        if dtype.kind in 'biu':
+            # Exact integer arithmetic, like Python longs
+            dtype = numpy.dtype(numpy.int64)
+        hashes = numpy.zeros(len(self), dtype=dtype)
+        for i, channel in enumerate(self.type._fields):
+            hashes = hashes + self.array[channel].astype(dtype) * 256 ** i
+        return hashes.astype(numpy.int64)
+    
+    def _packed_bits(self):
+        bits = self.type.__bits__
+        if bits is None or bits * len(self.type._fields) > 64:
+            raise TypeError("%s values of dtype %s can't be packed into "
+                            "64 bits" % (self.type.__name__,
+                                         self.type.__dtype__))
+        return bits
+    
+    def packed(self):
+        """ The packed value of each color (see Color.packed) as uint64. """
+        bits = self._packed_bits()
+        mask = numpy.uint64((1 << bits) - 1)
+        packed = numpy.zeros(len(self), dtype=numpy.uint64)
+        for i, channel in enumerate(self.type._fields):
+            packed |= (self.array[channel].astype(numpy.uint64) & mask) << \
+                numpy.uint64(i * bits)
+        return packed
+    
+    def unique(self, return_inverse=False):
+        """
+        The distinct colors, sorted by packed value (or by channel values
+        if these can't be packed). With return_inverse, also return the
+        indices that rebuild this array from the distinct colors.
+        """
+        try:
+            packed = self.packed()
+        except TypeError:
+            keys, index, inverse = numpy.unique(self.array, return_index=True,
+                                                return_inverse=True)
+            unique = self[index]
+        else:
+            keys = numpy.unique(packed)
+            unique = ColorArray.from_packed(self.type.__name__, keys,
+                                            self.type.__dtype__)
+            if return_inverse:
+                inverse = numpy.searchsorted(keys, packed)
+        if return_inverse:
+            return unique, inverse
+        return unique
+    
+    def hex(self, prefix='#'):
+        """ str() of each color as a string array, with the given prefix. """
+        width = len(self.type._fields) * 2
+        hashes = self.hashes()
+        dtype = self.type.__dtype__
+        if dtype.kind not in 'bu' or dtype.itemsize != 1:
+            # hash() may not fit the width of str()
+            hexformat = prefix + '%%0%iX' % width
+            return numpy.array([hexformat % value for value in
+                                hashes.tolist()], dtype='S')
+        shifts = numpy.arange(4 * (width - 1), -1, -4, dtype=numpy.int64)
+        chars = numpy.empty((len(self), len(prefix) + width),
+                            dtype=numpy.uint8)
+        chars[:, :len(prefix)] = numpy.frombuffer(prefix, dtype=numpy.uint8)
+        chars[:, len(prefix):] = HEX_DIGITS[
+            (hashes[:, numpy.newaxis] >> shifts) & 15]
+        return chars.view('S%i' % chars.shape[1]).reshape(-1)
+
+
 def main():
     RGB = ColorType('RGB', dtype=numpy.dtype('uint8'))
     rgb = RGB(235, 21, 12)
@@ -169,13 +350,21 @@ def main():
     print rgb.__doc__()
     
     print ""
-    print "rgb.__array_interface__(): %s" % rgb.__array_interface__()
     print "numpy.asarray(rgb): %s" % numpy.asarray(rgb2)
     print "numpy.asarray(rgb).dtype: %s" % numpy.asarray(rgb2).dtype
     print "numpy.asarray(rgb).shape: %s" % numpy.asarray(rgb2).shape
     print "numpy.array(rgb): %s" % numpy.array(rgb2)
     print "numpy.array(rgb).dtype: %s" % numpy.array(rgb2).dtype
     print "numpy.array(rgb).shape: %s" % numpy.array(rgb2).shape
+    
+    print ""
+    rgbs = ColorArray('RGB', [rgb, rgb2, notrgb])
+    print "rgbs: %r" % rgbs
+    print "rgbs.hashes(): %s" % rgbs.hashes()
+    print "rgbs.hex(): %s" % rgbs.hex()
+    print "rgbs == rgb: %s" % (rgbs == rgb)
+    print "rgbs.unique(): %s" % rgbs.unique().tolist()
+    print "rgbs.astype('uint16')[0]: %r" % (rgbs.astype('uint16')[0], )
 
 if __name__ == '__main__':
     main()
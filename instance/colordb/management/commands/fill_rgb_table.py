@@ -1,30 +1,140 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-from django.core.management.base import BaseCommand
+from cStringIO import StringIO
+from itertools import izip
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
 from optparse import make_option
+import numpy
+
+# PostgreSQL binary COPY format: signature, flags and header extension
+# length, then one tuple per row and a trailer
+PGCOPY_HEADER = 'PGCOPY\n\377\r\n\0' + '\0' * 8
+PGCOPY_TRAILER = '\377\377'
+# Binary COPY types of the RGB fields
+PGCOPY_TYPES = {
+    'PositiveIntegerField': '>i4',
+    'PositiveSmallIntegerField': '>i2'}
+
+# Rows per INSERT on other backends (SQLite allows 999 query parameters)
+BULK_BATCH_SIZE = 200
+
+
+def rgb_rows(start, stop):
+    """ return:
+         a dict of column values for ids start..stop-1,
+         with channel values as stored by RGB.save() (see uint24_to_rgb).
+    """
+    from colordb.namedcolor import uint24_to_rgb_array
+
+    ids = numpy.arange(start, stop, dtype=numpy.uint32)
+    rgb = uint24_to_rgb_array(ids)
+    return {
+        'id': ids,
+        '_r': rgb[:, 0],
+        '_g': rgb[:, 1],
+        '_b': rgb[:, 2]}
+
 
 class Command(BaseCommand):
-    
+
     option_list = BaseCommand.option_list + (
         make_option('--ignore-values', '-i', dest='ignore_values',
             action="store_true", default=False,
-            help="Ignore existant stored values.",
+            help="Ignore existant stored values (assume an empty table).",
+        ),
+        make_option('--chunk-size', '-c', dest='chunk_size',
+            type="int", default=65536,
+            help="Number of colors stored per transaction (default 65536).",
+        ),
+        make_option('--packed', '-p', dest='packed',
+            action="store_true", default=False,
+            help="Fill the PackedRGB table (ids only) instead.",
+        ),
+        make_option('--database', dest='database',
+            default=DEFAULT_DB_ALIAS,
+            help="Database to fill (default '%s')." % DEFAULT_DB_ALIAS,
         ),
     )
-    
-    help = ('Fills RGB color table.')
+
+    help = ('Fills RGB color table. Chunks stored by an interrupted '
+            'run are kept.')
     args = ''
     requires_model_validation = True
     can_import_settings = True
 
     def handle(self, *args, **options):
-        from colordb.models import RGB
-        
-        print "Filling RGB table for (r,g,b) values 0..255 ..."
-        
-        for r in xrange(0, 255):
-            for g in xrange(0, 255):
-                for b in xrange(0, 255):
-                    compand = r*(256**2) + g*256 + b
-                    rgb = RGB(id=compand)
-                    rgb.save()
\ No newline at end of file
+        from colordb.models import PackedRGB, RGB
+
+        if options.get('packed'):
+            model = PackedRGB
+        else:
+            model = RGB
+        database = options.get('database') or DEFAULT_DB_ALIAS
+        chunk_size = options.get('chunk_size') or 65536
+        verbosity = int(options.get('verbosity', 1))
+        if chunk_size < 1:
+            raise CommandError("Chunk size must be at least 1.")
+        connection = connections[database]
+        size = 256 ** 3
+
+        if verbosity:
+            print "Filling RGB table for (r,g,b) values 0..255 ..."
+
+        for start in xrange(0, size, chunk_size):
+            stop = min(start + chunk_size, size)
+            stored = 0
+            if not options.get('ignore_values'):
+                stored = model.objects.using(database).filter(
+                    id__gte=start, id__lt=stop).count()
+                if stored == stop - start:
+                    if verbosity > 1:
+                        print "%i..%i already stored" % (start, stop - 1)
+                    continue
+            with transaction.commit_on_success(using=database):
+                if stored:
+                    # Partially stored chunk (e.g. by a former version of
+                    # this command, which left out channel values of 255)
+                    model.objects.using(database).filter(
+                        id__gte=start, id__lt=stop).delete()
+                if connection.vendor == 'postgresql':
+                    self.copy_rows(model, connection, start, stop)
+                else:
+                    self.create_rows(model, database, start, stop)
+            if verbosity:
+                print "%i of %i colors stored (%.1f%%)" % (
+                    stop, size, 100.0 * stop / size)
+
+    def copy_rows(self, model, connection, start, stop):
+        """ Store rows start..stop-1 with a binary COPY (PostgreSQL). """
+        values = rgb_rows(start, stop)
+        fields = model._meta.fields
+        # Field count, then size and value of each field
+        dtype = [('fields', '>i2')]
+        for field in fields:
+            dtype += [(field.column + ' size', '>i4'),
+                      (field.column, PGCOPY_TYPES[field.get_internal_type()])]
+        rows = numpy.empty(stop - start, dtype)
+        rows['fields'] = len(fields)
+        for field in fields:
+            rows[field.column + ' size'] = rows.dtype[field.column].itemsize
+            rows[field.column] = values[field.column]
+        columns = ', '.join(connection.ops.quote_name(field.column) for
+                            field in fields)
+        cursor = connection.cursor()
+        cursor.copy_expert(
+            'COPY %s (%s) FROM STDIN WITH BINARY' % (
+                connection.ops.quote_name(model._meta.db_table), columns),
+            StringIO(PGCOPY_HEADER + rows.tostring() + PGCOPY_TRAILER))
+
+    def create_rows(self, model, database, start, stop):
+        """ Store rows start..stop-1 with bulk_create (other backends). """
+        values = rgb_rows(start, stop)
+        names = [field.attname for field in model._meta.fields]
+        rows = zip(*[values[field.column].tolist() for field in
+                     model._meta.fields])
+        for i in xrange(0, len(rows), BULK_BATCH_SIZE):
+            model.objects.using(database).bulk_create([
+                model(**dict(izip(names, row))) for row in
+                rows[i:i + BULK_BATCH_SIZE]])
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'PackedRGB'
+        db.create_table('colordb_packedrgb', (
+            ('id', self.gf('django.db.models.fields.PositiveIntegerField')(default=0, primary_key=True)),
+        ))
+        db.send_create_signal('colordb', ['PackedRGB'])
+
+        # Expression indexes for filters on g and b (r uses the primary key)
+        if db.backend_name in ('postgres', 'sqlite3'):
+            for channel, expression in (('g', '(id >> 8) & 255'),
+                                        ('b', 'id & 255')):
+                db.execute('CREATE INDEX colordb_packedrgb_%s ON '
+                           'colordb_packedrgb ((%s))' % (channel, expression))
+
+
+    def backwards(self, orm):
+        # Deleting model 'PackedRGB'
+        db.delete_table('colordb_packedrgb')
+
+
+    models = {
+        'colordb.packedrgb': {
+            'Meta': {'object_name': 'PackedRGB'},
+            'id': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0', 'primary_key': 'True'})
+        },
+        'colordb.rgb': {
+            'Meta': {'object_name': 'RGB'},
+            '_b': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0', 'db_index': 'True'}),
+            '_g': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0', 'db_index': 'True'}),
+            '_r': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0', 'db_index': 'True'}),
+            'id': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0', 'unique': 'True', 'primary_key': 'True', 'db_index': 'True'})
+        }
+    }
+
+    complete_apps = ['colordb']
@@ -1,7 +1,9 @@
 
 from collections import namedtuple
 
+from django.core.exceptions import FieldError
 from django.db import models
+from django.db.models.query import QuerySet
 import numpy
 
 # Add recognized model option to django
@@ -81,7 +83,35 @@ class RGBColor(namedtuple("RGBColor", 'r g b')):
         #return (u'#%%0 %iX' % len(self)*2) % hash(self)
 
 
-class RGB(models.Model):
+class RGBValue(models.Model):
+    """ r, g, b and value of colors stored by uint24 id (0xRRGGBB). """
+    
+    class Meta:
+        abstract = True
+    
+    def _get_named_tuple(self):
+        return RGBColor(
+            r=((self.id >> 16) & 255),
+            g=((self.id >> 8) & 255),
+            b=(self.id & 255))
+    
+    value = property(_get_named_tuple)
+    
+    def _get_r(self):
+        return self.value.r
+    
+    def _get_g(self):
+        return self.value.g
+    
+    def _get_b(self):
+        return self.value.b
+    
+    r = property(_get_r)
+    g = property(_get_g)
+    b = property(_get_b)
+
+
+class RGB(RGBValue):
     id = models.PositiveIntegerField(
         primary_key=True,
         db_index=True,
@@ -107,25 +137,119 @@ class RGB(models.Model):
         from colordb.namedcolor import uint24_to_rgb
         self._r, self._g, self._b = uint24_to_rgb(self.id)
         super(RGB, self).save(*args, **kwargs)
+
+
+class PackedRGBQuerySet(QuerySet):
+    """
+    Translates filters on the r, g and b channels into conditions on the
+    uint24 id: r (the high byte) into id ranges, which use the primary key
+    index, g and b into bitmask expressions, which use the expression
+    indexes created by migration 0003 (PostgreSQL and SQLite).
     
-    def _get_named_tuple(self):
-        return RGBColor(
-            r=((self.id >> 16) & 255),
-            g=((self.id >> 8) & 255),
-            b=(self.id & 255))
+    Supported lookups are exact, gt, gte, lt, lte, range and in.
+    Channel filters in Q objects are not translated. exclude() with both
+    channel and other filters excludes the ids matching all of them, like
+    exclude() does for other fields.
+    """
     
-    value = property(_get_named_tuple)
+    expressions = {
+        'g': '((%s >> 8) & 255)',
+        'b': '(%s & 255)'}
     
-    def _get_r(self):
-        return self.value.r
+    operators = {
+        'exact': '= %s',
+        'gt': '> %s',
+        'gte': '>= %s',
+        'lt': '< %s',
+        'lte': '<= %s'}
     
-    def _get_g(self):
-        return self.value.g
+    def _filter_or_exclude(self, negate, *args, **kwargs):
+        lookups = sorted(lookup for lookup in kwargs
+                         if lookup.partition('__')[0] in ('r', 'g', 'b'))
+        if not lookups:
+            return super(PackedRGBQuerySet, self)._filter_or_exclude(
+                negate, *args, **kwargs)
+        if negate and (args or len(lookups) < len(kwargs)):
+            # exclude(a, b) means NOT (a AND b), so the channel conditions
+            # can't be negated on their own. Exclude the ids matching all
+            # filters instead.
+            matches = self.__class__(self.model, using=self.db).filter(
+                *args, **kwargs)
+            return self.exclude(pk__in=matches.values('pk'))
+        kwargs = kwargs.copy()
+        conditions = []
+        params = []
+        for lookup in lookups:
+            channel, _, lookup_type = lookup.partition('__')
+            condition, condition_params = self._channel_condition(
+                channel, lookup_type or 'exact', kwargs.pop(lookup))
+            conditions.append(condition)
+            params.extend(condition_params)
+        where = ' AND '.join(conditions)
+        if negate:
+            where = 'NOT (%s)' % where
+        clone = self.extra(where=[where], params=params)
+        if args or kwargs:
+            clone = super(PackedRGBQuerySet, clone)._filter_or_exclude(
+                negate, *args, **kwargs)
+        return clone
     
-    def _get_b(self):
-        return self.value.b
+    def _channel_condition(self, channel, lookup_type, value):
+        """ Return SQL and params for a channel lookup. """
+        from django.db import connections
+        qn = connections[self.db].ops.quote_name
+        column = '%s.%s' % (qn(self.model._meta.db_table),
+                            qn(self.model._meta.pk.column))
+        if lookup_type == 'in':
+            conditions = []
+            params = []
+            for item in value:
+                condition, condition_params = self._channel_condition(
+                    channel, 'exact', item)
+                conditions.append(condition)
+                params.extend(condition_params)
+            if not conditions:
+                return '1 = 0', []
+            return '(%s)' % ' OR '.join(conditions), params
+        if lookup_type == 'range':
+            start, end = [int(item) for item in value]
+        elif lookup_type in self.operators:
+            start = end = int(value)
+        else:
+            raise FieldError("Unsupported lookup '%s' for channel %s" % (
+                lookup_type, channel))
+        if channel != 'r':
+            expression = self.expressions[channel] % column
+            if lookup_type == 'range':
+                return '%s BETWEEN %%s AND %%s' % expression, [start, end]
+            return '%s %s' % (expression, self.operators[lookup_type]), [start]
+        # The ids of r = value are value << 16 .. value << 16 | 0xFFFF
+        if lookup_type in ('exact', 'range'):
+            return '%s BETWEEN %%s AND %%s' % column, [
+                start << 16, end << 16 | 0xFFFF]
+        if lookup_type in ('gt', 'lte'):
+            return '%s %s' % (column, self.operators[lookup_type]), [
+                start << 16 | 0xFFFF]
+        return '%s %s' % (column, self.operators[lookup_type]), [start << 16]
+
+
+class PackedRGBManager(models.Manager):
     
-    r = property(_get_r)
-    g = property(_get_g)
-    b = property(_get_b)
+    def get_query_set(self):
+        return PackedRGBQuerySet(self.model, using=self._db)
+
+
+class PackedRGB(RGBValue):
+    """
+    Alternative to RGB which stores the uint24 id only. Use
+    PackedRGB.objects.filter(r__range=(100, 120), ...) for channel
+    filters.
+    """
+    id = models.PositiveIntegerField(
+        primary_key=True,
+        default=0,
+        blank=True,
+        null=False)
+    
+    objects = PackedRGBManager()
     
\ No newline at end of file
@@ -6,13 +6,24 @@ Green = (RGBint >> 8) & 255
 Red =   (RGBint >> 16) & 255
 """
 
-from colordb.colortype import ColorType
+import numpy
+
+from colordb.colortype import ColorType, HEX_DIGITS
 from colorkit.icc.colormath import RGB2XYZ
 from colorkit.icc.ICCProfile import NamedColor2Type
 from colorkit.icc.ICCProfile import NamedColor2Value
 
 RGB = ColorType('RGB')
 
+# Value of each ASCII code as a hex digit (-1 if it isn't one)
+HEX_VALUES = -numpy.ones(256, dtype=numpy.int8)
+HEX_VALUES[HEX_DIGITS] = numpy.arange(16)
+HEX_VALUES[numpy.frombuffer('abcdef', dtype=numpy.uint8)] = numpy.arange(10,
+                                                                         16)
+# Whether each ASCII code is whitespace
+IS_SPACE = numpy.zeros(256, dtype=bool)
+IS_SPACE[numpy.frombuffer(' \t\r\n', dtype=numpy.uint8)] = True
+
 def uint24_to_rgb(uint24=0):
     """ convert:
          an unsigned 24-bit(ish) integer
@@ -40,8 +51,14 @@ def uint24_to_hex(uint24=0):
 def normalize_hex(hexstr):
     """ internal-use helper:
          for normalizing/unfucking hex RGB strings
+         (strips a '#' or '0x' prefix, keeps leading zeros)
     """
-    return hexstr.upper().lstrip('#0X')
+    hexstr = hexstr.strip().upper()
+    if hexstr.startswith('#'):
+        return hexstr[1:]
+    if hexstr.startswith('0X'):
+        return hexstr[2:]
+    return hexstr
 
 def hex_to_int(hexstr):
     """ convert:
@@ -64,6 +81,105 @@ def hex_to_RGB(hexstr):
     """
     return uint24_to_RGB(hex_to_int(hexstr))
 
+def hex_to_uint24_array(hexstrs):
+    """ convert:
+         a sequence of hex strings '#RRGGBB' (or 'RRGGBB', '0xRRGGBB')
+         to an array of uint32 values, like hex_to_int().
+    """
+    hexstrs = numpy.asarray(hexstrs, dtype='S').reshape(-1)
+    width = hexstrs.dtype.itemsize
+    # Strings are padded with NUL bytes to the array's item size; an
+    # extra NUL column keeps prefix checks within bounds
+    chars = numpy.zeros((len(hexstrs), width + 1), dtype=numpy.uint8)
+    chars[:, :width] = numpy.ascontiguousarray(hexstrs).view(
+        numpy.uint8).reshape(-1, width)
+    rows = numpy.arange(len(chars))
+    # Skip surrounding whitespace, then a '#' or '0x' prefix
+    text = (chars != 0) & ~IS_SPACE[chars]
+    start = text.argmax(axis=1)
+    length = numpy.where(text.any(axis=1),
+                         width + 1 - text[:, ::-1].argmax(axis=1), 0)
+    first, second = chars[rows, start], chars[rows, start + 1]
+    start[first == ord('#')] += 1
+    start[(first == ord('0')) &
+          ((second == ord('x')) | (second == ord('X')))] += 2
+    digits = HEX_VALUES[chars]
+    columns = numpy.arange(width + 1)
+    within = ((columns >= start[:, numpy.newaxis]) &
+              (columns < length[:, numpy.newaxis]))
+    invalid = (length - start < 1) | (length - start > 8) | \
+        (within & (digits < 0)).any(axis=1)
+    if invalid.any():
+        raise ValueError("invalid hex color %r" %
+                         hexstrs[numpy.flatnonzero(invalid)[0]])
+    uint24 = numpy.zeros(len(chars), dtype=numpy.uint32)
+    for column in xrange(width + 1):
+        uint24 = numpy.where(within[:, column],
+                             (uint24 << 4) | digits[:, column].astype(
+                                 numpy.uint32),
+                             uint24)
+    return uint24
+
+def uint24_to_rgb_array(uint24):
+    """ convert:
+         an array of unsigned 24-bit integers
+         to an (N, 3) array of uint8 values (r, g, b), like uint24_to_rgb().
+    """
+    uint24 = numpy.ascontiguousarray(uint24, dtype='<u4').reshape(-1)
+    # The three low-order bytes, lowest first
+    return uint24.view(numpy.uint8).reshape(-1, 4)[:, :3].copy()
+
+def uint24_to_RGB_array(uint24):
+    """ convert:
+         an array of unsigned 24-bit integers
+         to an (N, 3) array of float 0.0-1.0 values (R, G, B).
+    """
+    return uint24_to_rgb_array(uint24) / 255.0
+
+def rgb_to_uint24_array(rgb):
+    """ convert:
+         an (N, 3) array of uint8 values (r, g, b)
+         to an array of unsigned 24-bit integers (the inverse of
+         uint24_to_rgb_array()).
+    """
+    rgb = numpy.asarray(rgb, dtype=numpy.uint8).reshape(-1, 3)
+    chars = numpy.zeros((len(rgb), 4), dtype=numpy.uint8)
+    chars[:, :3] = rgb
+    return chars.view('<u4').reshape(-1).astype(numpy.uint32)
+
+def uint24_to_hex_array(uint24, prefix='#'):
+    """ convert:
+         an array of unsigned 24-bit integers
+         to an array of hex strings '#RRGGBB', like uint24_to_hex().
+    """
+    uint24 = numpy.ascontiguousarray(uint24, dtype='>u4').reshape(-1)
+    chars = uint24.view(numpy.uint8).reshape(-1, 4)
+    if chars[:, 0].any():
+        raise ValueError("value %i exceeds 24 bits" %
+                         uint24[numpy.flatnonzero(chars[:, 0])[0]])
+    # Two hex digits for each of the three low-order bytes, highest first
+    nibbles = numpy.empty((len(uint24), 6), dtype=numpy.uint8)
+    nibbles[:, 0::2] = chars[:, 1:] >> 4
+    nibbles[:, 1::2] = chars[:, 1:] & 15
+    hexstrs = numpy.empty((len(uint24), len(prefix) + 6), dtype=numpy.uint8)
+    hexstrs[:, :len(prefix)] = numpy.frombuffer(prefix, dtype=numpy.uint8)
+    hexstrs[:, len(prefix):] = HEX_DIGITS[nibbles]
+    return hexstrs.view('S%i' % hexstrs.shape[1]).reshape(-1)
+
+def hex_to_rgb_array(hexstrs):
+    """ convert:
+         a sequence of hex strings '#RRGGBB'
+         to an (N, 3) array of uint8 values (r, g, b).
+    """
+    return uint24_to_rgb_array(hex_to_uint24_array(hexstrs))
+
+def hex_to_RGB_array(hexstrs):
+    """ convert:
+         a sequence of hex strings '#RRGGBB'
+         to an (N, 3) array of float 0.0-1.0 values (R, G, B).
+    """
+    return uint24_to_RGB_array(hex_to_uint24_array(hexstrs))
+
 
 
 
@@ -84,7 +200,7 @@ def main():
             uint24_to_hex(
                 hex_to_int(hexnum)))
         
-        if hx not in nc2t.keys():
+        if hx not in nc2t:
             print "storing %s in NamedColor2Type... " % hx
             nc2t.add_color(hx,
                 *hex_to_rgb(hexnum),
@@ -94,6 +210,11 @@ def main():
             print "%s has already been stored in the NamedColor2Type tag." % hx
         print ''
     print nc2t
+    
+    uint24 = hex_to_uint24_array(hexes)
+    print 'hex_to_uint24_array(hexes) = %s' % uint24
+    print 'uint24_to_rgb_array(...) = %s' % uint24_to_rgb_array(uint24).tolist()
+    print 'uint24_to_hex_array(...) = %s' % uint24_to_hex_array(uint24)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+colordb/nearest.py
+
+Nearest-color search in CIE Lab (D50) over colordb RGB colors
+and NamedColor2Type entries.
+"""
+
+import os
+
+import numpy
+
+from colorkit.icc import colormath
+
+# Average number of colors per grid cell if no cell size is given
+POINTS_PER_CELL = 8
+
+
+def uint24_to_Lab(uint24, rgb_space="sRGB"):
+    """ convert:
+         an array of unsigned 24-bit integers (0xRRGGBB)
+         to an array of Lab (D50) values.
+    """
+    uint24 = numpy.asarray(uint24, dtype=numpy.uint32)
+    space = colormath.RGBSpace.get(rgb_space)
+    # Linear values of the 256 channel values
+    lut = space.trc.decode_lut(8)
+    RGB = numpy.empty(uint24.shape + (3, ))
+    RGB[..., 0] = lut[(uint24 >> 16) & 255]
+    RGB[..., 1] = lut[(uint24 >> 8) & 255]
+    RGB[..., 2] = lut[uint24 & 255]
+    # Linear RGB -> XYZ (D50) as one matrix
+    XYZ = space.to_pcs("D50")(RGB)
+    return colormath.XYZ2Lab_array(XYZ * 100, "D50")
+
+
+class ColorIndex(object):
+    """
+    Nearest-color index over Lab values.
+
+    Colors are put into a uniform grid of cubic cells and stored sorted
+    by cell, with the offset of each cell in `starts`. Queries only look
+    at the cells around each query color. Distances are dE76; query()
+    can re-rank the nearest candidates under another dE method
+    (e.g. '2k' for dE2000).
+
+    `ids` holds an id per color (e.g. the colordb id, or the position
+    in a NamedColor2Type tag), `names` the color names if any. Query
+    results are positions in these arrays, -1 where there is no color.
+
+    An index can be saved to a directory of .npy files and loaded with
+    memory mapping, so processes can share it.
+    """
+
+    arrays = ('Lab', 'ids', 'starts', 'grid', 'names')
+
+    def __init__(self, Lab, ids=None, names=None, cell=None):
+        Lab = numpy.asarray(Lab, dtype=numpy.float32).reshape(-1, 3)
+        if ids is None:
+            ids = numpy.arange(len(Lab))
+        ids = numpy.asarray(ids)
+        if len(Lab):
+            origin = Lab.min(axis=0).astype(numpy.float64)
+            extent = Lab.max(axis=0) - origin
+        else:
+            origin = numpy.zeros(3)
+            extent = numpy.zeros(3)
+        if not cell:
+            volume = numpy.prod(numpy.maximum(extent, 1.0))
+            cell = (volume * POINTS_PER_CELL / max(len(Lab), 1)) ** (1 / 3.0)
+        self.origin = origin
+        self.cell = float(cell)
+        self.shape = tuple(int(n) + 1 for n in numpy.floor(extent / cell))
+        cells = self._cells(self._coords(Lab))
+        order = numpy.argsort(cells, kind='mergesort')
+        self.Lab = Lab[order]
+        self.ids = ids[order]
+        if names is not None:
+            names = numpy.asarray(names)[order]
+        self.names = names
+        self.starts = numpy.searchsorted(cells[order],
+                                         numpy.arange(numpy.prod(self.shape) + 1))
+
+    def __len__(self):
+        return len(self.Lab)
+
+    @classmethod
+    def from_uint24(cls, uint24, rgb_space="sRGB", cell=None):
+        """ Index colors given as unsigned 24-bit integers (0xRRGGBB). """
+        uint24 = numpy.asarray(uint24, dtype=numpy.uint32)
+        return cls(uint24_to_Lab(uint24, rgb_space), uint24, cell=cell)
+
+    @classmethod
+    def from_colordb(cls, queryset=None, rgb_space="sRGB", cell=None):
+        """ Index the colors of the colordb RGB table (or a queryset). """
+        if queryset is None:
+            from colordb.models import RGB
+            queryset = RGB.objects.all()
+        uint24 = numpy.fromiter(
+            queryset.values_list('id', flat=True).iterator(),
+            dtype=numpy.uint32)
+        return cls.from_uint24(uint24, rgb_space, cell)
+
+    @classmethod
+    def from_named_colors(cls, nc2, cell=None):
+        """ Index the colors of a NamedColor2Type tag. """
+        columns = nc2.columns
+        # Rows of the colors in the tag (later colors replace earlier ones
+        # with the same name)
+        rows = numpy.array(sorted(columns.index.itervalues()),
+                           dtype=numpy.int64)
+        pcs = columns.pcs[rows]
+        if nc2._pcsname != "Lab":
+            pcs = colormath.XYZ2Lab_array(pcs, "D50")
+        names = numpy.array(columns.names, dtype=unicode)[rows]
+        return cls(pcs, names=names, cell=cell)
+
+    def save(self, path):
+        """ Save the index as .npy files in directory path. """
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        for name in self.arrays:
+            array = getattr(self, name)
+            if array is not None:
+                numpy.save(os.path.join(path, name + '.npy'), array)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """ Load an index saved with save(), memory-mapped by default. """
+        index = cls.__new__(cls)
+        for name in cls.arrays:
+            filename = os.path.join(path, name + '.npy')
+            array = None
+            if os.path.isfile(filename):
+                array = numpy.load(filename, mmap_mode='r' if mmap else None)
+            setattr(index, name, array)
+        return index
+
+    def _get_grid(self):
+        return numpy.array(list(self.origin) + [self.cell] + list(self.shape))
+
+    def _set_grid(self, grid):
+        self.origin = numpy.array(grid[:3])
+        self.cell = float(grid[3])
+        self.shape = tuple(int(n) for n in grid[4:])
+
+    grid = property(_get_grid, _set_grid)
+
+    def _coords(self, Lab):
+        """ Grid cell coordinates of Lab values (clipped to the grid). """
+        coords = numpy.floor((Lab - self.origin) / self.cell)
+        return numpy.clip(coords, 0, numpy.array(self.shape) - 1).astype(
+            numpy.int64)
+
+    def _cells(self, coords):
+        """ Linear cell numbers of grid cell coordinates. """
+        return (coords[..., 0] * self.shape[1] +
+                coords[..., 1]) * self.shape[2] + coords[..., 2]
+
+    def _bounds(self, coords, radius):
+        """ First and last cell coordinates within radius of coords. """
+        return (numpy.maximum(coords - radius, 0),
+                numpy.minimum(coords + radius, numpy.array(self.shape) - 1))
+
+    def _clearance(self, Lab, lo, hi):
+        """
+        Distance of each Lab value to the nearest color that can be outside
+        the cells lo..hi (inf if these are all cells).
+
+        """
+        shape = numpy.array(self.shape)
+        lower = numpy.where(lo > 0, self.origin + lo * self.cell, -numpy.inf)
+        upper = numpy.where(hi < shape - 1, self.origin + (hi + 1) * self.cell,
+                            numpy.inf)
+        return numpy.minimum(Lab - lower, upper - Lab).min(axis=-1)
+
+    def _gather(self, coords, radius):
+        """ Positions of the colors in cells within radius of coords. """
+        lo, hi = self._bounds(coords, radius)
+        L, a = numpy.mgrid[lo[0]:hi[0] + 1, lo[1]:hi[1] + 1]
+        rows = (L.ravel() * self.shape[1] + a.ravel()) * self.shape[2]
+        starts = self.starts[rows + lo[2]]
+        ends = self.starts[rows + hi[2] + 1]
+        return numpy.concatenate([numpy.arange(start, end) for start, end in
+                                  zip(starts, ends) if end > start] or
+                                 [numpy.zeros(0, dtype=numpy.int64)])
+
+    def _groups(self, Lab):
+        """ Generate cell coordinates and the positions of Lab in the cell. """
+        coords = self._coords(Lab)
+        cells = self._cells(coords)
+        order = numpy.argsort(cells, kind='mergesort')
+        bounds = numpy.flatnonzero(numpy.diff(cells[order])) + 1
+        for group in numpy.split(order, bounds):
+            if len(group):
+                yield coords[group[0]], group
+
+    def _nearest(self, Lab, k):
+        """ dE76 distances and positions of the k nearest colors. """
+        distances = numpy.empty((len(Lab), k))
+        distances.fill(numpy.inf)
+        positions = -numpy.ones((len(Lab), k), dtype=numpy.int64)
+        if not len(self.Lab):
+            return distances, positions
+        for coords, group in self._groups(Lab):
+            radius = 0
+            while True:
+                candidates = self._gather(coords, radius)
+                clearance = self._clearance(Lab[group],
+                                            *self._bounds(coords, radius))
+                complete = numpy.isinf(clearance).all()
+                if len(candidates) >= k or complete:
+                    d = numpy.sqrt(((Lab[group][:, numpy.newaxis, :] -
+                                     self.Lab[candidates]) ** 2).sum(axis=-1))
+                    n = min(k, len(candidates))
+                    nearest = numpy.argsort(d, axis=1, kind='mergesort')[:, :n]
+                    d = d[numpy.arange(len(group))[:, numpy.newaxis], nearest]
+                    # Colors outside the searched cells are at least
+                    # clearance away
+                    if complete or (d[:, -1] <= clearance).all():
+                        distances[group, :n] = d
+                        positions[group, :n] = candidates[nearest]
+                        break
+                radius += 1
+        return distances, positions
+
+    def query(self, Lab, k=1, method="76", candidates=None):
+        """
+        Find the k nearest colors of each Lab value.
+
+        Lab can be a single value or an array with a trailing axis of 3.
+        If method is not dE76, the nearest `candidates` (default 4 * k)
+        colors under dE76 are re-ranked under method.
+
+        Return distances and positions, each of shape Lab.shape[:-1] + (k, ).
+
+        """
+        Lab = numpy.asarray(Lab, dtype=numpy.float64)
+        shape = Lab.shape[:-1]
+        Lab = Lab.reshape(-1, 3)
+        if colormath.get_delta_method(method) == "76":
+            distances, positions = self._nearest(Lab, k)
+        else:
+            distances, positions = self._nearest(Lab, max(candidates or 4 * k,
+                                                          k))
+            found = positions >= 0
+            distances = colormath.delta_batch(
+                Lab[:, numpy.newaxis, :],
+                self.Lab[numpy.where(found, positions, 0)].astype(
+                    numpy.float64),
+                method)["E"]
+            distances[~found] = numpy.inf
+            order = numpy.argsort(distances, axis=1, kind='mergesort')[:, :k]
+            rows = numpy.arange(len(Lab))[:, numpy.newaxis]
+            distances = distances[rows, order]
+            positions = positions[rows, order]
+        return (distances.reshape(shape + (k, )),
+                positions.reshape(shape + (k, )))
+
+    def query_radius(self, Lab, radius):
+        """
+        Find the colors within dE76 radius of each Lab value.
+
+        Return a list of (distances, positions) per Lab value, nearest first.
+
+        """
+        Lab = numpy.asarray(Lab, dtype=numpy.float64).reshape(-1, 3)
+        results = [None] * len(Lab)
+        empty = numpy.zeros(0), numpy.zeros(0, dtype=numpy.int64)
+        if not len(self.Lab):
+            return [empty] * len(Lab)
+        cells = int(numpy.ceil(radius / self.cell))
+        for coords, group in self._groups(Lab):
+            candidates = self._gather(coords, cells)
+            d = numpy.sqrt(((Lab[group][:, numpy.newaxis, :] -
+                             self.Lab[candidates]) ** 2).sum(axis=-1))
+            for i, row in zip(group, d):
+                within = numpy.flatnonzero(row <= radius)
+                within = within[numpy.argsort(row[within], kind='mergesort')]
+                results[i] = row[within], candidates[within]
+        return results
@@ -5,8 +5,25 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+import random
+import shutil
+import tempfile
+
+import numpy
+from django.core.exceptions import FieldError
+from django.db.models import Q
 from django.test import TestCase
 
+from colordb.colortype import ColorArray
+from colordb.management.commands.fill_rgb_table import Command, rgb_rows
+from colordb.models import PackedRGB, RGB
+from colordb.namedcolor import (hex_to_int, hex_to_rgb_array,
+                                hex_to_uint24_array, rgb_to_uint24_array,
+                                uint24_to_hex, uint24_to_hex_array,
+                                uint24_to_rgb, uint24_to_rgb_array)
+from colordb.nearest import ColorIndex
+from colorkit.icc import colormath
+
 
 class SimpleTest(TestCase):
     def test_basic_addition(self):
@@ -14,3 +31,302 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class PackedRGBQuerySetTest(TestCase):
+    """
+    Compares the translated channel filters to filtering the ids in Python.
+    """
+
+    def setUp(self):
+        rng = random.Random(16)
+        ids = set(rng.randrange(0x1000000) for i in xrange(2000))
+        # Channel edges
+        for r in (0, 5, 6, 255):
+            for g in (0, 5, 255):
+                for b in (0, 5, 255):
+                    ids.add(r << 16 | g << 8 | b)
+        self.ids = sorted(ids)
+        PackedRGB.objects.bulk_create([PackedRGB(id=id) for id in self.ids])
+
+    def assertIds(self, queryset, predicate):
+        self.assertEqual(
+            sorted(queryset.values_list('id', flat=True)),
+            [id for id in self.ids
+             if predicate(id >> 16 & 255, id >> 8 & 255, id & 255, id)])
+
+    def test_filter(self):
+        objects = PackedRGB.objects
+        for i, channel in enumerate('rgb'):
+            get = lambda *values: values[i]
+            self.assertIds(objects.filter(**{channel: 5}),
+                           lambda *v: get(*v) == 5)
+            self.assertIds(objects.filter(**{channel + '__gt': 5}),
+                           lambda *v: get(*v) > 5)
+            self.assertIds(objects.filter(**{channel + '__gte': 5}),
+                           lambda *v: get(*v) >= 5)
+            self.assertIds(objects.filter(**{channel + '__lt': 5}),
+                           lambda *v: get(*v) < 5)
+            self.assertIds(objects.filter(**{channel + '__lte': 5}),
+                           lambda *v: get(*v) <= 5)
+            self.assertIds(objects.filter(**{channel + '__range': (5, 100)}),
+                           lambda *v: 5 <= get(*v) <= 100)
+            self.assertIds(objects.filter(**{channel + '__in': [0, 5, 255]}),
+                           lambda *v: get(*v) in (0, 5, 255))
+            self.assertIds(objects.filter(**{channel + '__in': []}),
+                           lambda *v: False)
+
+    def test_filter_combined(self):
+        self.assertIds(PackedRGB.objects.filter(r__gte=5, g__lt=100,
+                                                b__range=(0, 5)),
+                       lambda r, g, b, id: r >= 5 and g < 100 and b <= 5)
+        self.assertIds(PackedRGB.objects.filter(r=5, id__gt=0x050500),
+                       lambda r, g, b, id: r == 5 and id > 0x050500)
+        self.assertIds(PackedRGB.objects.filter(r__lt=128).filter(g=255),
+                       lambda r, g, b, id: r < 128 and g == 255)
+
+    def test_exclude(self):
+        self.assertIds(PackedRGB.objects.exclude(g=5),
+                       lambda r, g, b, id: g != 5)
+        self.assertIds(PackedRGB.objects.exclude(r=5, b__gt=100),
+                       lambda r, g, b, id: not (r == 5 and b > 100))
+        self.assertIds(PackedRGB.objects.filter(b=0).exclude(r__in=[0, 6]),
+                       lambda r, g, b, id: b == 0 and r not in (0, 6))
+
+    def test_exclude_mixed(self):
+        # exclude(a, b) means NOT (a AND b) for channel and other filters
+        self.assertIds(PackedRGB.objects.exclude(r=5, id__gt=0x050500),
+                       lambda r, g, b, id: not (r == 5 and id > 0x050500))
+        self.assertIds(PackedRGB.objects.exclude(Q(id__lt=0x800000), g=255),
+                       lambda r, g, b, id: not (id < 0x800000 and g == 255))
+        self.assertIds(PackedRGB.objects.filter(b__lte=5).exclude(
+            r__gte=6, id__lt=0x800000),
+                       lambda r, g, b, id: b <= 5 and
+                                           not (r >= 6 and id < 0x800000))
+
+    def test_unsupported_lookup(self):
+        self.assertRaises(FieldError, PackedRGB.objects.filter, r__startswith=1)
+
+
+class FillRGBTableTest(TestCase):
+    """
+    Checks the rows bulk stored by fill_rgb_table against RGB.save().
+    """
+
+    def test_rgb_rows(self):
+        start, stop = 0xFEFF00, 0xFF0100
+        rows = rgb_rows(start, stop)
+        self.assertEqual(rows['id'].tolist(), range(start, stop))
+        self.assertEqual(zip(rows['_r'].tolist(), rows['_g'].tolist(),
+                             rows['_b'].tolist()),
+                         [uint24_to_rgb(id) for id in xrange(start, stop)])
+
+    def test_create_rows(self):
+        # Includes channel values of 255, which the old loops left out
+        start, stop = 0xFFFE00, 0x1000000
+        Command().create_rows(RGB, 'default', start, stop)
+        self.assertEqual(RGB.objects.count(), stop - start)
+        for color in RGB.objects.filter(id__in=[start, 0xFFFEFF, 0xFFFFFF]):
+            self.assertEqual((color._r, color._g, color._b),
+                             uint24_to_rgb(color.id))
+        RGB(id=0x123456).save()
+        saved = RGB.objects.get(id=0x123456)
+        self.assertEqual((saved._r, saved._g, saved._b),
+                         tuple(rgb_rows(0x123456, 0x123457)[channel][0]
+                               for channel in ('_r', '_g', '_b')))
+
+    def test_create_packed_rows(self):
+        Command().create_rows(PackedRGB, 'default', 0, 1000)
+        self.assertEqual(sorted(PackedRGB.objects.values_list('id', flat=True)),
+                         range(1000))
+
+
+class ColorIndexTest(TestCase):
+    """
+    Compares ColorIndex queries to a brute force search.
+    """
+
+    def setUp(self):
+        rng = numpy.random.RandomState(17)
+        self.Lab = rng.uniform((0, -100, -100), (100, 100, 100), (2000, 3))
+        # Including values outside the indexed range
+        self.queries = rng.uniform((-10, -120, -120), (110, 120, 120),
+                                   (300, 3))
+        self.index = ColorIndex(self.Lab)
+
+    def brute_force(self, index, Lab):
+        return numpy.sqrt(((Lab[:, numpy.newaxis, :] -
+                            index.Lab.astype(numpy.float64)) ** 2).sum(axis=-1))
+
+    def assertNearest(self, index, k):
+        distances, positions = index.query(self.queries, k)
+        expected = numpy.sort(self.brute_force(index, self.queries),
+                              axis=1)[:, :k]
+        numpy.testing.assert_allclose(distances, expected)
+        # The positions are those of the colors at these distances
+        numpy.testing.assert_allclose(
+            numpy.sqrt(((self.queries[:, numpy.newaxis, :] -
+                         index.Lab[positions]) ** 2).sum(axis=-1)),
+            distances, rtol=1e-6)
+        # ids are the positions of the colors as given
+        numpy.testing.assert_allclose(self.Lab[index.ids[positions]],
+                                      index.Lab[positions], rtol=1e-6)
+
+    def test_query(self):
+        for k in (1, 5):
+            self.assertNearest(self.index, k)
+        distances, positions = self.index.query(self.queries[0])
+        self.assertEqual(distances.shape, (1, ))
+        self.assertEqual(positions.shape, (1, ))
+        for cell in (1.0, 500.0):
+            self.assertNearest(ColorIndex(self.Lab, cell=cell), 3)
+
+    def test_query_delta_method(self):
+        # All colors as candidates is a brute force search under dE2000
+        distances, positions = self.index.query(self.queries[:50], 2, '2k',
+                                                len(self.Lab))
+        expected = numpy.sort(colormath.delta_batch(
+            self.queries[:50, numpy.newaxis, :],
+            self.index.Lab.astype(numpy.float64), '2k')['E'], axis=1)[:, :2]
+        numpy.testing.assert_allclose(distances, expected)
+
+    def test_query_radius(self):
+        d = self.brute_force(self.index, self.queries)
+        for radius in (0, 5, 20.5):
+            results = self.index.query_radius(self.queries, radius)
+            self.assertEqual(len(results), len(self.queries))
+            for row, (distances, positions) in zip(d, results):
+                self.assertEqual(sorted(positions.tolist()),
+                                 numpy.flatnonzero(row <= radius).tolist())
+                self.assertEqual(distances.tolist(), sorted(row[positions]))
+
+    def test_save_load(self):
+        path = tempfile.mkdtemp()
+        try:
+            self.index.save(path)
+            index = ColorIndex.load(path)
+            self.assertTrue(isinstance(index.Lab, numpy.memmap))
+            self.assertEqual(index.grid.tolist(), self.index.grid.tolist())
+            self.assertEqual(len(index), len(self.index))
+            self.assertEqual(index.names, None)
+            for k in (1, 4):
+                for result, expected in zip(index.query(self.queries, k),
+                                            self.index.query(self.queries, k)):
+                    self.assertEqual(result.tolist(), expected.tolist())
+            del index
+        finally:
+            shutil.rmtree(path)
+
+    def test_empty(self):
+        index = ColorIndex(numpy.zeros((0, 3)))
+        self.assertEqual(len(index), 0)
+        distances, positions = index.query(self.queries[:3], 2)
+        self.assertTrue(numpy.isinf(distances).all())
+        self.assertEqual(positions.tolist(), [[-1, -1]] * 3)
+        self.assertEqual([len(result[1]) for result in
+                          index.query_radius(self.queries[:3], 10)],
+                         [0, 0, 0])
+        # Fewer colors than k
+        index = ColorIndex(self.Lab[:2])
+        distances, positions = index.query(self.queries[:3], 3)
+        self.assertEqual(positions[:, 2].tolist(), [-1, -1, -1])
+        self.assertTrue(numpy.isinf(distances[:, 2]).all())
+        self.assertEqual(sorted(positions[0, :2].tolist()), [0, 1])
+
+
+class ColorArrayTest(TestCase):
+    """
+    Compares the whole-array ColorArray operations to those of the
+    single colors.
+    """
+
+    def colors(self, dtype):
+        rng = numpy.random.RandomState(18)
+        if numpy.dtype(dtype).kind in 'iu':
+            info = numpy.iinfo(dtype)
+            low, high = info.min, info.max
+        else:
+            low, high = -1000, 1000
+        values = rng.randint(low, high + 1, (500, 3)).tolist()
+        # Duplicates and channel extremes
+        values += values[:50] + [[low] * 3, [high] * 3, [0, 0, 0],
+                                 [high, 0, low]]
+        if numpy.dtype(dtype).kind == 'f':
+            values += [[0.5, 0.25, 0.125]] * 2
+        return ColorArray('RGB', values, dtype)
+
+    def test_hashes(self):
+        for dtype in ('uint8', 'uint16', 'int16', 'float32'):
+            colors = self.colors(dtype)
+            self.assertEqual(colors.hashes().tolist(),
+                             [hash(color) for color in colors])
+
+    def test_hex(self):
+        for dtype in ('uint8', 'uint16', 'int16'):
+            colors = self.colors(dtype)
+            self.assertEqual(colors.hex().tolist(),
+                             [str(color) for color in colors])
+            self.assertEqual(colors.hex('0x').tolist(),
+                             [hex(color) for color in colors])
+        colors = ColorArray('RGB', [[0, 0, 0], [255, 255, 255], [1, 2, 3]])
+        self.assertEqual(colors.hex().tolist(),
+                         ['#000000', '#FFFFFF', '#030201'])
+        self.assertEqual(ColorArray('RGB').hex().tolist(), [])
+
+    def test_unique(self):
+        for dtype in ('uint8', 'uint16', 'int16', 'float32'):
+            colors = self.colors(dtype)
+            unique, inverse = colors.unique(True)
+            self.assertEqual(len(unique), len(set(colors)))
+            self.assertEqual(set(unique), set(colors))
+            self.assertEqual([unique[i] for i in inverse], list(colors))
+            if dtype != 'float32':
+                self.assertEqual([color.packed for color in unique],
+                                 sorted(color.packed for color in set(colors)))
+                self.assertEqual(colors.packed().tolist(),
+                                 [color.packed for color in colors])
+            self.assertEqual(list(colors.unique()), list(unique))
+
+
+class HexCodecTest(TestCase):
+    """
+    Compares the hex/uint24 array codecs to the single value functions.
+    """
+
+    def setUp(self):
+        rng = numpy.random.RandomState(19)
+        self.uint24 = numpy.concatenate([[0x000000, 0xFFFFFF, 0x0000FF,
+                                          0xFF0000, 0x010203],
+                                         rng.randint(0, 0x1000000, 500)])
+
+    def test_round_trip(self):
+        hexstrs = uint24_to_hex_array(self.uint24)
+        self.assertEqual(hexstrs.tolist(),
+                         [uint24_to_hex(value) for value in self.uint24])
+        self.assertEqual(hexstrs[:2].tolist(), ['#000000', '#FFFFFF'])
+        self.assertEqual(hex_to_uint24_array(hexstrs).tolist(),
+                         self.uint24.tolist())
+        self.assertEqual(uint24_to_hex_array([0xABCDEF], '0x').tolist(),
+                         ['0xABCDEF'])
+        rgb = uint24_to_rgb_array(self.uint24)
+        self.assertEqual(map(tuple, rgb.tolist()),
+                         [uint24_to_rgb(value) for value in self.uint24])
+        self.assertEqual(rgb_to_uint24_array(rgb).tolist(),
+                         self.uint24.tolist())
+        self.assertEqual(hex_to_rgb_array(hexstrs).tolist(), rgb.tolist())
+        self.assertEqual(uint24_to_hex_array([]).tolist(), [])
+        self.assertEqual(hex_to_uint24_array([]).tolist(), [])
+
+    def test_hex_variants(self):
+        # Short, lowercase, prefixed and padded strings, like hex_to_int
+        hexstrs = ['FFF', 'f', '#abc', '0x00ff00', '0XFFFFFF', ' #123456 ',
+                   '000000', '#0', 'ffffffff']
+        self.assertEqual(hex_to_uint24_array(hexstrs).tolist(),
+                         [hex_to_int(hexstr) for hexstr in hexstrs])
+
+    def test_invalid(self):
+        for hexstr in ('', '#', '0x', 'GG0000', '#12 34', '123456789',
+                       '#-12345', '0x0x12'):
+            self.assertRaises(ValueError, hex_to_uint24_array,
+                              ['#FFFFFF', hexstr])
+        self.assertRaises(ValueError, uint24_to_hex_array, [0x1000000])
@@ -7,6 +7,10 @@ Copyright (C) 2008 Florian Hoech
 """
 
 import os, re, sys
+from copy import deepcopy
+from itertools import izip
+
+import numpy
 
 import colormath
 
@@ -14,6 +18,17 @@ from safe_print import safe_print
 from util_io import StringIOu as StringIO
 
 
+control_chars = re.compile('[^\x09\x0A\x20-\x7E\x80-\xFF]')
+# The same as chars to delete with str.translate (faster)
+control_chars_str = ''.join(chr(i) for i in range(256) if
+							control_chars.match(chr(i)))
+digits = re.compile('\d+$')
+number = re.compile('(?:\d+|((?:\d*\.\d+|\d+)(?:e[+-]?\d+)?))$')
+
+# Placeholder for DATA samples not yet created from the DATA columns
+unset = object()
+
+
 def rpad(value, width):
 	"""
 	Right-pad a value to a given width.
@@ -31,6 +46,33 @@ def rpad(value, width):
 	return strval
 
 
+def rpad_values(values, width):
+	"""
+	Right-pad values to a given width (negative values to width + 1).
+	
+	Return a list of strings, the same as rpad for each value.
+	
+	"""
+	if values and set(map(type, values)) == set([float]):
+		# Numeric DATA values repeat a lot, so format each distinct value
+		# of the column once. Values are told apart by bit pattern, which
+		# keeps 0.0 and -0.0 apart.
+		array = numpy.array(values, numpy.float64)
+		bits, index, inverse = numpy.unique(array.view(numpy.int64),
+											return_index=True,
+											return_inverse=True)
+		strvals = numpy.array([rpad(value, width + (1 if value < 0 else 0))
+							   for value in array[index].tolist()], object)
+		return strvals[inverse].tolist()
+	result = []
+	for value in values:
+		if type(value) in (int, long):
+			result.append(str(value))
+		else:
+			result.append(rpad(value, width + (1 if value < 0 else 0)))
+	return result
+
+
 def rcut(value, width):
 	"""
 	Cut off any chars beyond width on the right-hand side.
@@ -48,6 +90,45 @@ def rcut(value, width):
 	return strval
 
 
+def tokenize(lines):
+	"""
+	Split lines of DATA into lists of values.
+	
+	Control chars, comments and quotes are stripped, and empty lines are
+	skipped, like the parser does for single lines.
+	
+	"""
+	text = '\n'.join(lines)
+	if isinstance(text, str):
+		text = text.translate(None, control_chars_str)
+	else:
+		text = control_chars.sub('', text)
+	lines = text.split('\n')
+	if '#' in text:
+		lines = [line.split('#', 1)[0] for line in lines]
+	rows = filter(None, [line.split() for line in lines])
+	if '"' in text:
+		rows = [[value.strip('"') for value in values] for values in rows]
+	return rows
+
+
+def columns2array(dtype, columns, size):
+	"""
+	Return a structured NumPy array of the given dtype and size, filled from
+	a list of columns (one sequence of values per field).
+	
+	"""
+	array = numpy.empty(size, dtype)
+	for (name, kind), column in izip(dtype, columns):
+		if kind == 'O':
+			# Keep the values as they are
+			values = numpy.empty(size, object)
+			values[:] = column
+			column = values
+		array[name] = column
+	return array
+
+
 class CGATSError(Exception):
 	pass
 
@@ -90,9 +171,16 @@ class CGATS(dict):
 	parent = None
 	root = None
 	type = 'ROOT'
-	vmaxlen = 0
+	_columns = None
+	_fields = None
+	_index = None
+	_revision = 0
+	_shared_columns = False
+	_vmaxlen = 0
+	_vmaxlen_fields = ()
 	
-	def __init__(self, cgats=None, normalize_fields=False, file_identifier="CTI3"):
+	def __init__(self, cgats=None, normalize_fields=False, file_identifier="CTI3",
+				 columnar=True):
 		"""
 		Return a CGATS instance.
 		
@@ -104,6 +192,9 @@ class CGATS(dict):
 		
 		file_identifier is used as fallback if no file identifier is present
 		
+		If columnar evaluates to True, DATA sections are stored as columns
+		(see get_columns) and the samples are only created when accessed
+		
 		"""
 		
 		self.normalize_fields = normalize_fields
@@ -130,20 +221,31 @@ class CGATS(dict):
 				if self.filename not in ('', None):
 					self.mtime = os.stat(self.filename).st_mtime
 				cgats.seek(0)
-				raw_lines = cgats.readlines()
+				raw_lines = cgats.read().split('\n')
+				if not raw_lines[-1]:
+					raw_lines.pop()
 				cgats.close()
 
 			context = self
+			data_lines = []
 
 			for raw_line in raw_lines:
+				if context.type == 'DATA':
+					# DATA lines are tokenized and added in one go
+					line = raw_line.strip()
+					if 'BEGIN_' not in line and 'END_' not in line:
+						data_lines.append(line)
+						continue
 				# strip control chars and leading/trailing whitespace
-				line = re.sub('[^\x09\x20-\x7E\x80-\xFF]', '', 
-								raw_line.strip())
+				line = control_chars.sub('', raw_line.strip())
 				comment_offset = line.find('#')
 				if comment_offset >= 0: # strip comment
 					line = line[:comment_offset].strip()
 				##print line
 				values = [value.strip('"') for value in line.split()]
+				if data_lines and (line[:6] == 'BEGIN_' or line[:4] == 'END_'):
+					context.add_rows(tokenize(data_lines), columnar)
+					data_lines = []
 				if line[:6] == 'BEGIN_':
 					key = line[6:]
 					if key in context:
@@ -183,7 +285,10 @@ class CGATS(dict):
 					context = context[key]
 				elif line[:4] == 'END_':
 					context = context.parent
-				elif context.type in ('DATA_FORMAT', 'DATA'):
+				elif context.type == 'DATA':
+					if len(values):
+						data_lines.append(line)
+				elif context.type == 'DATA_FORMAT':
 					if len(values):
 						context = context.add_data(values)
 				elif context.type == 'SECTION':
@@ -204,6 +309,8 @@ class CGATS(dict):
 				elif line and values[0] not in ('Comment:', 'Date:') and \
 				     len(line) >= 3 and not re.search("[^ 0-9A-Za-z]", line):
 					context = self.add_data(line)
+			if data_lines:
+				context.add_rows(tokenize(data_lines), columnar)
 			self.setmodified(False)
 
 	def __delattr__(self, name):
@@ -211,8 +318,27 @@ class CGATS(dict):
 		self.setmodified()
 	
 	def __delitem__(self, name):
+		self.materialize(True)
 		dict.__delitem__(self, name)
 		self.setmodified()
+	
+	def __copy__(self):
+		return self.copy()
+	
+	def __deepcopy__(self, memo):
+		return self.copy(False, memo)
+	
+	def __eq__(self, other):
+		for item in (self, other):
+			if isinstance(item, CGATS):
+				item.materialize()
+		return dict.__eq__(self, other)
+	
+	def __ne__(self, other):
+		result = self.__eq__(other)
+		if result is NotImplemented:
+			return result
+		return not result
 
 	def __getattr__(self, name):
 		if name == 'modified':
@@ -244,11 +370,92 @@ class CGATS(dict):
 	
 	def get(self, name, default=None):
 		if name == -1:
-			return dict.get(self, len(self) - 1, default)
+			name = len(self) - 1
 		elif name in ('NUMBER_OF_FIELDS', 'NUMBER_OF_SETS'):
 			return getattr(self, name, default)
-		else:
-			return dict.get(self, name, default)
+		value = dict.get(self, name, default)
+		if value is unset:
+			value = self.get_row(name)
+		return value
+	
+	def clear(self):
+		self.materialize(True)
+		dict.clear(self)
+	
+	def items(self):
+		self.materialize()
+		return dict.items(self)
+	
+	def iteritems(self):
+		self.materialize()
+		return dict.iteritems(self)
+	
+	def itervalues(self):
+		self.materialize()
+		return dict.itervalues(self)
+	
+	def popitem(self):
+		self.materialize(True)
+		return dict.popitem(self)
+	
+	def setdefault(self, name, default=None):
+		self.materialize(True)
+		return dict.setdefault(self, name, default)
+	
+	def update(self, *args, **kwargs):
+		self.materialize(True)
+		dict.update(self, *args, **kwargs)
+	
+	def values(self):
+		self.materialize()
+		return dict.values(self)
+	
+	def copy(self, share_columns=True, memo=None):
+		"""
+		Return a copy of the CGATS structure without re-parsing it.
+		
+		parent and root links within the structure point to the copied
+		objects, vmaxlen and 'modified' state are preserved. When copying
+		a part of a structure, the copy becomes its own root.
+		
+		If share_columns evaluates to True, DATA sections stored as columns
+		share them with the copy until either side changes them.
+		
+		"""
+		if memo is None:
+			memo = {}
+		clone = dict.__new__(CGATS)
+		memo[id(self)] = clone
+		clone.__dict__.update(self.__dict__)
+		clone.__dict__.pop('_index', None)
+		parent = memo.get(id(self.parent))
+		if parent is not None:
+			object.__setattr__(clone, 'parent', parent)
+		root = memo.get(id(self.root))
+		if root is None:
+			if parent is not None:
+				root = parent.root
+			else:
+				# Copy of (a part of) a structure
+				root = clone
+				if self.root is not None:
+					object.__setattr__(clone, 'modified', self.root.modified)
+		object.__setattr__(clone, 'root', root)
+		if self._columns is not None:
+			if share_columns:
+				object.__setattr__(self, '_shared_columns', True)
+				object.__setattr__(clone, '_shared_columns', True)
+			else:
+				object.__setattr__(clone, '_columns', self._columns.copy())
+			object.__setattr__(clone, '_fields', list(self._fields))
+		for key, value in dict.iteritems(self):
+			if type(value) == CGATS:
+				value = value.copy(share_columns, memo)
+			elif (value is not unset and 
+				  not isinstance(value, (basestring, int, long, float))):
+				value = deepcopy(value, memo)
+			dict.__setitem__(clone, key, value)
+		return clone
 	
 	def get_colorants(self):
 		color_rep = (self.queryv1("COLOR_REP") or "").split("_")
@@ -287,37 +494,56 @@ class CGATS(dict):
 			self[name] = value
 	
 	def __setitem__(self, name, value):
+		self.materialize(True)
 		dict.__setitem__(self, name, value)
 		self.setmodified()
 	
 	def setmodified(self, modified=True):
 		""" Set 'modified' state on the 'root' object. """
+		if self.root is not None:
+			# Invalidates query indexes
+			object.__setattr__(self.root, '_revision', 
+							   self.root._revision + 1)
 		if self.root and self.root.modified != modified:
 			object.__setattr__(self.root, 'modified', modified)
 	
 	def __str__(self):
-		result = []
+		return '\n'.join(self.iterlines())
+	
+	def iterlines(self, chunksize=1000):
+		"""
+		Generate the CGATS text line by line.
+		
+		DATA lines are generated in blocks of up to chunksize lines.
+		Joined by newlines, the result is the same as str(self).
+		
+		"""
 		data = None
 		if self.type == 'SAMPLE':
-			result += [' '.join([str(self[item]) for item in 
-						self.parent.parent['DATA_FORMAT'].values()])]
+			yield ' '.join([str(self[item]) for item in 
+							self.parent.parent['DATA_FORMAT'].values()])
 		elif self.type == 'DATA':
 			data = self
 		elif self.type == 'DATA_FORMAT':
-			result += [' '.join(self.values())]
+			yield ' '.join(self.values())
 		else:
+			# The last line so far (any line if it is the end of a section)
+			last = None
 			if self.datetime:
-				result += [self.datetime]
+				yield self.datetime
+				last = self.datetime
 			if self.type == 'SECTION':
-				result += ['BEGIN_' + self.key]
+				last = 'BEGIN_' + self.key
+				yield last
 			elif self.parent and self.parent.type == 'ROOT':
-				result += [self.type.ljust(7)]	# Make sure CGATS file 
-												# identifiers are always 
-												# a minimum of 7 characters
-				result += ['']
+				yield self.type.ljust(7)    # Make sure CGATS file 
+											# identifiers are always 
+											# a minimum of 7 characters
+				yield ''
+				last = ''
 			# elif self.type == 'FILE':
-				# result += [self.key]
-				# result += ['']
+				# yield self.key
+				# yield ''
 			for key in self:
 				value = self[key]
 				if key == 'DATA':
@@ -325,46 +551,300 @@ class CGATS(dict):
 				elif type(value) in (float, int, str, unicode):
 					if key not in ('NUMBER_OF_FIELDS', 'NUMBER_OF_SETS'):
 						if type(key) == int:
-							result += [str(value)]
+							last = str(value)
 						else:
 							if 'KEYWORDS' in self and \
 								key in self['KEYWORDS'].values():
-								result += ['KEYWORD "%s"' % key]
-								result += ['%s "%s"' % (key, value)]
+								yield 'KEYWORD "%s"' % key
+								last = '%s "%s"' % (key, value)
 							elif type(value) in (int, float):
-								result += ['%s %s' % (key, value)]
+								last = '%s %s' % (key, value)
 							else:
-								result += ['%s "%s"' % (key, value)]
+								last = '%s "%s"' % (key, value)
+						yield last
 				elif key not in ('DATA_FORMAT', 'KEYWORDS'):
-					if (value.type == 'SECTION' and result[-1:] and 
-						result[-1:][0][-1] != '\n'):
-						result += ['']
-					result += [str(value)]
+					if (value.type == 'SECTION' and last is not None and 
+						last[-1:] != '\n'):
+						yield ''
+						last = ''
+					lines = 0
+					for line in value.iterlines(chunksize):
+						yield line
+						lines += 1
+						if lines > 1 and not line:
+							last = '\n'
+						else:
+							last = line
+					if not lines:
+						yield ''
+						last = ''
 			if self.type == 'SECTION':
-				result += ['END_' + self.key]
+				yield 'END_' + self.key
 			if self.type == 'SECTION' or data:
-				result += ['']
+				yield ''
 		if data and data.parent['DATA_FORMAT']:
+			fields = data.parent['DATA_FORMAT'].values()
 			if 'KEYWORDS' in data.parent:
-				for item in data.parent['DATA_FORMAT'].values():
+				for item in fields:
 					if item in data.parent['KEYWORDS'].values():
-						result += ['KEYWORD "%s"' % item]
-			result += ['NUMBER_OF_FIELDS %s' % len(data.parent['DATA_FORMAT'])]
-			result += ['BEGIN_DATA_FORMAT']
-			result += [' '.join(data.parent['DATA_FORMAT'].values())]
-			result += ['END_DATA_FORMAT']
-			result += ['']
-			result += ['NUMBER_OF_SETS %s' % (len(data))]
-			result += ['BEGIN_DATA']
-			for key in data:
-				result += [' '.join([rpad(data[key][item], 
-										  data.vmaxlen + 
-										  (1 if data[key][item] < 0 else 0)) 
-									 for item in 
-									 data.parent['DATA_FORMAT'].values()])]
-			result += ['END_DATA']
-		return '\n'.join(result)
+						yield 'KEYWORD "%s"' % item
+			yield 'NUMBER_OF_FIELDS %s' % len(data.parent['DATA_FORMAT'])
+			yield 'BEGIN_DATA_FORMAT'
+			yield ' '.join(fields)
+			yield 'END_DATA_FORMAT'
+			yield ''
+			yield 'NUMBER_OF_SETS %s' % (len(data))
+			yield 'BEGIN_DATA'
+			keys = list(data)
+			vmaxlen = data.vmaxlen
+			for i in xrange(0, len(keys), chunksize):
+				# Only one chunk of rows is formatted at a time
+				chunk = keys[i:i + chunksize]
+				columns = [rpad_values(data.get_values(item, chunk), vmaxlen)
+						   for item in fields]
+				yield '\n'.join([' '.join(values) for values in 
+								 izip(*columns)])
+			yield 'END_DATA'
 
+	def add_rows(self, rows, columnar=True):
+		"""
+		Add DATA rows, each a list of values.
+		
+		If columnar evaluates to True and the DATA section is empty, the
+		rows are stored as columns if possible (see get_columns). Otherwise,
+		each row is added with add_data.
+		
+		"""
+		if not columnar or not self.add_columns(rows):
+			for values in rows:
+				self.add_data(values)
+	
+	def add_columns(self, rows):
+		"""
+		Store DATA rows (lists of string values) as columns.
+		
+		The values are converted like add_data does. Return False without
+		changing anything if the DATA section is not empty or add_data
+		would not accept all of the rows.
+		
+		"""
+		if self.type != 'DATA' or len(self):
+			return False
+		data_format = dict.get(self.parent, 'DATA_FORMAT')
+		if not data_format:
+			return False
+		items = data_format.values()
+		if set(map(len, rows)) != set([len(items)]):
+			return False
+		fields = []
+		dtype = []
+		columns = []
+		numeric = []
+		for item, column in izip(items, izip(*rows)):
+			upper = item.upper()
+			if upper in ('INDEX', 'SAMPLE_ID', 'SAMPLEID'):
+				if self.root.normalize_fields and upper == 'SAMPLEID':
+					item = 'SAMPLE_ID'
+				if all(column) and digits.match(''.join(column)):
+					column = map(int, column)
+					kind = 'i8' if max(column) < 2 ** 63 else 'O'
+				else:
+					# allow alphanumeric INDEX / SAMPLE_ID
+					column = list(column)
+					for i, value in enumerate(column):
+						match = number.match(value)
+						if match:
+							if match.groups()[0]:
+								column[i] = float(value)
+							else:
+								column[i] = int(value)
+					kind = 'O'
+			elif upper not in ('SAMPLE_NAME', 'SAMPLE_LOC', 'SAMPLENAME'):
+				try:
+					column = map(float, column)
+				except ValueError:
+					return False
+				kind = 'f8'
+				numeric.append(item)
+			else:
+				if self.root.normalize_fields and upper == 'SAMPLENAME':
+					item = 'SAMPLE_NAME'
+				kind = 'O'
+			fields.append(item)
+			columns.append(column)
+			try:
+				dtype.append((str(item), kind))
+			except UnicodeError:
+				return False
+		if len(set(fields)) != len(fields):
+			return False
+		array = columns2array(dtype, columns, len(rows))
+		dict.update(self, dict.fromkeys(xrange(len(rows)), unset))
+		object.__setattr__(self, '_columns', array)
+		object.__setattr__(self, '_fields', fields)
+		# vmaxlen is determined when needed
+		object.__setattr__(self, '_vmaxlen_fields', numeric)
+		self.setmodified()
+		return True
+	
+	def get_row(self, key):
+		""" Create the DATA sample at key from the DATA columns. """
+		row = CGATS()
+		dict.update(row, izip(self._fields, self._columns[key].item()))
+		for name, value in (('key', key), ('parent', self), 
+							('root', self.root), ('type', 'SAMPLE')):
+			object.__setattr__(row, name, value)
+		dict.__setitem__(self, key, row)
+		return row
+	
+	def materialize(self, drop_columns=False):
+		"""
+		Create all DATA samples not yet created from the DATA columns.
+		
+		If drop_columns evaluates to True, the samples take the place of
+		the columns for good (used before the DATA section is changed).
+		
+		"""
+		if self._columns is None:
+			return
+		for key, row in dict.items(self):
+			if row is unset:
+				self.get_row(key)
+		if drop_columns:
+			self.vmaxlen
+			object.__setattr__(self, '_columns', None)
+			object.__setattr__(self, '_fields', None)
+	
+	def get_values(self, field, keys=None):
+		"""
+		Return the values of a DATA field as returned by sample[field].
+		
+		keys is a list of sample keys (default: all samples, sorted).
+		
+		"""
+		if self.type != 'DATA':
+			return self['DATA'].get_values(field, keys)
+		if keys is None:
+			keys = sorted(dict.keys(self))
+		column = None
+		upper = str(field).upper()
+		if self._columns is not None and field in self._fields:
+			# Only convert the values of the samples not yet created
+			pending = [key for key in keys if dict.get(self, key) is unset]
+			values = self._columns[str(field)][pending].tolist()
+			if (len(pending) == len(keys) and
+				upper not in ('INDEX', 'SAMPLE_ID', 'SAMPLEID')):
+				return values
+			column = dict(izip(pending, values))
+		values = []
+		for key in keys:
+			row = dict.get(self, key)
+			if row is unset:
+				if column is None:
+					row = self.get_row(key)
+				else:
+					value = column[key]
+					if (upper in ('INDEX', 'SAMPLE_ID', 'SAMPLEID') and 
+						type(value) in (int, float)):
+						# Like __getitem__ (samples have no DATA, so
+						# their NUMBER_OF_SETS is 0)
+						if upper == 'INDEX':
+							value = key
+						elif type(value) == float:
+							value = 1.0 / (0 - 1) * key
+						else:
+							value = key + 1
+					values.append(value)
+					continue
+			values.append(row[field])
+		return values
+	
+	def get_columns(self):
+		"""
+		Return DATA as a structured NumPy array (one field per DATA_FORMAT
+		field, one element per sample).
+		
+		Numeric fields are float64. INDEX and SAMPLE_ID are int64 if all of
+		them are integers, other fields are of object type. Changes to the
+		array do not change the DATA section, use set_columns for that.
+		
+		"""
+		if self.type != 'DATA':
+			return self['DATA'].get_columns()
+		if self._columns is not None:
+			if dict.values(self).count(unset) == len(self):
+				# No samples created yet
+				columns = self._columns.view()
+				columns.flags.writeable = False
+				return columns
+			fields = self._fields
+		else:
+			fields = []
+			for item in self.parent['DATA_FORMAT'].values():
+				if self.root.normalize_fields:
+					item = {'SAMPLEID': 'SAMPLE_ID',
+							'SAMPLENAME': 'SAMPLE_NAME'}.get(item.upper(),
+															 item)
+				fields.append(item)
+		rows = []
+		for key in sorted(dict.keys(self)):
+			row = dict.get(self, key)
+			if row is unset:
+				rows.append(self._columns[key].item())
+			else:
+				rows.append(tuple(dict.get(row, field) for field in fields))
+		dtype = []
+		columns = []
+		for i, field in enumerate(fields):
+			column = [values[i] for values in rows]
+			types = set(map(type, column))
+			if types and types <= set([int, long]):
+				kind = 'i8' if max(column) < 2 ** 63 else 'O'
+			elif types and types <= set([int, long, float]):
+				kind = 'f8'
+			else:
+				kind = 'O'
+			dtype.append((str(field), kind))
+			columns.append(column)
+		return columns2array(dtype, columns, len(rows))
+	
+	def set_columns(self, columns):
+		"""
+		Set DATA values from columns.
+		
+		columns is a dict mapping DATA_FORMAT fields to sequences of values,
+		one per sample (in the order of get_columns).
+		
+		"""
+		if self.type != 'DATA':
+			return self['DATA'].set_columns(columns)
+		keys = sorted(dict.keys(self))
+		if not keys:
+			return
+		# Determine vmaxlen from the values as parsed
+		self.vmaxlen
+		if self._shared_columns:
+			# Copy on write
+			object.__setattr__(self, '_columns', self._columns.copy())
+			object.__setattr__(self, '_shared_columns', False)
+		for field, values in columns.iteritems():
+			values = numpy.asarray(values)
+			if len(values) != len(keys):
+				raise CGATSValueError('Expected %i values for %s, got %i' %
+									  (len(keys), field, len(values)))
+			pending = None
+			if (self._columns is not None and field in self._fields and
+				values.dtype.kind == 'f' and
+				self._columns.dtype[str(field)].kind == 'f'):
+				pending = numpy.array([dict.get(self, key) is unset
+									   for key in keys])
+				self._columns[str(field)][pending] = values[pending]
+			values = values.tolist()
+			for i, key in enumerate(keys):
+				if pending is None or not pending[i]:
+					dict.__setitem__(self[key], field, values[i])
+		self.setmodified()
+	
 	def add_keyword(self, keyword, value=None):
 		""" Add a keyword to the list of keyword values. """
 		if self.type in ('DATA', 'DATA_FORMAT', 'KEYWORDS', 'SECTION'):
@@ -599,6 +1079,26 @@ class CGATS(dict):
 											 self.type)
 		return context
 	
+	@property
+	def vmaxlen(self):
+		"""Get the maximum length of numeric DATA values (for padding)"""
+		if self._vmaxlen_fields:
+			vmaxlen = self._vmaxlen
+			for field in self._vmaxlen_fields:
+				column = self._columns[str(field)].tolist()
+				strvalues = map(str, map(abs, column))
+				if 'e' in ''.join(strvalues):
+					strvalues = [strval.split("e")[0] for strval in strvalues]
+				vmaxlen = max([vmaxlen] + map(len, strvalues))
+			object.__setattr__(self, '_vmaxlen', vmaxlen)
+			object.__setattr__(self, '_vmaxlen_fields', ())
+		return self._vmaxlen
+	
+	@vmaxlen.setter
+	def vmaxlen(self, vmaxlen):
+		self.vmaxlen
+		object.__setattr__(self, '_vmaxlen', vmaxlen)
+	
 	@property
 	def NUMBER_OF_FIELDS(self):
 		"""Get number of fields"""
@@ -623,78 +1123,14 @@ class CGATS(dict):
 		
 		"""
 		
-		if not get_first:
-			result = CGATS()
-		else:
-			result = None
-		
 		if not isinstance(query, dict):
 			if type(query) not in (list, tuple):
 				query = (query, )
 		
-		items = [self] + [self[key] for key in self]
-		# for key in self:
-			# item = self[key]
-		for item in items:
-			if type(item) in (CGATS, dict, list, tuple):
-			
-				if not get_first:
-					n = len(result)
-				
-				if get_value:
-					result_n = CGATS()
-				else:
-					result_n = None
-				
-				match_count = 0
-				for query_key in query:
-					if query_key in item or (type(item) == CGATS and 
-					   ((query_key == 'NUMBER_OF_FIELDS' and 'DATA_FORMAT' in 
-					   item) or (query_key == 'NUMBER_OF_SETS' and 'DATA' in 
-					   item))):
-						if query_value is None and isinstance(query, dict):
-							current_query_value = query[query_key]
-						else:
-							current_query_value = query_value
-						if current_query_value != None:
-							if item[query_key] != current_query_value:
-								break
-						if get_value:
-							result_n[len(result_n)] = item[query_key]
-						match_count += 1
-					else:
-						break
-				
-				if match_count == len(query):
-					if not get_value:
-						result_n = item
-					if result_n != None:
-						if get_first:
-							if get_value and isinstance(result_n, dict) and \
-							   len(result_n) == 1:
-								return result_n[0]
-							else:
-								return result_n
-						elif len(result_n):
-							if get_value and isinstance(result_n, dict) and \
-							   len(result_n) == 1:
-								result[n] = result_n[0]
-							else:
-								result[n] = result_n
-				
-				if type(item) == CGATS and item != self:
-					result_n = item.query(query, query_value, get_value, 
-										  get_first)
-					if result_n != None:
-						if get_first:
-							return result_n
-						elif len(result_n):
-							for i in result_n:
-								n = len(result)
-								if result_n[i] not in result.values():
-									result[n] = result_n[i]
-		
-		return result
+		if not self._index or not self._index.is_current():
+			# (Re-)build the index
+			object.__setattr__(self, '_index', CGATSIndex(self))
+		return self._index.query(query, query_value, get_value, get_first)
 	
 	def queryi(self, query, query_value=None):
 		""" Query and return matching items. See also query method. """
@@ -719,6 +1155,7 @@ class CGATS(dict):
 		else:
 			key = item
 		maxindex = len(self) - 1
+		self.materialize(True)
 		result = dict.pop(self, key)
 		if type(key) == int and key != maxindex:
 			self.moveby1(key + 1, -1)
@@ -726,12 +1163,39 @@ class CGATS(dict):
 		self.setmodified()
 		return result
 	
+	def get_data_sections(self, fields):
+		"""
+		Return the DATA sections (in query order) which have all fields in
+		their DATA_FORMAT.
+		
+		"""
+		if self.type == 'DATA':
+			tables = [self.parent]
+		else:
+			tables = self.queryi('DATA').values()
+		sections = []
+		for table in tables:
+			if 'DATA_FORMAT' in table:
+				data_format = table['DATA_FORMAT'].values()
+				for field in fields:
+					if field not in data_format:
+						break
+				else:
+					sections.append(table['DATA'])
+		return sections
+	
 	def scale_rgb(self, factor=2.55):
 		""" Scales RGB by multiplying with factor. """
-		data = self.queryi(("RGB_R", "RGB_G", "RGB_B"))
-		for i in data:
+		for data in self.get_data_sections(("RGB_R", "RGB_G", "RGB_B")):
+			columns = {}
 			for label in ("RGB_R", "RGB_G", "RGB_B"):
-				data[i][label] *= factor
+				values = data.get_values(label)
+				if set(map(type, values)) == set([float]):
+					columns[label] = numpy.array(values) * factor
+				else:
+					# Keep int * int = int etc.
+					columns[label] = numpy.array(values, dtype=object) * factor
+			data.set_columns(columns)
 	
 	def apply_bpc(self):
 		"""
@@ -744,49 +1208,309 @@ class CGATS(dict):
 		Return True if bpc was applied, False otherwise.
 		
 		"""
-		data = self.queryi(("RGB_R", "RGB_G", "RGB_B", "XYZ_X", "XYZ_Y", "XYZ_Z"))
+		sections = self.get_data_sections(("RGB_R", "RGB_G", "RGB_B", 
+										   "XYZ_X", "XYZ_Y", "XYZ_Z"))
+		columns = {}
+		for label in ("RGB_R", "RGB_G", "RGB_B", "XYZ_X", "XYZ_Y", "XYZ_Z"):
+			columns[label] = []
+			for data in sections:
+				columns[label].extend(data.get_values(label))
+		RGB = numpy.column_stack([columns[label] for label in
+								  ("RGB_R", "RGB_G", "RGB_B")])
+		XYZ = numpy.column_stack([columns[label] for label in
+								  ("XYZ_X", "XYZ_Y", "XYZ_Z")])
 
 		# Get blacks
-		blacks = data.queryi({"RGB_R": 0, "RGB_G": 0, "RGB_B": 0})
+		blacks = XYZ[(RGB == 0).all(axis=1)]
 		# Get whites
-		whites = data.queryi({"RGB_R": 100, "RGB_G": 100, "RGB_B": 100})
-		if not blacks or not whites:
+		whites = XYZ[(RGB == 100).all(axis=1)]
+		if not len(blacks) or not len(whites):
 			# Can't apply bpc
 			return False
 
-		black = [0, 0, 0]
-		for i in blacks:
-			for j, label in enumerate(("XYZ_X", "XYZ_Y", "XYZ_Z")):
-				black[j] += blacks[i][label]
-			if blacks[i]["XYZ_Y"] == 0:
-				break
-		# Average blacks
-		black = [n / (i + 1.0) for n in black]
-
-		white = [0, 0, 0]
-		for i in whites:
-			for j, label in enumerate(("XYZ_X", "XYZ_Y", "XYZ_Z")):
-				white[j] += whites[i][label]
-			if whites[i]["XYZ_Y"] == 100:
-				break
-		# Average whites
-		white = [n / (i + 1.0) for n in white]
+		# Average blacks up to the first one with Y = 0, and whites up to
+		# the first one with Y = 100
+		averages = []
+		for patches, Y in ((blacks, 0), (whites, 100)):
+			stop = numpy.flatnonzero(patches[:, 1] == Y)
+			if len(stop):
+				patches = patches[:stop[0] + 1]
+			averages.append([sum(values) / float(len(patches)) for values in
+							 patches.T.tolist()])
+		black, white = averages
 
 		# Apply black point compensation
-		for i in data:
-			XYZ = data[i].queryv1(("XYZ_X", "XYZ_Y", "XYZ_Z"))
-			XYZ = colormath.apply_bpc(XYZ[0], XYZ[1], XYZ[2], black, (0, 0, 0), white)
-			for j, label in enumerate(("XYZ_X", "XYZ_Y", "XYZ_Z")):
-				data[i][label] = XYZ[j]
+		XYZ = colormath.apply_bpc_array(XYZ, black, (0, 0, 0), white)
+		start = 0
+		for data in sections:
+			end = start + len(data)
+			data.set_columns({"XYZ_X": XYZ[start:end, 0],
+							  "XYZ_Y": XYZ[start:end, 1],
+							  "XYZ_Z": XYZ[start:end, 2]})
+			start = end
 
 		return True
 	
 	pop = remove
 	
 	def write(self, filename=None):
+		"""
+		Write the CGATS text to a file.
+		
+		filename can be a path or a file object (default: self.filename).
+		
+		"""
 		if not filename:
 			filename = self.filename
-		txt = open(filename, "w")
-		txt.write(str(self))
-		txt.close()
+		if hasattr(filename, "write"):
+			txt = filename
+		else:
+			txt = open(filename, "w")
+		try:
+			for i, line in enumerate(self.iterlines()):
+				if i:
+					txt.write("\n")
+				txt.write(line)
+		finally:
+			if txt is not filename:
+				txt.close()
+	
+
+
+
+def match(item, query, query_value=None, get_value=False):
+	"""
+	Match a single item (a CGATS, dict, list or tuple) against query.
+	
+	Return the item, or a CGATS object of the matching values if get_value
+	evaluates to True. Return None if the query doesn't match.
+	See also CGATS.query.
+	
+	"""
+	if get_value:
+		result_n = CGATS()
+	else:
+		result_n = None
+	for query_key in query:
+		if query_key in item or (type(item) == CGATS and 
+		   ((query_key == 'NUMBER_OF_FIELDS' and 'DATA_FORMAT' in 
+		   item) or (query_key == 'NUMBER_OF_SETS' and 'DATA' in 
+		   item))):
+			if query_value is None and isinstance(query, dict):
+				current_query_value = query[query_key]
+			else:
+				current_query_value = query_value
+			if current_query_value != None:
+				if item[query_key] != current_query_value:
+					return None
+			if get_value:
+				result_n[len(result_n)] = item[query_key]
+		else:
+			return None
+	if not get_value:
+		result_n = item
+	return result_n
+
+
+class CGATSIndex(object):
+
+	"""
+	Query index of a CGATS structure.
 	
+	All items a query can return are numbered in query order (depth-first).
+	Items are indexed by key, except samples of DATA sections stored as
+	columns. Those are indexed by DATA_FORMAT field, and by value per field
+	when first queried. The index is no longer current once any part of the
+	structure has been modified.
+	
+	"""
+
+	def __init__(self, cgats):
+		self.items = []
+		self.positions = []
+		self.keys = {}
+		self.other = []
+		self.sections = []
+		self.revisions = {}
+		self.size = 0
+		self.add_item(cgats)
+		self.add_children(cgats)
+
+	def add_item(self, item):
+		i = len(self.items)
+		self.items.append(item)
+		self.positions.append(self.size)
+		self.size += 1
+		if type(item) == CGATS:
+			for key in dict.iterkeys(item):
+				self.keys.setdefault(key, []).append(i)
+			if 'DATA_FORMAT' in item:
+				self.keys.setdefault('NUMBER_OF_FIELDS', []).append(i)
+			if 'DATA' in item:
+				self.keys.setdefault('NUMBER_OF_SETS', []).append(i)
+			if item.root is not None:
+				self.revisions[id(item.root)] = (item.root, 
+												 item.root._revision)
+		else:
+			# Lists and tuples match by value, dicts are rare
+			self.other.append(i)
+
+	def add_children(self, cgats):
+		if cgats.type == 'DATA' and self.add_section(cgats):
+			return
+		for key in cgats:
+			item = cgats[key]
+			if type(item) in (CGATS, dict, list, tuple):
+				self.add_item(item)
+				if type(item) == CGATS and item is not cgats:
+					self.add_children(item)
+
+	def add_section(self, data):
+		""" Add the samples of a DATA section stored as columns """
+		if data._columns is None:
+			return False
+		fields = set(data._fields)
+		size = len(data)
+		for key, row in dict.iteritems(data):
+			if type(key) != int or not 0 <= key < size:
+				# Samples are looked up by position
+				return False
+			if row is not unset and (type(row) != CGATS or row.key != key or
+									 set(dict.iterkeys(row)) != fields):
+				# Changed samples need to be looked at one by one
+				return False
+		self.sections.append({"start": self.size,
+							  "data": data,
+							  "fields": fields,
+							  "values": {},
+							  "lookup": {}})
+		self.size += len(data)
+		return True
+
+	def is_current(self):
+		for root, revision in self.revisions.itervalues():
+			if root._revision != revision:
+				return False
+		return True
+
+	def get_values(self, section, field):
+		"""
+		Return the values of a DATA field as a list, as they would be
+		returned by sample[field].
+		
+		"""
+		if field not in section["values"]:
+			section["values"][field] = section["data"].get_values(field)
+		return section["values"][field]
+
+	def lookup(self, section, field, value):
+		""" Return the sorted indexes of samples where field == value """
+		lookup = section["lookup"].get(field)
+		if lookup is None:
+			lookup = {}
+			try:
+				for i, v in enumerate(self.get_values(section, field)):
+					lookup.setdefault(v, []).append(i)
+			except TypeError:
+				# Unhashable values
+				lookup = False
+			section["lookup"][field] = lookup
+		if lookup is False:
+			values = self.get_values(section, field)
+			return [i for i, v in enumerate(values) if not v != value]
+		try:
+			return lookup.get(value, [])
+		except TypeError:
+			return []
+
+	def match_section(self, section, query, query_value, get_value):
+		"""
+		Return a list of (position, result) for matching samples of a DATA
+		section.
+		
+		"""
+		for query_key in query:
+			if query_key not in section["fields"]:
+				return []
+		indexes = None
+		for query_key in query:
+			if query_value is None and isinstance(query, dict):
+				current_query_value = query[query_key]
+			else:
+				current_query_value = query_value
+			if current_query_value != None:
+				found = self.lookup(section, query_key, current_query_value)
+				if indexes is None:
+					indexes = found
+				else:
+					found = set(found)
+					indexes = [i for i in indexes if i in found]
+				if not indexes:
+					return []
+		if indexes is None:
+			indexes = xrange(len(section["data"]))
+		start = section["start"]
+		data = section["data"]
+		results = []
+		if get_value:
+			columns = [self.get_values(section, query_key) for query_key in
+					   query]
+			for i in indexes:
+				result_n = CGATS()
+				for values in columns:
+					result_n[len(result_n)] = values[i]
+				results.append((start + i, result_n))
+		else:
+			for i in indexes:
+				results.append((start + i, data[i]))
+		return results
+
+	def query(self, query, query_value=None, get_value=False, 
+			  get_first=False):
+		""" See CGATS.query """
+		candidates = None
+		for query_key in query:
+			found = self.keys.get(query_key, ())
+			if candidates is None or len(found) < len(candidates):
+				candidates = found
+		if candidates is None:
+			candidates = xrange(len(self.items))
+		else:
+			candidates = sorted(set(candidates).union(self.other))
+		results = []
+		for i in candidates:
+			result_n = match(self.items[i], query, query_value, get_value)
+			if result_n is not None:
+				if get_first:
+					results.append((self.positions[i], result_n))
+					break
+				if len(result_n):
+					results.append((self.positions[i], result_n))
+		for section in self.sections:
+			if get_first and results and results[0][0] < section["start"]:
+				break
+			found = self.match_section(section, query, query_value, 
+									   get_value)
+			if found:
+				if get_first:
+					results = sorted(results + found[:1])[:1]
+				else:
+					results.extend(found)
+		if self.sections and not get_first:
+			results.sort()
+		if get_first:
+			if not results:
+				return None
+			result_n = results[0][1]
+			if get_value and isinstance(result_n, dict) and \
+			   len(result_n) == 1:
+				return result_n[0]
+			return result_n
+		result = CGATS()
+		for n, (position, result_n) in enumerate(results):
+			if get_value and isinstance(result_n, dict) and \
+			   len(result_n) == 1:
+				result[n] = result_n[0]
+			else:
+				result[n] = result_n
+		return result
@@ -12,15 +12,19 @@ Copyright (c) 2012 OST, LLC. """
 from hashlib import md5
 import binascii
 import datetime
+import json
 import locale
 import math
+import mmap
 import os
 import re
 import struct
 import sys
+import tempfile
+import weakref
 from copy import copy
 from itertools import izip, imap
-from time import localtime, mktime, strftime
+from time import localtime, mktime, strftime, time
 from UserString import UserString
 if sys.platform == "win32":
     import _winreg
@@ -37,12 +41,14 @@ if sys.platform == "win32":
     except ImportError:
         pass
 
+import numpy
+
 import colormath
 import edid
 from colormath import NumberTuple
-from defaultpaths import iccprofiles, iccprofiles_home
+from defaultpaths import appdata, iccprofiles, iccprofiles_home
 from encoding import get_encodings
-from meta import version
+from meta import name as appname, version
 from ordereddict import OrderedDict
 try:
     from log import safe_plint
@@ -438,7 +444,8 @@ def _winreg_get_display_profile(monkey, current_user=False):
                                 "sRGB Color Space Profile.icm")
     ## print repr(filename)
     if filename:
-        return ICCProfile(filename)
+        # Pass the full path so the profile isn't searched for by name
+        return ICCProfile(os.path.join(iccprofiles[0], filename))
     return None
 
 
@@ -699,6 +706,8 @@ class CRInterpolation(object):
         self.points = points
 
     def __call__(self, pos):
+        if numpy.ndim(pos):
+            return self.interpolate(pos)
         lbound = int(math.floor(pos) - 1)
         ubound = int(math.ceil(pos) + 1)
         t = pos % 1.0
@@ -720,6 +729,36 @@ class CRInterpolation(object):
                       ((2 * p[0]) - (5 * p[1]) + (4 * p[2]) - p[3]) * t2 +
                       (-p[0] + (3 * p[1]) - (3 * p[2]) + p[3]) * (t2 * t))
 
+    def interpolate(self, positions):
+        """
+        Interpolate at an array of positions at once.
+        
+        Gives the same results as calling the instance for each position.
+        
+        """
+        positions = numpy.asarray(positions, dtype=numpy.float64)
+        points = numpy.asarray(self.points)
+        if points.dtype.kind in "bu":
+            # Unsigned differences would wrap around
+            points = points.astype(numpy.int64)
+        # Extend by one point to the left and right linearly
+        extended = numpy.concatenate(([points[0] - (points[1] - points[0])],
+                                      points,
+                                      [points[-1] - (points[-2] -
+                                                     points[-1])]))
+        floor = numpy.floor(positions).astype(numpy.int64)
+        lbound = numpy.clip(floor, 0, len(points) - 2)
+        p0, p1, p2, p3 = (extended[lbound + i] for i in xrange(4))
+        t = positions % 1.0
+        t2 = t * t
+        values = 0.5 * ((2 * p1) + (-p0 + p2) * t + 
+                        ((2 * p0) - (5 * p1) + (4 * p2) - p3) * t2 +
+                        (-p0 + (3 * p1) - (3 * p2) + p3) * (t2 * t))
+        # Where sitting on a datapoint, just return that
+        return numpy.where(numpy.abs(floor - positions) < 0.0001,
+                           points[numpy.clip(floor, 0, len(points) - 1)],
+                           values)
+
 
 class ADict(dict):
 
@@ -755,8 +794,110 @@ class AODict(ADict, OrderedDict):
             self[name] = value
 
 
+class LazyTagDict(AODict):
+
+    """
+    Tag table of a lazily loaded profile.
+    
+    Tags are kept as raw, zero-copy buffers of the profile data (which may
+    be memory-mapped) and are only decoded when accessed the first time.
+    Shared tags (same offset and size in the tag table) are decoded once.
+    
+    """
+
+    def __init__(self, *args, **kwargs):
+        object.__setattr__(self, "_raw", {})
+        object.__setattr__(self, "_decoded", {})
+        object.__setattr__(self, "_profile", None)
+        object.__setattr__(self, "connectionColorSpace", None)
+        AODict.__init__(self, *args, **kwargs)
+
+    def __delitem__(self, key):
+        self._raw.pop(key, None)
+        AODict.__delitem__(self, key)
+
+    def __getitem__(self, key):
+        if key in self._raw:
+            tagDataOffset, tagData = self._raw[key]
+            shared = (tagDataOffset, len(tagData))
+            if shared in self._decoded:
+                tag = self._decoded[shared]
+            else:
+                profile = self._profile and self._profile()
+                tag = decode_tag(str(tagData), key, tagDataOffset,
+                                 self.connectionColorSpace, profile)
+                self._decoded[shared] = tag
+            dict.__setitem__(self, key, tag)
+            del self._raw[key]
+        return dict.__getitem__(self, key)
+
+    def __setitem__(self, key, value):
+        self._raw.pop(key, None)
+        AODict.__setitem__(self, key, value)
+
+    def add_raw(self, tagSignature, tagDataOffset, tagData):
+        """
+        Add an undecoded tag.
+        
+        tagData should be a buffer of the profile data.
+        
+        """
+        AODict.__setitem__(self, tagSignature, None)
+        self._raw[tagSignature] = (tagDataOffset, tagData)
+
+    def clear(self):
+        self._raw.clear()
+        AODict.clear(self)
+
+    def detach(self):
+        """
+        Replace the buffers of undecoded tags with copies.
+        
+        Needed before the underlying file is overwritten.
+        
+        """
+        for key, (tagDataOffset, tagData) in self._raw.items():
+            self._raw[key] = (tagDataOffset, str(tagData))
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def is_decoded(self, key):
+        """ Return whether the tag has been decoded """
+        return key in self and key not in self._raw
+
+    def pop(self, key, *args):
+        if key in self:
+            self[key]
+        return AODict.pop(self, key, *args)
+
+    def tagData(self, key):
+        """
+        Return the raw tag data.
+        
+        Tags which have not been decoded yet are returned as-is.
+        
+        """
+        if key in self._raw:
+            return str(self._raw[key][1])
+        return self[key].get_tagData()
+
+    def __setattr__(self, name, value):
+        if name in ("_keys", "_profile", "connectionColorSpace"):
+            object.__setattr__(self, name, value)
+        else:
+            self[name] = value
+
+
 class ICCProfileTag(object):
 
+    # Whether the serialized tag data may be cached until the tag changes.
+    # Only enable for tag types where every modification goes through
+    # __setattr__ or otherwise calls changed()
+    cache_tagData = False
+
     def __init__(self, tagData, tagSignature):
         self.tagData = tagData
         self.tagSignature = tagSignature
@@ -767,6 +908,28 @@ class ICCProfileTag(object):
             object.__setattr__(self, name, value)
         else:
             self[name] = value
+        self.changed()
+    
+    def changed(self):
+        """
+        Mark the tag as modified, discarding cached tag data.
+        """
+        self.__dict__.pop("_tagData", None)
+    
+    def get_tagData(self):
+        """
+        Return raw tag data.
+        
+        If the tag type supports it (see cache_tagData), the data is only
+        serialized again after the tag has changed.
+        
+        """
+        if not self.cache_tagData:
+            return self.tagData
+        tagData = self.__dict__.get("_tagData")
+        if tagData is None:
+            tagData = self.__dict__["_tagData"] = self.tagData
+        return tagData
     
     def __repr__(self):
         """
@@ -987,56 +1150,115 @@ class ColorantTableType(ICCProfileTag, AODict):
 
 class CurveType(ICCProfileTag, list):
 
+    """
+    curveType ('curv')
+    
+    The entries are a list (a single gamma value or 16-bit table values).
+    Evaluation and analysis use a NumPy array of the entries (see 'array'),
+    which is cached until the curve changes.
+    
+    """
+
+    # All list methods which change the curve are overridden to call
+    # changed(), which also discards the cached array and transfer functions
+    cache_tagData = True
+
     def __init__(self, tagData=None, tagSignature=None):
         ICCProfileTag.__init__(self, tagData, tagSignature)
-        self._transfer_function = {}
         if not tagData:
             return
         curveEntriesCount = uInt32Number(tagData[8:12])
-        curveEntries = tagData[12:]
         if curveEntriesCount == 1:
             # Gamma
-            self.append(u8Fixed8Number(curveEntries[:2]))
+            self.append(u8Fixed8Number(tagData[12:14]))
         elif curveEntriesCount:
             # Curve
-            for count in xrange(curveEntriesCount):
-                self.append(uInt16Number(curveEntries[:2]))
-                curveEntries = curveEntries[2:]
+            array = numpy.frombuffer(tagData, ">u2", curveEntriesCount,
+                                     12).astype(numpy.float64)
+            self.extend(array.tolist())
+            # Keep the array so it doesn't have to be created from the list
+            array.flags.writeable = False
+            self.__dict__["_array"] = array
         else:
             # Identity
             self.append(1.0)
     
     def __delitem__(self, y):
         list.__delitem__(self, y)
-        self._transfer_function = {}
+        self.changed()
     
     def __delslice__(self, i, j):
         list.__delslice__(self, i, j)
-        self._transfer_function = {}
+        self.changed()
     
     def __iadd__(self, y):
         list.__iadd__(self, y)
-        self._transfer_function = {}
+        self.changed()
+        return self
     
     def __imul__(self, y):
         list.__imul__(self, y)
-        self._transfer_function = {}
+        self.changed()
+        return self
     
     def __setitem__(self, i, y):
         list.__setitem__(self, i, y)
-        self._transfer_function = {}
+        self.changed()
     
     def __setslice__(self, i, j, y):
         list.__setslice__(self, i, j, y)
-        self._transfer_function = {}
+        self.changed()
+    
+    def apply(self, values):
+        """ Evaluate the curve for an array of values in the range 0..1 """
+        values = numpy.asarray(values, dtype=numpy.float64)
+        if len(self) <= 1:
+            # Gamma or identity
+            gamma = self[0] if len(self) else 1.0
+            return numpy.power(numpy.clip(values, 0.0, 1.0), gamma)
+        return numpy.interp(values, numpy.linspace(0.0, 1.0, len(self)),
+                            self.array / 65535.0)
+    
+    def apply_inverse(self, values):
+        """
+        Evaluate the inverse curve for an array of values in the range 0..1
+        
+        Non-monotonic tables are made monotonic first. Values outside the
+        range of the curve are clipped.
+        
+        """
+        values = numpy.asarray(values, dtype=numpy.float64)
+        if len(self) <= 1:
+            # Gamma or identity
+            gamma = self[0] if len(self) else 1.0
+            return numpy.power(numpy.clip(values, 0.0, 1.0), 1.0 / gamma)
+        # numpy.interp needs monotonically increasing sample points
+        return numpy.interp(values,
+                            numpy.maximum.accumulate(self.array / 65535.0),
+                            numpy.linspace(0.0, 1.0, len(self)))
+    
+    @property
+    def array(self):
+        """ The curve entries as read-only NumPy float64 array """
+        array = self.__dict__.get("_array")
+        if array is None:
+            array = self.__dict__["_array"] = numpy.array(self,
+                                                          dtype=numpy.float64)
+            array.flags.writeable = False
+        return array
+    
+    def changed(self):
+        ICCProfileTag.changed(self)
+        self.__dict__.pop("_array", None)
+        self.__dict__["_transfer_function"] = {}
     
     def append(self, object):
         list.append(self, object)
-        self._transfer_function = {}
+        self.changed()
     
     def extend(self, iterable):
         list.extend(self, iterable)
-        self._transfer_function = {}
+        self.changed()
     
     def get_gamma(self, use_vmin_vmax=False, average=True, least_squares=False,
                   slice=(0.01, 0.99)):
@@ -1050,21 +1272,29 @@ class CurveType(ICCProfileTag, list):
             if average or least_squares:
                 return values[0]
             return [values[0]]
-        else:
-            start = slice[0] * 100
-            end = slice[1] * 100
-            values = []
-            for i, y in enumerate(self):
-                n = colormath.XYZ2Lab(0, y / 65535.0 * 100, 0)[0]
-                if n >= start and n <= end:
-                    values.append((i / (len(self) - 1.0) * 65535.0, y))
+        start = slice[0] * 100
+        end = slice[1] * 100
+        XYZ = numpy.zeros((len(self), 3))
+        XYZ[:, 1] = self.array / 65535.0 * 100
+        L = colormath.XYZ2Lab_array(XYZ)[:, 0]
+        i = numpy.flatnonzero((L >= start) & (L <= end))
         vmin = 0
         vmax = 65535.0
         if use_vmin_vmax:
             if len(self) > 2:
                 vmin = self[0]
                 vmax = self[-1]
-        return colormath.get_gamma(values, 65535.0, vmin, vmax, average, least_squares)
+        # Same as colormath.get_gamma, for all entries at once
+        valid, logx, logy = self._get_logs(i, vmin, vmax)
+        logx = logx[valid]
+        logy = logy[valid]
+        if average or least_squares:
+            if not len(logx):
+                return 0
+            if least_squares:
+                return float(numpy.sum(logx * logy) / numpy.sum(logx ** 2))
+            return float(numpy.mean(logy / logx))
+        return (logy / logx).tolist()
     
     def get_transfer_function(self, best=True, slice=(0.05, 0.95)):
         """
@@ -1086,34 +1316,27 @@ class CurveType(ICCProfileTag, list):
         vmax = self[-1]
         gamma = colormath.get_gamma([((len(self) / 2 - 1) / (len(self) - 1.0) * 65535.0,
                                       self[len(self) / 2 - 1])], 65535.0, vmin, vmax)
+        # Only compare entries within slice
+        i = numpy.arange(len(self))
+        i = i[(i >= slice[0] * len(self)) & (i <= slice[1] * len(self))]
+        valid, gammas = self._get_gammas(i, vmin, vmax)
         for name, exp in (("Rec. 709", -709),
                           ("SMPTE 240M", -240),
                           ("L*", -3.0),
                           ("sRGB", -2.4),
                           (("Gamma %.2f" % gamma).rstrip("0"), gamma)):
             trc.set_trc(exp, len(self), vmin, vmax)
-            if self == trc:
+            if numpy.array_equal(self.array, trc.array):
                 match[(name, exp)] = 1.0
             else:
-                match[(name, exp)] = 0.0
-                count = 0
-                start = slice[0] * len(self)
-                end = slice[1] * len(self)
-                #print self.tagSignature, name
-                for i, n in enumerate(self):
-                    ##n = colormath.XYZ2Lab(0, n / 65535.0 * 100, 0)[0]
-                    if i >= start and i <= end:
-                        n = colormath.get_gamma([(i / (len(self) - 1.0) * 65535.0, n)], 65535.0, vmin, vmax, False)
-                        if n:
-                            n = n[0]
-                            ##n2 = colormath.XYZ2Lab(0, trc[i] / 65535.0 * 100, 0)[0]
-                            n2 = colormath.get_gamma([(i / (len(self) - 1.0) * 65535.0, trc[i])], 65535.0, vmin, vmax, False)
-                            if n2:
-                                n2 = n2[0]
-                                match[(name, exp)] += 1 - (max(n, n2) - min(n, n2)) / n2
-                                count += 1
-                if count:
-                    match[(name, exp)] /= count
+                valid2, gammas2 = trc._get_gammas(i, vmin, vmax)
+                # Skip entries where either gamma is undefined
+                both = valid & valid2 & (gammas2 != 0)
+                if both.any():
+                    n, n2 = gammas[both], gammas2[both]
+                    match[(name, exp)] = float(numpy.mean(1 - numpy.abs(n - n2) / n2))
+                else:
+                    match[(name, exp)] = 0.0
         #print self.tagSignature, match
         if not best:
             self._transfer_function[(best, slice)] = match
@@ -1122,21 +1345,48 @@ class CurveType(ICCProfileTag, list):
         self._transfer_function[(best, slice)] = (name, exp), match
         return (name, exp), match
     
-    def insert(self, object):
-        list.insert(self, object)
-        self._transfer_function = {}
+    def _get_logs(self, i, vmin, vmax):
+        """
+        Return validity mask, log(x) and log(y) for the entries at indexes i,
+        normalized like colormath.get_gamma does
+        
+        """
+        x = i / (len(self) - 1.0)
+        vmin /= 65535.0
+        vmax /= 65535.0
+        y = (self.array[i] / 65535.0 - vmin) * (vmax + vmin)
+        valid = (x > 0) & (x < 1) & (y > 0)
+        logx = numpy.zeros(len(i))
+        logy = numpy.zeros(len(i))
+        logx[valid] = numpy.log(x[valid])
+        logy[valid] = numpy.log(y[valid])
+        return valid, logx, logy
+    
+    def _get_gammas(self, i, vmin, vmax):
+        """
+        Return validity mask and gamma for each entry at indexes i
+        """
+        valid, logx, logy = self._get_logs(i, vmin, vmax)
+        gammas = numpy.zeros(len(i))
+        gammas[valid] = logy[valid] / logx[valid]
+        return valid, gammas
+    
+    def insert(self, index, object):
+        list.insert(self, index, object)
+        self.changed()
     
-    def pop(self, index):
-        list.pop(self, index)
-        self._transfer_function = {}
+    def pop(self, index=-1):
+        object = list.pop(self, index)
+        self.changed()
+        return object
     
     def remove(self, value):
         list.remove(self, value)
-        self._transfer_function = {}
+        self.changed()
     
     def reverse(self):
         list.reverse(self)
-        self._transfer_function = {}
+        self.changed()
     
     def set_trc(self, power=2.2, size=None, vmin=0, vmax=65535):
         """
@@ -1155,13 +1405,19 @@ class CurveType(ICCProfileTag, list):
                 return
             else:
                 size = 1024
-        self[:] = []
-        for i in xrange(0, size):
-            self.append(vmin + int(round(colormath.specialpow(float(i) / (size - 1), power) * (vmax - vmin))))
+        values = (colormath.TransferFunction.get(power).decode(
+            numpy.arange(size) / (size - 1.0)) * (vmax - vmin))
+        # Round half away from zero like round()
+        values = numpy.sign(values) * numpy.floor(numpy.abs(values) + 0.5)
+        values = values.astype(int) + vmin
+        self[:] = values.tolist()
+        # Keep the array so it doesn't have to be created from the list
+        array = self.__dict__["_array"] = values.astype(numpy.float64)
+        array.flags.writeable = False
     
     def sort(self, cmp=None, key=None, reverse=False):
         list.sort(self, cmp, key, reverse)
-        self._transfer_function = {}
+        self.changed()
     
     @Property
     def tagData():
@@ -1435,6 +1691,257 @@ class DictType(ICCProfileTag, AODict):
         return "{%s}" % ",\n".join(json)
 
 
+class LUTType(ICCProfileTag):
+
+    """
+    Base class for the LUT based tag types.
+    
+    Tables are decoded to read-only NumPy arrays which are views into the
+    raw tag data, i.e. no copy is made. The processing elements of the tag
+    are listed by attribute name in the order they are applied in
+    'elements', and apply() evaluates them for whole arrays of values.
+    
+    """
+
+    def __init__(self, tagData, tagSignature):
+        ICCProfileTag.__init__(self, tagData, tagSignature)
+        self.inputChannels = uInt8Number(tagData[8])
+        self.outputChannels = uInt8Number(tagData[9])
+        self.elements = []
+        self._normalized = {}
+
+    def apply(self, values, interpolation="tetrahedral"):
+        """
+        Evaluate the LUT for an array of values in the range 0..1 (trailing
+        axis = input channels) and return the normalized output values.
+        
+        interpolation is used for the color lookup table and can be
+        'tetrahedral' or 'trilinear'. Tables which do not have three input
+        channels are always interpolated multilinearly.
+        
+        """
+        values = numpy.asarray(values, dtype=numpy.float64)
+        if not values.ndim or values.shape[-1] != self.inputChannels:
+            raise ValueError("Expected array with a trailing axis of %i, got "
+                             "shape %r" % (self.inputChannels, values.shape))
+        for name in self.elements:
+            if name == "matrix":
+                values = numpy.clip(numpy.dot(values,
+                                              numpy.array(self.matrix).T) +
+                                    self.offset, 0.0, 1.0)
+            elif name == "clut":
+                clut = self.get_normalized("clut")
+                if interpolation == "tetrahedral" and clut.ndim == 4:
+                    values = colormath.interp_tetrahedral(clut, values)
+                else:
+                    values = colormath.interp_multilinear(clut, values)
+            else:
+                values = self.apply_curves(name, values)
+        return values
+
+    def apply_curves(self, name, values):
+        """ Apply the set of curves with the given attribute name """
+        curves = getattr(self, name)
+        result = numpy.empty(values.shape)
+        if isinstance(curves, numpy.ndarray):
+            table = self.get_normalized(name)
+            x = numpy.linspace(0.0, 1.0, table.shape[-1])
+            for i, curve in enumerate(table):
+                result[..., i] = numpy.interp(values[..., i], x, curve)
+        else:
+            for i, curve in enumerate(curves):
+                result[..., i] = curve.apply(values[..., i])
+        return result
+
+    def get_normalized(self, name):
+        """
+        Return the table with the given attribute name scaled to 0..1
+        as float array. The result is cached.
+        
+        """
+        if not name in self._normalized:
+            table = getattr(self, name)
+            self._normalized[name] = table / float(numpy.iinfo(table.dtype).max)
+        return self._normalized[name]
+
+    def read_clut(self, tagData, offset, gridPoints, dtype):
+        """ Return a view of the color lookup table at offset """
+        shape = tuple(gridPoints) + (self.outputChannels, )
+        count = reduce(lambda a, b: a * b, shape)
+        return numpy.frombuffer(tagData, dtype, count, offset).reshape(shape)
+
+
+class LUT16Type(LUTType):
+
+    """
+    lut16Type ('mft2')
+    
+    Byte
+    Offset Content                        Encoded as...
+    8      number of input channels       uInt8Number
+    9      number of output channels      uInt8Number
+    10     number of CLUT grid points     uInt8Number
+    12..47 3x3 matrix                     s15Fixed16Number[9]
+    48..49 number of input table entries  uInt16Number
+    50..51 number of output table entries uInt16Number
+    52..   input tables, CLUT and output tables
+    
+    """
+
+    entrySize = 2
+
+    def __init__(self, tagData, tagSignature):
+        LUTType.__init__(self, tagData, tagSignature)
+        self.inputEntries = uInt16Number(tagData[48:50])
+        self.outputEntries = uInt16Number(tagData[50:52])
+        self.read_tables(tagData, 52)
+
+    def read_tables(self, tagData, offset):
+        """ Read matrix, input tables, CLUT and output tables """
+        self.clutPoints = uInt8Number(tagData[10])
+        self.matrix = colormath.Matrix3x3([[s15Fixed16Number(tagData[i:i + 4])
+                                            for i in xrange(row, row + 12, 4)]
+                                           for row in (12, 24, 36)])
+        self.offset = [0.0, 0.0, 0.0]
+        dtype = ">u%i" % self.entrySize
+        count = self.inputChannels * self.inputEntries
+        self.input = numpy.frombuffer(tagData, dtype, count, offset).reshape(
+            self.inputChannels, self.inputEntries)
+        offset += count * self.entrySize
+        self.clut = self.read_clut(tagData, offset,
+                                   (self.clutPoints, ) * self.inputChannels,
+                                   dtype)
+        offset += self.clut.size * self.entrySize
+        count = self.outputChannels * self.outputEntries
+        self.output = numpy.frombuffer(tagData, dtype, count, offset).reshape(
+            self.outputChannels, self.outputEntries)
+        # The matrix may only be used if the input color space is XYZ, in
+        # which case it need not be the identity matrix
+        if self.matrix != [[1, 0, 0], [0, 1, 0], [0, 0, 1]]:
+            self.elements.append("matrix")
+        self.elements.extend(["input", "clut", "output"])
+
+
+class LUT8Type(LUT16Type):
+
+    """
+    lut8Type ('mft1')
+    
+    Same layout as lut16Type, but with 8-bit tables of 256 entries
+    and the tables starting at byte offset 48.
+    
+    """
+
+    entrySize = 1
+
+    def __init__(self, tagData, tagSignature):
+        LUTType.__init__(self, tagData, tagSignature)
+        self.inputEntries = self.outputEntries = 256
+        self.read_tables(tagData, 48)
+
+
+class LUTAtoBType(LUTType):
+
+    """
+    lutAtoBType ('mAB ')
+    
+    Byte
+    Offset Content                        Encoded as...
+    8      number of input channels       uInt8Number
+    9      number of output channels      uInt8Number
+    12..15 offset to first B curve        uInt32Number
+    16..19 offset to matrix               uInt32Number
+    20..23 offset to first M curve        uInt32Number
+    24..27 offset to CLUT                 uInt32Number
+    28..31 offset to first A curve        uInt32Number
+    
+    Offsets of zero mean the element is not present.
+    Processing order is A curves, CLUT, M curves, matrix, B curves.
+    
+    """
+
+    def __init__(self, tagData, tagSignature):
+        LUTType.__init__(self, tagData, tagSignature)
+        self.read_elements(tagData, self.inputChannels, self.outputChannels)
+        self.elements = [name for name in ("A", "clut", "M", "matrix", "B")
+                         if getattr(self, name) is not None]
+
+    def read_curves(self, tagData, offset, count):
+        """ Read a set of 4-byte aligned 'curv' or 'para' curves """
+        curves = []
+        for i in xrange(count):
+            typeSignature = tagData[offset:offset + 4]
+            if typeSignature == "curv":
+                size = 12 + uInt32Number(tagData[offset + 8:offset + 12]) * 2
+                curves.append(CurveType(tagData[offset:offset + size]))
+            elif typeSignature == "para":
+                functionType = uInt16Number(tagData[offset + 8:offset + 10])
+                if not functionType in ParametricCurveType.parameterCount:
+                    raise ICCProfileInvalidError("Invalid parametric curve "
+                                                 "function type %i" %
+                                                 functionType)
+                size = 12 + ParametricCurveType.parameterCount[functionType] * 4
+                curves.append(ParametricCurveType(tagData[offset:offset + size]))
+            else:
+                raise ICCProfileInvalidError("Invalid curve type %r" %
+                                             typeSignature)
+            offset += size + (-size % 4)
+        return curves
+
+    def read_elements(self, tagData, aChannels, bChannels):
+        """
+        Read the processing elements.
+        
+        aChannels and bChannels are the numbers of channels on the A and
+        B side of the CLUT.
+        
+        """
+        (offsetB, offsetMatrix, offsetM, offsetCLUT,
+         offsetA) = [uInt32Number(tagData[i:i + 4]) for i in (12, 16, 20, 24, 28)]
+        self.B = self.read_curves(tagData, offsetB, bChannels)
+        if offsetMatrix:
+            values = [s15Fixed16Number(tagData[i:i + 4]) for i in
+                      xrange(offsetMatrix, offsetMatrix + 48, 4)]
+            self.matrix = colormath.Matrix3x3([values[0:3], values[3:6],
+                                               values[6:9]])
+            self.offset = values[9:12]
+        else:
+            self.matrix = self.offset = None
+        if offsetM:
+            self.M = self.read_curves(tagData, offsetM, bChannels)
+        else:
+            self.M = None
+        if offsetCLUT:
+            gridPoints = [uInt8Number(tagData[i]) for i in
+                          xrange(offsetCLUT, offsetCLUT + self.inputChannels)]
+            precision = uInt8Number(tagData[offsetCLUT + 16])
+            self.clut = self.read_clut(tagData, offsetCLUT + 20, gridPoints,
+                                       ">u%i" % precision)
+        else:
+            self.clut = None
+        if offsetA:
+            self.A = self.read_curves(tagData, offsetA, aChannels)
+        else:
+            self.A = None
+
+
+class LUTBtoAType(LUTAtoBType):
+
+    """
+    lutBtoAType ('mBA ')
+    
+    Same layout as lutAtoBType, but the processing order is B curves,
+    matrix, M curves, CLUT, A curves.
+    
+    """
+
+    def __init__(self, tagData, tagSignature):
+        LUTType.__init__(self, tagData, tagSignature)
+        self.read_elements(tagData, self.outputChannels, self.inputChannels)
+        self.elements = [name for name in ("B", "matrix", "M", "clut", "A")
+                         if getattr(self, name) is not None]
+
+
 class MakeAndModelType(ICCProfileTag, ADict):
 
     def __init__(self, tagData, tagSignature):
@@ -1555,6 +2062,66 @@ class MultiLocalizedUnicodeType(ICCProfileTag, AODict): # ICC v4
         return locals()
 
 
+class ParametricCurveType(ICCProfileTag):
+
+    """
+    parametricCurveType ('para')
+    
+    Function type and parameters (g, a, b, c, d, e, f):
+    0  Y = X ^ g
+    1  Y = (aX + b) ^ g         for X >= -b / a, otherwise 0
+    2  Y = (aX + b) ^ g + c     for X >= -b / a, otherwise c
+    3  Y = (aX + b) ^ g         for X >= d, otherwise cX
+    4  Y = (aX + b) ^ g + e     for X >= d, otherwise cX + f
+    
+    """
+
+    parameterCount = {0: 1, 1: 3, 2: 4, 3: 5, 4: 7}
+
+    def __init__(self, tagData, tagSignature=None):
+        ICCProfileTag.__init__(self, tagData, tagSignature)
+        self.functionType = uInt16Number(tagData[8:10])
+        if not self.functionType in self.parameterCount:
+            raise ICCProfileInvalidError("Invalid parametric curve function "
+                                         "type %i" % self.functionType)
+        self.params = [s15Fixed16Number(tagData[i:i + 4]) for i in
+                       xrange(12, 12 + self.parameterCount[self.functionType] * 4,
+                              4)]
+
+    def apply(self, values):
+        """ Evaluate the curve for an array of values in the range 0..1 """
+        X = numpy.asarray(values, dtype=numpy.float64)
+        g, a, b, c, d, e, f = (self.params + [0.0] * 6)[:7]
+        if self.functionType == 0:
+            return numpy.power(numpy.maximum(X, 0.0), g)
+        Y = numpy.power(numpy.maximum(a * X + b, 0.0), g)
+        if self.functionType in (1, 2):
+            if self.functionType == 1:
+                c = 0.0
+            if a:
+                d = -b / a
+            return numpy.where(X >= d, Y + c, c)
+        if self.functionType == 3:
+            return numpy.where(X >= d, Y, c * X)
+        return numpy.where(X >= d, Y + e, c * X + f)
+
+    def apply_inverse(self, values, size=4096):
+        """
+        Evaluate the inverse curve for an array of values
+        
+        The curve is sampled at size points and inverted by interpolation.
+        Values outside the range of the curve are clipped.
+        
+        """
+        if self.functionType == 0:
+            return numpy.power(numpy.clip(values, 0.0, 1.0),
+                               1.0 / self.params[0])
+        # numpy.interp needs monotonically increasing sample points
+        x = numpy.linspace(0.0, 1.0, size)
+        return numpy.interp(values, numpy.maximum.accumulate(self.apply(x)),
+                            x)
+
+
 class s15Fixed16ArrayType(ICCProfileTag, list):
 
     def __init__(self, tagData=None, tagSignature=None):
@@ -1811,19 +2378,17 @@ class VideoCardGammaType(ICCProfileTag, ADict):
             data = list(vcgt['data'])
             while len(data) < 3:
                 data.append(data[0])
-            irange = range(0, vcgt['entryCount'])
-            for i in irange:
-                j = i * (255.0 / (vcgt['entryCount'] - 1))
-                linear_points += [[j, j]]
-                if r:
-                    n = float(data[0][i]) / (math.pow(256, vcgt['entrySize']) - 1) * 255
-                    r_points += [[j, n]]
-                if g:
-                    n = float(data[1][i]) / (math.pow(256, vcgt['entrySize']) - 1) * 255
-                    g_points += [[j, n]]
-                if b:
-                    n = float(data[2][i]) / (math.pow(256, vcgt['entrySize']) - 1) * 255
-                    b_points += [[j, n]]
+            entryCount = vcgt['entryCount']
+            j = numpy.arange(entryCount) * (255.0 / (entryCount - 1))
+            linear_points = numpy.column_stack((j, j)).tolist()
+            maxValue = math.pow(256, vcgt['entrySize']) - 1
+            for points, channel, use in ((r_points, data[0], r),
+                                         (g_points, data[1], g),
+                                         (b_points, data[2], b)):
+                if use:
+                    n = (numpy.asarray(channel[:entryCount],
+                                       dtype=numpy.float64) / maxValue * 255)
+                    points.extend(numpy.column_stack((j, n)).tolist())
         else: # formula
             irange = range(0, 256)
             step = 100.0 / 255.0
@@ -1944,6 +2509,17 @@ class VideoCardGammaFormulaType(VideoCardGammaType):
 
 class VideoCardGammaTableType(VideoCardGammaType):
 
+    """
+    Video card gamma table.
+    
+    data is a (channels, entryCount) array of the table entries. When
+    decoded from tag data, it is a read-only view of that data, so assign
+    a new array (or a list of channels) to data to change entries.
+    
+    """
+
+    dtypes = {1: ">u1", 2: ">u2", 4: ">u4", 8: ">u8"}
+
     def __init__(self, tagData, tagSignature):
         VideoCardGammaType.__init__(self, tagData, tagSignature)
         if not tagData:
@@ -1960,37 +2536,27 @@ class VideoCardGammaTableType(VideoCardGammaType):
             "channels": channels,
             "entryCount": entryCount,
             "entrySize": entrySize,
-            "data": []
+            "data": numpy.frombuffer(tagData, self.dtypes[entrySize],
+                                     channels * entryCount,
+                                     18).reshape(channels, entryCount)
         })
-        hex2int = {
-            1: uInt8Number,
-            2: uInt16Number,
-            4: uInt32Number,
-            8: uInt64Number
-        }
-        i = 0
-        while i < channels:
-            self.data.append([])
-            j = 0
-            while j < entryCount:
-                index = 6 + i * entryCount * entrySize + j * entrySize
-                self.data[i].append(hex2int[entrySize](data[index:index + 
-                                                            entrySize]))
-                j = j + 1
-            i = i + 1
+    
+    @staticmethod
+    def _round(values):
+        """ Round half away from zero like int(round()) """
+        return (numpy.sign(values) *
+                numpy.floor(numpy.abs(values) + 0.5)).astype(numpy.int64)
     
     def getNormalizedValues(self, amount=None):
         if amount is None:
             amount = self.entryCount
-        values = zip(*[[entry / 65535.0 for entry in channel] for channel in self.data])
+        values = numpy.asarray(self.data).T / 65535.0
         if amount <= self.entryCount:
             step = self.entryCount / float(amount - 1)
-            all = values
-            values = []
-            for i, value in enumerate(all):
-                if i == 0 or (i + 1) % step < 1 or i + 1 == self.entryCount:
-                    values += [value]
-        return values
+            i = numpy.arange(len(values))
+            values = values[(i == 0) | ((i + 1) % step < 1) |
+                            (i + 1 == self.entryCount)]
+        return map(tuple, values.tolist())
     
     def getFormulaType(self):
         """
@@ -2017,22 +2583,16 @@ class VideoCardGammaTableType(VideoCardGammaType):
         return VideoCardGammaFormulaType("".join(tagData), self.tagSignature)
     
     def resize(self, length=128):
-        data = [[], [], []]
-        for i, channel in enumerate(self.data):
-            for j in xrange(0, length):
-                j *= (len(channel) - 1) / float(length - 1)
-                if int(j) != j:
-                    floor = channel[int(math.floor(j))]
-                    ceil = channel[min(int(math.ceil(j)), len(channel) - 1)]
-                    interpolated = xrange(floor, ceil + 1)
-                    fraction = j - int(j)
-                    index = int(round(fraction * (ceil - floor)))
-                    v = interpolated[index]
-                else:
-                    v = channel[int(j)]
-                data[i].append(v)
-        self.data = data
-        self.entryCount = len(data[0])
+        data = numpy.asarray(self.data)
+        count = data.shape[-1]
+        j = numpy.arange(length) * ((count - 1) / float(length - 1))
+        floor = numpy.floor(j).astype(numpy.int64)
+        ceil = numpy.minimum(numpy.ceil(j).astype(numpy.int64), count - 1)
+        lower = data[:, floor].astype(numpy.int64)
+        upper = data[:, ceil].astype(numpy.int64)
+        # Step through the integer values between neighbouring entries
+        self.data = lower + self._round((j - floor) * (upper - lower))
+        self.entryCount = length
     
     def resized(self, length=128):
         resized = self.__class__(self.tagData, self.tagSignature)
@@ -2044,11 +2604,11 @@ class VideoCardGammaTableType(VideoCardGammaType):
         Smooth video LUT curves (Catmull-Rom).
         """
         resized = self.resized(length)
-        for i in xrange(0, len(self.data)):
-            step = float(length - 1) / (len(self.data[i]) - 1)
-            interpolation = CRInterpolation(resized.data[i])
-            for j in xrange(0, len(self.data[i])):
-                self.data[i][j] = int(round(interpolation(j * step)))
+        count = numpy.shape(self.data)[-1]
+        positions = numpy.arange(count) * (float(length - 1) / (count - 1))
+        self.data = numpy.array([
+            self._round(CRInterpolation(channel)(positions))
+            for channel in resized.data[:len(self.data)]])
     
     def smooth_avg(self, passes=1, window=None):
         """
@@ -2062,26 +2622,24 @@ class VideoCardGammaTableType(VideoCardGammaType):
         """
         if not window or len(window) < 3 or len(window) % 2 != 1:
             window = (1.0, 1.0, 1.0)
+        half = (len(window) - 1) / 2
         for x in xrange(0, passes):
-            data = [[], [], []]
-            for i, channel in enumerate(self.data):
-                for j, v in enumerate(channel):
-                    tmpwindow = window
-                    while j > 0 and j < len(channel) - 1 and len(tmpwindow) >= 3:
-                        tl = (len(tmpwindow) - 1) / 2
-                        # print j, tl, tmpwindow
-                        if tl > 0 and j - tl >= 0 and j + tl <= len(channel) - 1:
-                            windowslice = channel[j - tl:j + tl + 1]
-                            windowsize = 0
-                            for k, weight in enumerate(tmpwindow):
-                                windowsize += float(weight) * windowslice[k]
-                            v = int(round(windowsize / sum(tmpwindow)))
-                            break
-                        else:
-                            tmpwindow = tmpwindow[1:-1]
-                    data[i].append(v)
-            self.data = data
-            self.entryCount = len(data[0])
+            data = numpy.asarray(self.data)
+            smoothed = data.astype(numpy.int64)
+            count = data.shape[-1]
+            j = numpy.arange(count)
+            # Towards the ends, the window shrinks to fit. The first and
+            # last entries are left as they are.
+            reach = numpy.minimum(numpy.minimum(j, count - 1 - j), half)
+            for tl in xrange(1, half + 1):
+                index = j[reach == tl]
+                tmpwindow = window[half - tl:len(window) - (half - tl)]
+                windowsize = 0
+                for k, weight in enumerate(tmpwindow):
+                    windowsize += float(weight) * data[:, index - tl + k]
+                smoothed[:, index] = self._round(windowsize / sum(tmpwindow))
+            self.data = smoothed
+            self.entryCount = count
     
     @Property
     def tagData():
@@ -2095,15 +2653,16 @@ class VideoCardGammaTableType(VideoCardGammaType):
                        uInt16Number_tohex(len(self.data)),  # channels
                        uInt16Number_tohex(self.entryCount),
                        uInt16Number_tohex(self.entrySize)]
-            int2hex = {
-                1: uInt8Number_tohex,
-                2: uInt16Number_tohex,
-                4: uInt32Number_tohex,
-                8: uInt64Number_tohex
-            }
-            for channel in self.data:
-                for i in xrange(0, self.entryCount):
-                    tagData.append(int2hex[self.entrySize](channel[i]))
+            if len(self.data):
+                data = numpy.asarray(self.data)[:, :self.entryCount]
+                # Smoothing may overshoot the range of the entries, clip
+                # instead of letting the values wrap around. 8-byte entries
+                # can't overshoot the range of int64 at the top
+                vmax = (2 ** (8 * self.entrySize) - 1
+                        if self.entrySize < 8 else None)
+                data = numpy.clip(data, 0, vmax)
+                dtype = self.dtypes[self.entrySize]
+                tagData.append(data.astype(dtype).tostring())
             return "".join(tagData)
         
         def fset(self, tagData):
@@ -2276,6 +2835,7 @@ class XYZType(ICCProfileTag, XYZNumber):
 class chromaticAdaptionTag(colormath.Matrix3x3, s15Fixed16ArrayType):
     
     def __init__(self, tagData=None, tagSignature=None):
+        colormath.Matrix3x3.__init__(self)
         ICCProfileTag.__init__(self, tagData, tagSignature)
         if tagData:
             data = tagData[8:]
@@ -2307,6 +2867,73 @@ class chromaticAdaptionTag(colormath.Matrix3x3, s15Fixed16ArrayType):
         return locals()
 
 
+def namedColor2_dtype(deviceCoordCount):
+    """ Return the NumPy dtype of a namedColor2Type color record """
+    fields = [("rootName", "S32"), ("pcs", ">u2", (3, ))]
+    if deviceCoordCount:
+        fields.append(("device", ">u2", (deviceCoordCount, )))
+    return numpy.dtype(fields)
+
+
+def namedColor2_pcs_keys(pcs):
+    """ Return the PCS keys of named colors (XYZ unless pcs is 'Lab') """
+    if pcs == "Lab":
+        return ["L", "a", "b"]
+    return ["X", "Y", "Z"]
+
+
+def decode_namedColor2_pcs(pcsvalues, pcs):
+    """
+    Encoded 16-bit PCS values (array with a trailing axis of 3) -> L*a*b*
+    (L* 0..100, a* b* -128..127) or XYZ (0..100) as float64 array
+    
+    """
+    pcsvalues = numpy.asarray(pcsvalues, dtype=numpy.float64)
+    if pcs == "Lab":
+        return pcsvalues / 65536.0 * (100, 255, 255) - (0, 128, 128)
+    return pcsvalues / 32768.0 * 100
+
+
+def encode_namedColor2_pcs(values, pcs):
+    """ The inverse of decode_namedColor2_pcs (rounded and clipped) """
+    values = numpy.asarray(values, dtype=numpy.float64)
+    if pcs == "Lab":
+        values = (values + (0, 128, 128)) / (100, 255, 255) * 65536.0
+    else:
+        values = values / 100 * 32768.0
+    return numpy.clip(numpy.round(values), 0, 65535).astype(numpy.uint16)
+
+
+def decode_namedColor2(tagData, pcs=None):
+    """
+    Decode namedColor2Type tag data into columns.
+    
+    Return an ADict with the rootNames (array of byte strings), names
+    (list of unicode strings), pcsvalues (encoded, array of uint16),
+    pcs (decoded, see decode_namedColor2_pcs), device (array of uint16,
+    one row per color) and index (dict of name -> row) of all colors.
+    
+    """
+    colorCount = uInt32Number(tagData[12:16])
+    deviceCoordCount = uInt32Number(tagData[16:20])
+    records = numpy.frombuffer(tagData, namedColor2_dtype(deviceCoordCount),
+                               colorCount, 84)
+    rootNames = records["rootName"]
+    names = [unicode(rootName.strip("\0"), "latin-1")
+             for rootName in rootNames.tolist()]
+    pcsvalues = records["pcs"]
+    if deviceCoordCount:
+        device = records["device"]
+    else:
+        device = numpy.zeros((colorCount, 0), dtype=numpy.uint16)
+    # Later colors with the same name replace earlier ones, like in the
+    # NamedColor2Type dict
+    return ADict(rootNames=rootNames, names=names, pcsvalues=pcsvalues,
+                 pcs=decode_namedColor2_pcs(pcsvalues, pcs),
+                 device=device,
+                 index=dict(izip(names, xrange(colorCount))))
+
+
 class NamedColor2Value(object):
     
     def __init__(self, valueData="\0" * 38, deviceCoordCount=0, pcs="XYZ"):
@@ -2341,6 +2968,21 @@ class NamedColor2Value(object):
                         valueData[i:i+2]))
         self.device = tuple(deviceCoords)
     
+    @classmethod
+    def from_values(cls, rootName, pcsvalues, pcs, device=(), pcsname="XYZ"):
+        """
+        Create a named color from its name, encoded and decoded PCS values
+        and device coordinates (without parsing binary data).
+        
+        """
+        self = cls.__new__(cls)
+        self._pcsname = pcsname
+        self.rootName = rootName
+        self.pcsvalues = list(pcsvalues)
+        self.pcs = AODict(zip(namedColor2_pcs_keys(pcsname), pcs))
+        self.device = tuple(device)
+        return self
+    
     @property
     def name(self):
         return unicode(Text(self.rootName.strip('\0')), 'latin-1')
@@ -2364,11 +3006,11 @@ class NamedColor2Value(object):
         
         def fget(self):
             valueData = []
-            valueData.append(self.rootName.ljust(32))
+            valueData.append(self.rootName[:32].ljust(32, "\0"))
             valueData.extend(
                 [uInt16Number_tohex(pcsval) for pcsval in self.pcsvalues])
             valueData.extend(
-                [uInt16Number_tohex(pcsval) for deviceval in self.device])
+                [uInt16Number_tohex(deviceval) for deviceval in self.device])
             return "".join(valueData)
         
         def fset(self, tagData):
@@ -2403,38 +3045,152 @@ class NamedColor2ValueTuple(tuple):
 
 class NamedColor2Type(ICCProfileTag, OrderedDict):
     
+    """
+    namedColor2Type ('ncl2')
+    
+    A dict of NamedColor2Value objects by name. For bulk access, 'columns'
+    holds all colors as arrays (see decode_namedColor2), which are cached
+    until the tag changes (named colors should not be modified in place).
+    
+    """
+    
     REPR_OUTPUT_SIZE = 10
     
+    # All dict methods which change the tag are overridden to call changed()
+    cache_tagData = True
+    
     def __init__(self, tagData="\0" * 84, tagSignature=None, pcs=None):
         ICCProfileTag.__init__(self, tagData, tagSignature)
         OrderedDict.__init__(self)
         
         colorCount = uInt32Number(tagData[12:16])
         deviceCoordCount = uInt32Number(tagData[16:20])
-        stride = 38 + 2*deviceCoordCount
         
         self.vendorData = tagData[8:12]
-        self.colorCount = colorCount
         self.deviceCoordCount = deviceCoordCount
         self._prefix = Text(tagData[20:52])
         self._suffix = Text(tagData[52:84])
         self._pcsname = pcs
         
-        keys = []
-        values = []
         if colorCount > 0:
-            start = 84
-            end = start + (stride*colorCount)
-            for i in xrange(start, end, stride):
-                nc2 = NamedColor2Value(
-                    tagData[i:i+stride],
-                    deviceCoordCount, pcs=pcs)
-                keys.append(nc2.name)
-                values.append(nc2)
-        self.update(OrderedDict(zip(keys, values)))
+            columns = decode_namedColor2(tagData, pcs)
+            for rootName, name, pcsvalues, pcsvals, device in izip(
+                    columns.rootNames.tolist(), columns.names,
+                    columns.pcsvalues.tolist(), columns.pcs.tolist(),
+                    columns.device.tolist()):
+                self[name] = NamedColor2Value.from_values(rootName,
+                                                          pcsvalues,
+                                                          pcsvals, device,
+                                                          pcs)
+    
+    @classmethod
+    def from_arrays(cls, names, device, pcs, pcsname="XYZ", prefix="",
+                    suffix="", vendorData="\0" * 4, tagSignature="ncl2"):
+        """
+        Create a tag from a sequence of names, device coordinates (array
+        of one row per color) and PCS values (L*a*b* or XYZ 0..100 as per
+        pcsname, array of one row per color).
+        
+        All colors are packed into tag data at once.
+        
+        """
+        rootNames = [name.encode("latin-1") if isinstance(name, unicode)
+                     else name for name in names]
+        if isinstance(prefix, unicode):
+            prefix = prefix.encode("latin-1")
+        if isinstance(suffix, unicode):
+            suffix = suffix.encode("latin-1")
+        device = numpy.asarray(device, dtype=numpy.float64)
+        if device.ndim != 2:
+            device = device.reshape(len(rootNames), -1 if rootNames else 0)
+        pcs = numpy.asarray(pcs, dtype=numpy.float64).reshape(-1, 3)
+        if len(pcs) != len(rootNames):
+            raise ICCProfileInvalidError("Can't add %i namedColor2 with %i "
+                                         "PCS coordinates" % (len(rootNames),
+                                                              len(pcs)))
+        for rootName in rootNames:
+            if len(rootName) > 31:
+                raise ICCProfileInvalidError("namedColor2 name too long: "
+                                             "'%s'" % rootName)
+        if len(set(rootNames)) != len(rootNames):
+            seen = set()
+            for rootName in rootNames:
+                if rootName in seen:
+                    raise ICCProfileInvalidError("Can't add namedColor2 with "
+                                                 "existant name: '%s'" %
+                                                 rootName)
+                seen.add(rootName)
+        deviceCoordCount = device.shape[1]
+        records = numpy.zeros(len(rootNames),
+                              namedColor2_dtype(deviceCoordCount))
+        records["rootName"] = rootNames
+        records["pcs"] = encode_namedColor2_pcs(pcs, pcsname)
+        if deviceCoordCount:
+            records["device"] = numpy.clip(numpy.round(device), 0, 65535)
+        tagData = "".join(["ncl2", "\0" * 4, vendorData,
+                           uInt32Number_tohex(len(records)),
+                           uInt32Number_tohex(deviceCoordCount),
+                           prefix[:32].ljust(32, "\0"),
+                           suffix[:32].ljust(32, "\0"),
+                           records.tostring()])
+        tag = cls(tagData, tagSignature, pcsname)
+        # Unchanged tags are written back as created
+        tag.__dict__["_tagData"] = tagData
+        return tag
     
     def __setattr__(self, name, value):
         object.__setattr__(self, name, value)
+        self.changed()
+    
+    def __delitem__(self, key):
+        OrderedDict.__delitem__(self, key)
+        self.changed()
+    
+    def __setitem__(self, key, value):
+        OrderedDict.__setitem__(self, key, value)
+        self.changed()
+    
+    def __setslice__(self, i, j, iterable):
+        OrderedDict.__setslice__(self, i, j, iterable)
+        self.changed()
+    
+    def clear(self):
+        OrderedDict.clear(self)
+        self.changed()
+    
+    def insert(self, i, key, value):
+        OrderedDict.insert(self, i, key, value)
+        self.changed()
+    
+    def pop(self, key, *args):
+        value = OrderedDict.pop(self, key, *args)
+        self.changed()
+        return value
+    
+    def reverse(self):
+        OrderedDict.reverse(self)
+        self.changed()
+    
+    def sort(self, *args, **kwargs):
+        OrderedDict.sort(self, *args, **kwargs)
+        self.changed()
+    
+    def changed(self):
+        ICCProfileTag.changed(self)
+        self.__dict__.pop("_columns", None)
+    
+    @property
+    def colorCount(self):
+        return len(self)
+    
+    @property
+    def columns(self):
+        """ All colors as arrays, see decode_namedColor2 """
+        columns = self.__dict__.get("_columns")
+        if columns is None:
+            columns = self.__dict__["_columns"] = decode_namedColor2(
+                self.get_tagData(), self._pcsname)
+        return columns
     
     @property
     def prefix(self):
@@ -2449,12 +3205,7 @@ class NamedColor2Type(ICCProfileTag, OrderedDict):
         return NamedColor2ValueTuple(self.values())
     
     def add_color(self, rootName, *deviceCoordinates, **pcsCoordinates):
-        if self._pcsname == "Lab":
-            keys = ["L", "a", "b"]
-        elif self._pcsname == "XYZ":
-            keys = ["X", "Y", "Z"]
-        else:
-            keys = ["X", "Y", "Z"]
+        keys = namedColor2_pcs_keys(self._pcsname)
         
         if not set(pcsCoordinates.keys()).issuperset(set(keys)):
             raise ICCProfileInvalidError("Can't add namedColor2 without all 3 PCS coordinates: '%s'" %
@@ -2464,28 +3215,14 @@ class NamedColor2Type(ICCProfileTag, OrderedDict):
             raise ICCProfileInvalidError("Can't add namedColor2 without all %s device coordinates (called with %s)" % (
                 self.deviceCoordCount, len(deviceCoordinates)))
         
-        nc2value = NamedColor2Value()
-        nc2value._pcsname = self._pcsname
-        nc2value.rootName = rootName
+        pcs = [pcsCoordinates[key] for key in keys]
+        nc2value = NamedColor2Value.from_values(
+            rootName, encode_namedColor2_pcs(pcs, self._pcsname).tolist(),
+            pcs, copy(deviceCoordinates), self._pcsname)
         
-        if rootName in self.keys():
+        if nc2value.name in self:
             raise ICCProfileInvalidError("Can't add namedColor2 with existant name: '%s'" % rootName)
         
-        nc2value.device = tuple(copy(deviceCoordinates))
-        nc2value.pcs = AODict(copy(pcsCoordinates))
-        pcsvalues = list()
-        
-        print nc2value.pcs
-        
-        for idx, key in enumerate(keys):
-            val = nc2value.pcs[key]
-            if key == "L":
-                nc2value.pcsvalues[idx] = val * 65536 / 100.0
-            elif key in ("a", "b"):
-                nc2value.pcsvalues[idx] = (val * 65536 / 255.0) + 128
-            elif key in ("X", "Y", "Z"):
-                nc2value.pcsvalues[idx] = val * 32768 / 100.00
-        
         self[nc2value.name] = nc2value
     
     def __repr__(self):
@@ -2501,9 +3238,10 @@ class NamedColor2Type(ICCProfileTag, OrderedDict):
         def fget(self):
             tagData = ["ncl2", "\0" * 4,
                 self.vendorData,
-                uInt32Number_tohex(len(self.items())),
+                uInt32Number_tohex(len(self)),
                 uInt32Number_tohex(self.deviceCoordCount),
-                self._prefix.ljust(32), self._suffix.ljust(32)]
+                self._prefix[:32].ljust(32, "\0"),
+                self._suffix[:32].ljust(32, "\0")]
             tagData.append(self.colorValues.tagData)
             return "".join(tagData)
         
@@ -2524,10 +3262,15 @@ typeSignature2Type = {
     "desc": TextDescriptionType,  # ICC v2
     "dict": DictType,  # ICC v2 + v4
     "dtim": DateTimeType,
+    "mAB ": LUTAtoBType,  # ICC v4
+    "mBA ": LUTBtoAType,  # ICC v4
     "meas": MeasurementType,
+    "mft1": LUT8Type,
+    "mft2": LUT16Type,
     "mluc": MultiLocalizedUnicodeType,  # ICC v4
     "mmod": MakeAndModelType,  # Apple private tag
     "ncl2": NamedColor2Type,
+    "para": ParametricCurveType,  # ICC v4
     "sf32": s15Fixed16ArrayType,
     "sig ": SignatureType,
     "text": TextType,
@@ -2537,6 +3280,42 @@ typeSignature2Type = {
 }
 
 
+def decode_tag(tagData, tagSignature, tagDataOffset=0,
+               connectionColorSpace=None, profile=None):
+    """
+    Create a tag object from raw tag data.
+    
+    The tag class is chosen by tag signature (tagSignature2Tag) or type
+    signature (typeSignature2Type), falling back to a generic ICCProfileTag.
+    tagDataOffset is only used for error messages.
+    
+    """
+    typeSignature = tagData[:4]
+    if debug: print "    typeSignature:", typeSignature
+    try:
+        if tagSignature in tagSignature2Tag:
+            return tagSignature2Tag[tagSignature](tagData, tagSignature)
+        elif typeSignature in typeSignature2Type:
+            args = tagData, tagSignature
+            if typeSignature in ("clrt", "ncl2"):
+                args += (connectionColorSpace, )
+            elif typeSignature == "XYZ ":
+                args += (profile, )
+            tag = typeSignature2Type[typeSignature](*args)
+        else:
+            return ICCProfileTag(tagData, tagSignature)
+    except Exception, exception:
+        raise ICCProfileInvalidError("Couldn't parse tag %r (type %r, offet %i, size %i): %r" % (tagSignature,
+                                                                                                 typeSignature,
+                                                                                                 tagDataOffset,
+                                                                                                 len(tagData),
+                                                                                                 exception))
+    if isinstance(tag, ICCProfileTag) and tag.cache_tagData:
+        # Unchanged tags are written back as read
+        tag.__dict__["_tagData"] = tagData
+    return tag
+
+
 class ICCProfileInvalidError(IOError):
     pass
 
@@ -2552,9 +3331,15 @@ class ICCProfile:
     loading of the tags will be deferred to when they are accessed the
     first time.
     
+    If the 'lazy' keyword argument is True (default False), a profile file
+    is memory-mapped instead of read, and only the header and tag table are
+    parsed initially. Each tag is decoded when it is accessed the first
+    time (see LazyTagDict), which makes reading a few tags of many
+    profiles a lot cheaper. Implies load=False.
+    
     """
 
-    def __init__(self, profile=None, load=True):
+    def __init__(self, profile=None, load=True, lazy=False):
         self.ID = "\0" * 16
         self._data = ""
         self._file = None
@@ -2574,16 +3359,7 @@ class ICCProfile:
                         not os.path.sep in profile and
                         (not isinstance(os.path.altsep, basestring) or
                          not os.path.altsep in profile)):
-                        for path in iccprofiles_home + filter(lambda x: 
-                            x not in iccprofiles_home, iccprofiles):
-                            if os.path.isdir(path):
-                                for path, dirs, files in os.walk(path):
-                                    path = os.path.join(path, profile)
-                                    if os.path.isfile(path):
-                                        profile = path
-                                        break
-                                if os.path.isfile(path):
-                                    break
+                        profile = profile_index.find(profile) or profile
                     profile = open(profile, "rb")
                 else: # binary string
                     data = profile
@@ -2592,7 +3368,15 @@ class ICCProfile:
                 self._file = profile
                 self.fileName = self._file.name
                 self._file.seek(0)
-                data = self._file.read(128)
+                if lazy:
+                    try:
+                        data = mmap.mmap(self._file.fileno(), 0,
+                                         access=mmap.ACCESS_READ)
+                    except (AttributeError, EnvironmentError, ValueError):
+                        # Not a real file, or empty
+                        data = self._file.read()
+                else:
+                    data = self._file.read(128)
                 self.close()
             
             if not data or len(data) < 128:
@@ -2638,9 +3422,12 @@ class ICCProfile:
             if header[84:100] != "\0" * 16:
                 self.ID = header[84:100]
             
-            self._data = data[:self.size]
+            if lazy:
+                self._index_tags(data)
+            else:
+                self._data = data[:self.size]
             
-            if load:
+            if load and not lazy:
                 self.tags
         else:
             # Default to RGB display device profile
@@ -2680,31 +3467,37 @@ class ICCProfile:
         
         """
         # Assemble tag table and tag data
-        tagCount = len(self.tags)
+        tags = self.tags
+        tagCount = len(tags)
         tagTable = []
         tagTableSize = tagCount * 12
         tagsData = []
-        tagsDataOffset = []
+        tagsDataOffset = {}
         tagDataOffset = 128 + 4 + tagTableSize
-        for tagSignature in self.tags:
-            tagData = self.tags[tagSignature].tagData
+        for tagSignature in tags:
+            if isinstance(tags, LazyTagDict):
+                # Don't decode tags just to encode them again
+                tagData = tags.tagData(tagSignature)
+            else:
+                tagData = tags[tagSignature].get_tagData()
             tagDataSize = len(tagData)
             # Pad all data with binary zeros so it lies on 4-byte boundaries
-            padding = int(math.ceil(tagDataSize / 4.0)) * 4 - tagDataSize
+            padding = -tagDataSize % 4
             tagData += "\0" * padding
             tagTable.append(tagSignature)
-            if tagData in tagsData:
-                tagTable.append(uInt32Number_tohex(tagsDataOffset[tagsData.index(tagData)]))
+            if tagData in tagsDataOffset:
+                # Shared tag
+                tagTable.append(uInt32Number_tohex(tagsDataOffset[tagData]))
             else:
                 tagTable.append(uInt32Number_tohex(tagDataOffset))
-            tagTable.append(uInt32Number_tohex(tagDataSize))
-            if not tagData in tagsData:
                 tagsData.append(tagData)
-                tagsDataOffset.append(tagDataOffset)
+                tagsDataOffset[tagData] = tagDataOffset
                 tagDataOffset += tagDataSize + padding
-        header = self.header(tagTableSize, len("".join(tagsData)))
+            tagTable.append(uInt32Number_tohex(tagDataSize))
+        tagsData = "".join(tagsData)
+        header = self.header(tagTableSize, len(tagsData))
         data = "".join([header, uInt32Number_tohex(tagCount), 
-                        "".join(tagTable), "".join(tagsData)])
+                        "".join(tagTable), tagsData])
         return data
     
     def header(self, tagTableSize, tagDataSize):
@@ -2752,70 +3545,77 @@ class ICCProfile:
             self.load()
             if self._data and len(self._data) > 131:
                 # tag table and tagged element data
-                tagCount = uInt32Number(self._data[128:132])
-                if debug: print "tagCount:", tagCount
-                tagTable = self._data[132:132 + tagCount * 12]
-                discard_len = 0
                 tags = {}
-                while tagTable:
-                    tag = tagTable[:12]
-                    if len(tag) < 12:
-                        raise ICCProfileInvalidError("Tag table is truncated")
-                    tagSignature = tag[:4]
-                    if debug: print "tagSignature:", tagSignature
-                    tagDataOffset = uInt32Number(tag[4:8])
-                    if debug: print "    tagDataOffset:", tagDataOffset
-                    tagDataSize = uInt32Number(tag[8:12])
-                    if debug: print "    tagDataSize:", tagDataSize
-                    if tagSignature in self._tags:
-                        safe_print("Error (non-critical): Tag '%s' already "
-                                   "encountered. Skipping..." % tagSignature)
+                for (tagSignature, tagDataOffset,
+                     tagDataSize) in self._read_tag_table(self._data):
+                    if (tagDataOffset, tagDataSize) in tags:
+                        if debug: print "    tagDataOffset and tagDataSize indicate shared tag"
+                        self._tags[tagSignature] = tags[(tagDataOffset, tagDataSize)]
                     else:
-                        if (tagDataOffset, tagDataSize) in tags:
-                            if debug: print "    tagDataOffset and tagDataSize indicate shared tag"
-                            self._tags[tagSignature] = tags[(tagDataOffset, tagDataSize)]
-                        else:
-                            start = tagDataOffset - discard_len
-                            if debug: print "    tagData start:", start
-                            end = tagDataOffset - discard_len + tagDataSize
-                            if debug: print "    tagData end:", end
-                            tagData = self._data[start:end]
-                            if len(tagData) < tagDataSize:
-                                raise ICCProfileInvalidError("Tag data for tag %r (offet %i, size %i) is truncated" % (tagSignature,
-                                                                                                                       tagDataOffset,
-                                                                                                                       tagDataSize))
-                            ##self._data = self._data[:128] + self._data[end:]
-                            ##discard_len += tagDataOffset - 128 - discard_len + tagDataSize
-                            ##if debug: print "    discard_len:", discard_len
-                            typeSignature = tagData[:4]
-                            if len(typeSignature) < 4:
-                                raise ICCProfileInvalidError("Tag type signature for tag %r (offet %i, size %i) is truncated" % (tagSignature,
-                                                                                                                                 tagDataOffset,
-                                                                                                                                 tagDataSize))
-                            if debug: print "    typeSignature:", typeSignature
-                            try:
-                                if tagSignature in tagSignature2Tag:
-                                    tag = tagSignature2Tag[tagSignature](tagData, tagSignature)
-                                elif typeSignature in typeSignature2Type:
-                                    args = tagData, tagSignature
-                                    if typeSignature in ("clrt", "ncl2"):
-                                        args += (self.connectionColorSpace, )
-                                    elif typeSignature == "XYZ ":
-                                        args += (self, )
-                                    tag = typeSignature2Type[typeSignature](*args)
-                                else:
-                                    tag = ICCProfileTag(tagData, tagSignature)
-                            except Exception, exception:
-                                raise ICCProfileInvalidError("Couldn't parse tag %r (type %r, offet %i, size %i): %r" % (tagSignature,
-                                                                                                                         typeSignature,
-                                                                                                                         tagDataOffset,
-                                                                                                                         tagDataSize,
-                                                                                                                         exception))
-                            self._tags[tagSignature] = tags[(tagDataOffset, tagDataSize)] = tag
-                    tagTable = tagTable[12:]
+                        tagData = self._data[tagDataOffset:tagDataOffset + tagDataSize]
+                        tag = decode_tag(tagData, tagSignature, tagDataOffset,
+                                         self.connectionColorSpace, self)
+                        self._tags[tagSignature] = tags[(tagDataOffset, tagDataSize)] = tag
                 self._data = self._data[:128]
         return self._tags
     
+    def _index_tags(self, data):
+        """
+        Index the tag table of data without decoding the tags.
+        
+        data may be a string or a memory map. Tags are kept as zero-copy
+        buffers of data until they are accessed.
+        
+        """
+        self._tags = LazyTagDict()
+        self._tags._profile = weakref.ref(self)
+        self._tags.connectionColorSpace = self.connectionColorSpace
+        if len(data) > 131:
+            for (tagSignature, tagDataOffset,
+                 tagDataSize) in self._read_tag_table(data):
+                self._tags.add_raw(tagSignature, tagDataOffset,
+                                   buffer(data, tagDataOffset, tagDataSize))
+        self._data = data[:128]
+        self.is_loaded = True
+    
+    def _read_tag_table(self, data):
+        """
+        Iterate over the tag table in data.
+        
+        Yields (tagSignature, tagDataOffset, tagDataSize) tuples.
+        Duplicate tag signatures are skipped.
+        
+        """
+        tagCount = uInt32Number(data[128:132])
+        if debug: print "tagCount:", tagCount
+        tagTable = data[132:132 + tagCount * 12]
+        dataSize = min(len(data), self.size)
+        seen = set()
+        for i in xrange(0, len(tagTable), 12):
+            tag = tagTable[i:i + 12]
+            if len(tag) < 12:
+                raise ICCProfileInvalidError("Tag table is truncated")
+            tagSignature = tag[:4]
+            if debug: print "tagSignature:", tagSignature
+            tagDataOffset = uInt32Number(tag[4:8])
+            if debug: print "    tagDataOffset:", tagDataOffset
+            tagDataSize = uInt32Number(tag[8:12])
+            if debug: print "    tagDataSize:", tagDataSize
+            if tagSignature in seen:
+                safe_print("Error (non-critical): Tag '%s' already "
+                           "encountered. Skipping..." % tagSignature)
+                continue
+            seen.add(tagSignature)
+            if tagDataOffset + tagDataSize > dataSize:
+                raise ICCProfileInvalidError("Tag data for tag %r (offet %i, size %i) is truncated" % (tagSignature,
+                                                                                                       tagDataOffset,
+                                                                                                       tagDataSize))
+            if tagDataSize < 4:
+                raise ICCProfileInvalidError("Tag type signature for tag %r (offet %i, size %i) is truncated" % (tagSignature,
+                                                                                                                 tagDataOffset,
+                                                                                                                 tagDataSize))
+            yield tagSignature, tagDataOffset, tagDataSize
+    
     def calculateID(self, setID=True):
         """
         Calculates, sets, and returns the profile's ID (checksum).
@@ -2830,10 +3630,15 @@ class ICCProfile:
         temporarily replaced with zeros.
         
         """
-        data = self.data[:44] + "\0\0\0\0" + self.data[48:64] + "\0\0\0\0" + \
-               self.data[68:84] + "\0\0\0\0\0\0\0\0\0\0\0\0\0\0\0\0" + \
-               self.data[100:]
-        ID = md5(data).digest()
+        data = self.data
+        checksum = md5(data[:44])
+        checksum.update("\0" * 4)
+        checksum.update(data[48:64])
+        checksum.update("\0" * 4)
+        checksum.update(data[68:84])
+        checksum.update("\0" * 16)
+        checksum.update(buffer(data, 100))
+        ID = checksum.digest()
         if setID:
             self.ID = ID
         return ID
@@ -3171,7 +3976,7 @@ class ICCProfile:
                 info["    Device (Native) Coordinates"] = "%i per value" % (
                     tag.deviceCoordCount,)
                 info["    Contents"] = "%i colors (%i bytes) " % (
-                    tag.colorCount, len(tag.tagData))
+                    tag.colorCount, len(tag.get_tagData()))
                 i = 1
                 for k, v in tag.iteritems():
                     pcsout = devout = " "
@@ -3405,11 +4210,277 @@ class ICCProfile:
                     self.close()
             stream_or_filename = self.fileName
         if isinstance(stream_or_filename, basestring):
+            data = self.data
+            if (isinstance(self._tags, LazyTagDict) and self.fileName and
+                os.path.normcase(os.path.abspath(stream_or_filename)) ==
+                os.path.normcase(os.path.abspath(self.fileName))):
+                # Overwriting the memory-mapped file
+                self._tags.detach()
             stream = open(stream_or_filename, "wb")
             if not self.fileName:
                 self.fileName = stream_or_filename
         else:
+            data = self.data
             stream = stream_or_filename
-        stream.write(self.data)
+        stream.write(data)
         if isinstance(stream_or_filename, basestring):
             stream.close()
+
+
+class ProfileIndex(object):
+
+    """
+    Persistent index of the ICC profiles in a list of directories.
+    
+    Profiles are indexed by file name, profile ID, description, tag
+    signatures and a few header fields. The index is stored as JSON and
+    kept fresh by directory modification times, so only directories whose
+    contents changed since the last update are listed and only new or
+    changed files are read (lazily, see ICCProfile).
+    
+    The index file is shared by all indexes using it, each one only
+    updating the directories below its own paths.
+    
+    Paths are kept as unicode, byte strings are decoded with the
+    filesystem encoding, so lookups match the keys read back from JSON.
+    
+    """
+
+    # Minimum time in seconds between checks of the directory mtimes
+    refresh_interval = 10
+
+    # Minimum time in seconds between checks when find() misses
+    miss_interval = 1
+
+    def __init__(self, paths=None, filename=None):
+        if paths is None:
+            paths = iccprofiles_home + filter(lambda x: 
+                x not in iccprofiles_home, iccprofiles)
+        if filename is None:
+            filename = profile_index_filename
+        self.paths = [safe_unicode(path, fs_enc) for path in paths]
+        self.filename = filename
+        self._dirs = None
+        self._names = {}
+        self._info = {}
+        self._IDs = {}
+        self._descriptions = {}
+        self._updated = 0
+
+    def _load(self):
+        self._dirs = {}
+        if self.filename and os.path.isfile(self.filename):
+            try:
+                with open(self.filename, "rb") as index_file:
+                    dirs = json.load(index_file)
+            except (EnvironmentError, ValueError), exception:
+                safe_print("Warning - couldn't read profile index:",
+                           safe_unicode(exception))
+            else:
+                if isinstance(dirs, dict):
+                    self._dirs = dirs
+
+    def _save(self):
+        if not self.filename:
+            return
+        tmp_filename = None
+        try:
+            dirname = os.path.dirname(self.filename)
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            # Write to a unique temporary file so concurrent processes
+            # updating the index don't clobber each other's output
+            fd, tmp_filename = tempfile.mkstemp(".tmp", "", dirname)
+            with os.fdopen(fd, "wb") as index_file:
+                json.dump(self._dirs, index_file)
+            if sys.platform == "win32" and os.path.isfile(self.filename):
+                os.remove(self.filename)
+            os.rename(tmp_filename, self.filename)
+        except (EnvironmentError, ValueError), exception:
+            # ValueError includes UnicodeDecodeError for byte string paths
+            # which are not valid UTF-8
+            safe_print("Warning - couldn't write profile index:",
+                       safe_unicode(exception))
+            if tmp_filename and os.path.isfile(tmp_filename):
+                try:
+                    os.remove(tmp_filename)
+                except EnvironmentError:
+                    pass
+
+    def _scan(self, dirname):
+        """
+        Update the index for dirname and its subdirectories.
+        
+        Return whether anything changed.
+        
+        """
+        try:
+            mtime = os.stat(dirname).st_mtime
+        except EnvironmentError:
+            return self._dirs.pop(dirname, None) is not None
+        changed = False
+        entry = self._dirs.get(dirname)
+        if not entry or entry["mtime"] != mtime:
+            profiles = entry["profiles"] if entry else {}
+            entry = {"mtime": mtime, "dirs": [], "profiles": {}}
+            for name in sorted(os.listdir(dirname)):
+                if not isinstance(name, unicode):
+                    # Not decodable with the filesystem encoding
+                    continue
+                path = os.path.join(dirname, name)
+                if os.path.isdir(path):
+                    if not os.path.islink(path):
+                        # Don't follow symlinks, like os.walk
+                        entry["dirs"].append(path)
+                elif os.path.isfile(path):
+                    entry["profiles"][name] = self._get_info(path,
+                                                             profiles.get(name))
+            self._dirs[dirname] = entry
+            changed = True
+        for subdir in entry["dirs"]:
+            changed = self._scan(subdir) or changed
+        return changed
+
+    def _get_info(self, path, info=None):
+        """
+        Return the index entry for the file at path.
+        
+        info is the previous entry, which is returned unchanged if the
+        file's size and mtime are the same. Files which are not valid
+        profiles get an entry of None.
+        
+        """
+        stat = os.stat(path)
+        if info and info["size"] == stat.st_size and info["mtime"] == stat.st_mtime:
+            return info
+        try:
+            profile = ICCProfile(path, lazy=True)
+            description = profile.getDescription()
+        except (EnvironmentError, ICCProfileInvalidError):
+            return None
+        ID = profile.ID if profile.ID != "\0" * 16 else ""
+        # Signatures are decoded as Latin-1 so arbitrary bytes survive JSON
+        return {"size": stat.st_size,
+                "mtime": stat.st_mtime,
+                "ID": binascii.hexlify(ID),
+                "description": description,
+                "version": profile.version,
+                "profileClass": profile.profileClass.decode("latin-1"),
+                "colorSpace": profile.colorSpace.decode("latin-1"),
+                "connectionColorSpace":
+                    profile.connectionColorSpace.decode("latin-1"),
+                "creator": profile.creator.decode("latin-1"),
+                "manufacturer": profile.device["manufacturer"].decode("latin-1"),
+                "model": profile.device["model"].decode("latin-1"),
+                "tags": [tagSignature.decode("latin-1")
+                         for tagSignature in profile.tags]}
+
+    def _walk(self, dirname, seen):
+        """ Yield (path, info) for dirname and its subdirectories """
+        entry = self._dirs.get(dirname)
+        if not entry or dirname in seen:
+            return
+        seen.add(dirname)
+        for name in sorted(entry["profiles"]):
+            info = entry["profiles"][name]
+            if info:
+                yield os.path.join(dirname, name), info
+        for subdir in entry["dirs"]:
+            for item in self._walk(subdir, seen):
+                yield item
+
+    def find(self, name):
+        """
+        Return the path of the first profile with file name name, or None.
+        
+        Paths are searched in order, like ICCProfile did with os.walk.
+        
+        """
+        self.update()
+        name = safe_unicode(name, fs_enc)
+        path = self._names.get(name)
+        if ((not path or not os.path.isfile(path)) and
+            time() - self._updated >= self.miss_interval):
+            # Profile may have been installed or removed since last update
+            self.update(True)
+            path = self._names.get(name)
+        return path
+
+    def _items(self):
+        items = []
+        seen = set()
+        for path in self.paths:
+            items.extend(self._walk(path, seen))
+        return items
+
+    def items(self):
+        """ Return a list of (path, info) for all indexed profiles """
+        self.update()
+        return self._items()
+
+    def query(self, **criteria):
+        """
+        Return a list of (path, info) for profiles matching all criteria.
+        
+        Criteria are index entry fields, e.g. ID (hex), description,
+        profileClass, colorSpace, creator or version. For 'tags', a
+        tag signature matches profiles which contain the tag.
+        
+        """
+        self.update()
+        if "ID" in criteria:
+            items = [(path, self._info[path])
+                     for path in self._IDs.get(criteria["ID"], [])]
+        elif "description" in criteria:
+            items = [(path, self._info[path]) for path in
+                     self._descriptions.get(criteria["description"], [])]
+        else:
+            items = self._items()
+        results = []
+        for path, info in items:
+            for key, value in criteria.iteritems():
+                if key == "tags":
+                    if value not in info["tags"]:
+                        break
+                elif info.get(key) != value:
+                    break
+            else:
+                results.append((path, info))
+        return results
+
+    def update(self, force=False):
+        """
+        Update the index if any of the directories changed.
+        
+        Directory mtimes are checked at most every refresh_interval seconds
+        unless force is True.
+        
+        """
+        now = time()
+        if not force and now - self._updated < self.refresh_interval:
+            return
+        if self._dirs is None:
+            self._load()
+        changed = False
+        for path in self.paths:
+            changed = self._scan(path) or changed
+        self._updated = now
+        if changed or not self._names:
+            self._names = {}
+            self._info = {}
+            self._IDs = {}
+            self._descriptions = {}
+            for path, info in self._items():
+                self._names.setdefault(os.path.basename(path), path)
+                self._info[path] = info
+                if info["ID"]:
+                    self._IDs.setdefault(info["ID"], []).append(path)
+                self._descriptions.setdefault(info["description"],
+                                              []).append(path)
+        if changed:
+            self._save()
+
+
+profile_index_filename = os.path.join(appdata, appname, "profile_index.json")
+
+profile_index = ProfileIndex()
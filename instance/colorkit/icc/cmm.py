@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+
+"""
+In-process color management.
+
+Builds transforms from ICC profiles and applies them to whole NumPy arrays
+at once, as a replacement for piping values through Argyll's xicclu.
+The options mirror those of xicclu:
+
+    direction   'f' = device -> PCS (xicclu -ff), 'b' = PCS -> device (-fb)
+    intent      'a' = absolute colorimetric, 'r' = relative colorimetric,
+                'p' = perceptual, 's' = saturation (-i)
+    pcs         'x' = XYZ (0..1), 'l' = Lab (-p). Defaults to the
+                profile connection space
+    scale       device values are in the range 0..scale (-s)
+
+LUT-based profiles (lut8Type, lut16Type, lutAtoBType and lutBtoAType tags)
+are supported, as are matrix/TRC (shaper) RGB profiles and grayscale TRC
+profiles. Other profiles, or LUT tags of other types, raise
+NotImplementedError.
+
+"""
+
+import numpy
+
+import colormath
+import ICCProfile as ICCP
+
+
+# The LUT tags xicclu uses for a direction and intent, in order of preference
+lut_tags = {("f", "a"): ("A2B1", "A2B0"),
+            ("f", "r"): ("A2B1", "A2B0"),
+            ("f", "p"): ("A2B0", ),
+            ("f", "s"): ("A2B2", "A2B0"),
+            ("b", "a"): ("B2A1", "B2A0"),
+            ("b", "r"): ("B2A1", "B2A0"),
+            ("b", "p"): ("B2A0", ),
+            ("b", "s"): ("B2A2", "B2A0")}
+
+
+def curve_lookup(curve, values, inverse=False):
+    """
+    Apply a CurveType or ParametricCurveType, or its inverse, to values in
+    the range 0..1.
+    
+    Values outside the range of the curve are clipped.
+    
+    """
+    if inverse:
+        return curve.apply_inverse(values)
+    return curve.apply(values)
+
+
+class Transform(object):
+
+    """
+    Transform device values to PCS or vice versa through an ICC profile.
+
+    Call the transform with an array of values (trailing axis = number of
+    channels) to get the transformed array. interpolation is used for the
+    color lookup table of LUT-based profiles, see ICCP.LUTType.apply.
+
+    """
+
+    def __init__(self, profile, direction="f", intent="r", pcs=None,
+                 scale=1.0, interpolation="tetrahedral"):
+        if direction not in ("f", "b"):
+            raise ValueError("Invalid direction %r" % direction)
+        if intent not in ("a", "r", "p", "s"):
+            raise ValueError("Invalid intent %r" % intent)
+        self.connection = profile.connectionColorSpace
+        if not pcs:
+            pcs = {"Lab": "l"}.get(self.connection, "x")
+        if pcs not in ("l", "x"):
+            raise ValueError("Invalid PCS %r" % pcs)
+        self.direction = direction
+        self.intent = intent
+        self.pcs = pcs
+        self.scale = float(scale)
+        self.interpolation = interpolation
+        self.lut = self.matrix = self.trc = None
+        tags = profile.tags
+        for tagSignature in lut_tags[(direction, intent)]:
+            if tagSignature in tags:
+                self.lut = tags[tagSignature]
+                if not isinstance(self.lut, ICCP.LUTType):
+                    raise NotImplementedError("Unsupported %s tag type %r" %
+                                              (tagSignature,
+                                               self.lut.tagData[:4]))
+                self.method = tagSignature
+                break
+        if self.lut is not None:
+            if direction == "f":
+                self.device_channels = self.lut.inputChannels
+                pcs_channels = self.lut.outputChannels
+            else:
+                self.device_channels = self.lut.outputChannels
+                pcs_channels = self.lut.inputChannels
+            if pcs_channels != 3 or self.connection not in ("Lab", "XYZ"):
+                raise NotImplementedError("Unsupported profile connection "
+                                          "space %s" % self.connection)
+        elif (profile.colorSpace == "RGB" and
+              all(tagSignature in tags for tagSignature in
+                  ("rXYZ", "gXYZ", "bXYZ", "rTRC", "gTRC", "bTRC"))):
+            self.trc = [tags.rTRC, tags.gTRC, tags.bTRC]
+            self.matrix = numpy.array([[tags.rXYZ.X, tags.gXYZ.X, tags.bXYZ.X],
+                                       [tags.rXYZ.Y, tags.gXYZ.Y, tags.bXYZ.Y],
+                                       [tags.rXYZ.Z, tags.gXYZ.Z, tags.bXYZ.Z]])
+            self.method = "Matrix"
+        elif profile.colorSpace == "GRAY" and "kTRC" in tags:
+            self.trc = [tags.kTRC]
+            self.method = "Gray"
+        else:
+            raise NotImplementedError("Unsupported profile (%s, %s)" %
+                                      (profile.profileClass,
+                                       profile.colorSpace))
+        if self.trc:
+            for trc in self.trc:
+                if not isinstance(trc, (ICCP.CurveType,
+                                        ICCP.ParametricCurveType)):
+                    raise NotImplementedError("Unsupported tone response "
+                                              "curve type %r" %
+                                              trc.tagData[:4])
+            self.device_channels = len(self.trc)
+        self.pcs_white = tuple(profile.illuminant.values())
+        if intent == "a":
+            self.absolute = numpy.array(self.get_absolute_matrix(profile))
+        else:
+            self.absolute = None
+        if direction == "f":
+            self.input_channels, self.output_channels = self.device_channels, 3
+        else:
+            self.input_channels, self.output_channels = 3, self.device_channels
+
+    def __call__(self, values):
+        values = numpy.asarray(values, dtype=numpy.float64)
+        if not values.ndim or values.shape[-1] != self.input_channels:
+            raise ValueError("Expected array with a trailing axis of %i, got "
+                             "shape %r" % (self.input_channels, values.shape))
+        if self.direction == "f":
+            return self.forward(values)
+        return self.backward(values)
+
+    @staticmethod
+    def get_absolute_matrix(profile):
+        """
+        Return the matrix from relative to absolute colorimetric XYZ.
+
+        Uses the 'chad' tag if present (except for Apple profiles, whose
+        media white is not under the PCS illuminant), otherwise a Bradford
+        adaption to the media white (which is illuminant-relative in that
+        case), like Argyll does.
+
+        """
+        tags = profile.tags
+        if "chad" in tags and profile.creator != "appl":
+            return tags.chad.inverted()
+        return colormath.wp_adaption_matrix(profile.illuminant.values(),
+                                            tags.wtpt.values())
+
+    def decode_pcs(self, values):
+        """ Normalized LUT values -> Lab or XYZ (0..1) """
+        if self.connection == "XYZ":
+            # u1Fixed15Number
+            return values * (65535 / 32768.0)
+        if isinstance(self.lut, ICCP.LUT16Type) and self.lut.entrySize == 2:
+            # lut16Type uses the legacy 16-bit Lab encoding
+            values = values * (65535 / 65280.0)
+        return values * (100.0, 255.0, 255.0) - (0.0, 128.0, 128.0)
+
+    def encode_pcs(self, values):
+        """ Lab or XYZ (0..1) -> normalized LUT values """
+        if self.connection == "XYZ":
+            return values * (32768 / 65535.0)
+        values = (values + (0.0, 128.0, 128.0)) / (100.0, 255.0, 255.0)
+        if isinstance(self.lut, ICCP.LUT16Type) and self.lut.entrySize == 2:
+            values *= 65280 / 65535.0
+        return values
+
+    def forward(self, device):
+        """ Device values -> PCS """
+        if self.scale != 1.0:
+            device = device / self.scale
+        if self.lut is not None:
+            values = self.decode_pcs(self.lut.apply(device,
+                                                    self.interpolation))
+            if self.connection == "Lab":
+                if self.pcs == "l" and self.absolute is None:
+                    return values
+                XYZ = colormath.Lab2XYZ_array(values, self.pcs_white)
+            else:
+                XYZ = values
+        elif self.matrix is None:
+            Y = curve_lookup(self.trc[0], device[..., 0])
+            XYZ = Y[..., numpy.newaxis] * numpy.array(self.pcs_white)
+        else:
+            linear = numpy.empty(device.shape)
+            for i, trc in enumerate(self.trc):
+                linear[..., i] = curve_lookup(trc, device[..., i])
+            XYZ = numpy.dot(linear, self.matrix.T)
+        if self.absolute is not None:
+            XYZ = numpy.dot(XYZ, self.absolute.T)
+        if self.pcs == "l":
+            return colormath.XYZ2Lab_array(XYZ * 100,
+                                           [v * 100 for v in self.pcs_white])
+        return XYZ
+
+    def backward(self, pcs):
+        """ PCS -> device values """
+        if (self.lut is not None and self.connection == "Lab" and
+            self.pcs == "l" and self.absolute is None):
+            values = pcs
+        else:
+            if self.pcs == "l":
+                XYZ = colormath.Lab2XYZ_array(pcs, self.pcs_white)
+            else:
+                XYZ = pcs
+            if self.absolute is not None:
+                XYZ = numpy.dot(XYZ, numpy.linalg.inv(self.absolute).T)
+            if self.lut is not None and self.connection == "Lab":
+                values = colormath.XYZ2Lab_array(XYZ * 100,
+                                                 [v * 100 for v in
+                                                  self.pcs_white])
+            else:
+                values = XYZ
+        if self.lut is not None:
+            device = self.lut.apply(self.encode_pcs(values),
+                                    self.interpolation)
+        elif self.matrix is None:
+            Y = values[..., 1] / self.pcs_white[1]
+            device = curve_lookup(self.trc[0], Y, True)[..., numpy.newaxis]
+        else:
+            linear = numpy.dot(values, numpy.linalg.inv(self.matrix).T)
+            device = numpy.empty(linear.shape)
+            for i, trc in enumerate(self.trc):
+                device[..., i] = curve_lookup(trc, linear[..., i], True)
+        if self.scale != 1.0:
+            device *= self.scale
+        return device
+
+
+def lookup(profile, values, direction="f", intent="r", pcs=None, scale=1.0,
+           interpolation="tetrahedral"):
+    """
+    Lookup values through profile. See the module docstring for options.
+
+    Raises NotImplementedError if the profile type or the LUT tag needed
+    for the lookup is not supported.
+
+    """
+    return Transform(profile, direction, intent, pcs, scale,
+                     interpolation)(values)
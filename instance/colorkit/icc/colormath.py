@@ -3,6 +3,8 @@
 
 import math
 
+import numpy
+
 
 def get_transfer_function_phi(alpha, gamma):
     return (math.pow(1 + alpha, gamma) * math.pow(gamma - 1, gamma - 1)) / (math.pow(alpha, gamma - 1) * math.pow(gamma, gamma))
@@ -211,8 +213,8 @@ def adapt(X, Y, Z, whitepoint_source=None, whitepoint_destination=None,
     # based on formula http://brucelindbloom.com/Eqn_ChromAdapt.html
     # cat = adaption matrix or predefined choice ('CAT02', 'Bradford', 
     # 'Von Kries', 'XYZ Scaling', see cat_matrices), defaults to 'Bradford'
-    return wp_adaption_matrix(whitepoint_source, whitepoint_destination, 
-                              cat) * (X, Y, Z)
+    return ChromaticAdaptation.get(whitepoint_source, whitepoint_destination,
+                                   cat)(X, Y, Z)
 
 
 def apply_bpc(X, Y, Z, bp_in, bp_out, wp_out="D50"):
@@ -261,12 +263,34 @@ def compute_bpc(bp_in, bp_out):
     bz = - D50[2] * (bp_out[2] - bp_in[2]) / tz
 
     matrix = Matrix3x3([[ax, 0,  0],
-                        [0, ay,  0]
+                        [0, ay,  0],
                         [0,  0, az]])
     offset = [bx, by, bz]
     return matrix, offset
 
 
+delta_methods = {"94": "94", "1994": "94", "cie94": "94", "cie1994": "94",
+                 "cmc(2:1)": "cmc21", "cmc21": "cmc21",
+                 "cmc(1:1)": "cmc", "cmc11": "cmc", "cmc": "cmc",
+                 "00": "2k", "2k": "2k", "2000": "2k", "cie00": "2k",
+                 "cie2k": "2k", "cie2000": "2k"}
+
+
+def get_delta_method(method="1976"):
+    """
+    Return the canonical name of a delta calculation method.
+
+    One of "94", "cmc", "cmc21", "2k" or "76" (the default for anything
+    not found in delta_methods).
+
+    """
+    if isinstance(method, basestring):
+        method = method.lower()
+    else:
+        method = str(int(method))
+    return delta_methods.get(method, "76")
+
+
 def delta(L1, a1, b1, L2, a2, b2, method="1976", p1=None, p2=None, p3=None):
         """
         Compute the delta of two samples
@@ -296,11 +320,8 @@ def delta(L1, a1, b1, L2, a2, b2, method="1976", p1=None, p2=None, p3=None):
                       weighting factor (all three default to 1 if not set)
 
         """
-        if isinstance(method, basestring):
-            method = method.lower()
-        else:
-            method = str(int(method))
-        if method in ("94", "1994", "cie94", "cie1994"):
+        method = get_delta_method(method)
+        if method == "94":
             textiles = p1
             dL = L1 - L2
             C1 = math.sqrt(math.pow(a1, 2) + math.pow(b1, 2))
@@ -323,8 +344,8 @@ def delta(L1, a1, b1, L2, a2, b2, method="1976", p1=None, p2=None, p3=None):
             KC = 1.0
             KH = 1.0
             dE = math.sqrt(math.pow(dL / (KL * SL), 2) + math.pow(dC / (KC * SC), 2) + math.pow(dH / (KH * SH), 2))
-        elif method in ("cmc(2:1)", "cmc21", "cmc(1:1)", "cmc11", "cmc"):
-            if method in ("cmc(2:1)", "cmc21"):
+        elif method in ("cmc21", "cmc"):
+            if method == "cmc21":
                 p1 = 2.0
             l = p1 if isinstance(p1, (float, int)) else 1.0
             c = p2 if isinstance(p2, (float, int)) else 1.0
@@ -342,7 +363,7 @@ def delta(L1, a1, b1, L2, a2, b2, method="1976", p1=None, p2=None, p3=None):
             T = 0.56 + abs(0.2 * math.cos(math.radians(H1 + 168.0))) if 164 <= H1 and H1 <= 345 else 0.36 + abs(0.4 * math.cos(math.radians(H1 + 35)))
             SH = SC * (F * T + 1 - F)
             dE = math.sqrt(math.pow(dL / (l * SL), 2) + math.pow(dC / (c * SC), 2) + math.pow(dH / SH, 2))
-        elif method in ("00", "2k", "2000", "cie00", "cie2k", "cie2000"):
+        elif method == "2k":
             pow25_7 = math.pow(25, 7)
             k_L = p1 if isinstance(p1, (float, int)) else 1.0
             k_C = p2 if isinstance(p2, (float, int)) else 1.0
@@ -403,6 +424,134 @@ def delta(L1, a1, b1, L2, a2, b2, method="1976", p1=None, p2=None, p3=None):
                 "b": b1 - b2}
 
 
+def delta_batch(lab1, lab2, method="1976", p1=None, p2=None, p3=None,
+                pairwise=False):
+    """
+    Compute the deltas of many pairs of Lab samples at once.
+
+    lab1 and lab2 are arrays with a trailing axis of 3 and are broadcast
+    against each other, so a single (3, ) sample can be compared to a
+    (N, 3) array (one-vs-many), or two (N, 3) arrays compared row by row.
+    If pairwise is True, every sample in lab1 is compared to every sample in
+    lab2 (many-vs-many), i.e. (N, 3) and (M, 3) give results of shape (N, M),
+    (3, ) and (M, 3) results of shape (M, ).
+
+    method, p1, p2 and p3 have the same meaning as for delta. The method is
+    resolved once for the whole batch.
+
+    Return a dict with the same keys as delta, each holding an array.
+    Where rounding would make the scalar function fail because of a
+    slightly negative dH², dH is zero.
+
+    """
+    lab1 = _array3(lab1)
+    lab2 = _array3(lab2)
+    if pairwise and lab1.ndim > 1 and lab2.ndim > 1:
+        # (A single sample is compared to all others by broadcasting)
+        lab1 = lab1[..., :, numpy.newaxis, :]
+        lab2 = lab2[..., numpy.newaxis, :, :]
+    L1, a1, b1 = lab1[..., 0], lab1[..., 1], lab1[..., 2]
+    L2, a2, b2 = lab2[..., 0], lab2[..., 1], lab2[..., 2]
+    method = get_delta_method(method)
+    da = a1 - a2
+    db = b1 - b2
+    if method == "2k":
+        pow25_7 = math.pow(25, 7)
+        k_L = p1 if isinstance(p1, (float, int)) else 1.0
+        k_C = p2 if isinstance(p2, (float, int)) else 1.0
+        k_H = p3 if isinstance(p3, (float, int)) else 1.0
+        C1 = numpy.sqrt(a1 * a1 + b1 * b1)
+        C2 = numpy.sqrt(a2 * a2 + b2 * b2)
+        C_avg = (C1 + C2) / 2.0
+        G = .5 * (1 - numpy.sqrt(numpy.power(C_avg, 7) /
+                                 (numpy.power(C_avg, 7) + pow25_7)))
+        a1_ = (1 + G) * a1
+        a2_ = (1 + G) * a2
+        C1_ = numpy.sqrt(a1_ * a1_ + b1 * b1)
+        C2_ = numpy.sqrt(a2_ * a2_ + b2 * b2)
+        h1_ = numpy.where((a1_ == 0) & (b1 == 0), 0,
+                          numpy.degrees(numpy.arctan2(b1, a1_)) +
+                          numpy.where(b1 >= 0, 0, 360.0))
+        h2_ = numpy.where((a2_ == 0) & (b2 == 0), 0,
+                          numpy.degrees(numpy.arctan2(b2, a2_)) +
+                          numpy.where(b2 >= 0, 0, 360.0))
+        dh = h2_ - h1_
+        dh_ = numpy.where(dh > 180, dh - 360.0,
+                          numpy.where(dh < -180, dh + 360.0, dh))
+        dL = L2 - L1
+        dC = C2_ - C1_
+        dH = 2 * numpy.sqrt(C1_ * C2_) * numpy.sin(numpy.radians(dh_ / 2.0))
+        L__avg = (L1 + L2) / 2.0
+        C__avg = (C1_ + C2_) / 2.0
+        h_avg = (h1_ + h2_) / 2.0
+        h__avg = numpy.where(C1_ * C2_ == 0, h1_ + h2_,
+                             numpy.where(numpy.abs(dh) <= 180, h_avg,
+                                         numpy.where(h1_ + h2_ < 360,
+                                                     h_avg + 180.0,
+                                                     h_avg - 180.0)))
+        AB = numpy.power(L__avg - 50.0, 2)  # (L'_ave-50)^2
+        S_L = 1 + .015 * AB / numpy.sqrt(20.0 + AB)
+        S_C = 1 + .045 * C__avg
+        T = (1 - .17 * numpy.cos(numpy.radians(h__avg - 30.0)) +
+             .24 * numpy.cos(numpy.radians(2.0 * h__avg)) +
+             .32 * numpy.cos(numpy.radians(3.0 * h__avg + 6.0)) -
+             .2 * numpy.cos(numpy.radians(4 * h__avg - 63.0)))
+        S_H = 1 + .015 * C__avg * T
+        dTheta = 30.0 * numpy.exp(-1 * numpy.power((h__avg - 275.0) / 25.0,
+                                                   2))
+        R_C = 2.0 * numpy.sqrt(numpy.power(C__avg, 7) /
+                               (numpy.power(C__avg, 7) + pow25_7))
+        R_T = -numpy.sin(numpy.radians(2.0 * dTheta)) * R_C
+        AJ = dL / S_L / k_L  # dL' / k_L / S_L
+        AK = dC / S_C / k_C  # dC' / k_C / S_C
+        AL = dH / S_H / k_H  # dH' / k_H / S_H
+        dE = numpy.sqrt(AJ * AJ + AK * AK + AL * AL + R_T * AK * AL)
+    else:
+        dL = L1 - L2
+        C1 = numpy.sqrt(a1 * a1 + b1 * b1)
+        C2 = numpy.sqrt(a2 * a2 + b2 * b2)
+        dC = C1 - C2
+        dH = numpy.sqrt(numpy.maximum(da * da + db * db - dC * dC, 0))
+        if method == "94":
+            textiles = p1
+            K1 = 0.048 if textiles else 0.045
+            K2 = 0.014 if textiles else 0.015
+            C_ = (numpy.sqrt((1 + (K1 * C1)) * (1 + (K1 * C2))) - 1) / K1
+            SC = 1.0 + K1 * C_
+            SH = 1.0 + K2 * C_
+            KL = 2.0 if textiles else 1.0
+            dE = numpy.sqrt(numpy.power(dL / KL, 2) + numpy.power(dC / SC, 2) +
+                            numpy.power(dH / SH, 2))
+        elif method in ("cmc21", "cmc"):
+            if method == "cmc21":
+                p1 = 2.0
+            l = p1 if isinstance(p1, (float, int)) else 1.0
+            c = p2 if isinstance(p2, (float, int)) else 1.0
+            SL = numpy.where(L1 < 16, 0.511,
+                             (0.040975 * L1) / (1 + 0.01765 * L1))
+            SC = (0.0638 * C1) / (1 + 0.0131 * C1) + 0.638
+            F = numpy.sqrt(numpy.power(C1, 4) / (numpy.power(C1, 4) + 1900.0))
+            H1 = (numpy.degrees(numpy.arctan2(b1, a1)) +
+                  numpy.where(b1 >= 0, 0, 360.0))
+            T = numpy.where((164 <= H1) & (H1 <= 345),
+                            0.56 + numpy.abs(0.2 * numpy.cos(numpy.radians(H1 + 168.0))),
+                            0.36 + numpy.abs(0.4 * numpy.cos(numpy.radians(H1 + 35))))
+            SH = SC * (F * T + 1 - F)
+            dE = numpy.sqrt(numpy.power(dL / (l * SL), 2) +
+                            numpy.power(dC / (c * SC), 2) +
+                            numpy.power(dH / SH, 2))
+        else:
+            # dE 1976
+            dE = numpy.sqrt(dL * dL + da * da + db * db)
+
+    return {"E": dE,
+            "L": dL,
+            "C": dC,
+            "H": dH,
+            "a": da,
+            "b": db}
+
+
 def is_similar_matrix(matrix1, matrix2, digits=3):
     """ Compare two matrices and check if they are the same
     up to n digits after the decimal point """
@@ -834,6 +983,56 @@ def LERP(a,b,c):
     return (b - a) * c + a
 
 
+# Robertson's isotemperature lines (see XYZ2CCT): reciprocal temperature
+# (1/K), and u, v and slope t of the line at that temperature
+robertson_rt = [
+     DBL_MIN,  10.0e-6,  20.0e-6,  30.0e-6,  40.0e-6,  50.0e-6,
+     60.0e-6,  70.0e-6,  80.0e-6,  90.0e-6, 100.0e-6, 125.0e-6,
+    150.0e-6, 175.0e-6, 200.0e-6, 225.0e-6, 250.0e-6, 275.0e-6,
+    300.0e-6, 325.0e-6, 350.0e-6, 375.0e-6, 400.0e-6, 425.0e-6,
+    450.0e-6, 475.0e-6, 500.0e-6, 525.0e-6, 550.0e-6, 575.0e-6,
+    600.0e-6
+]
+robertson_uvt = [
+    [0.18006, 0.26352, -0.24341],
+    [0.18066, 0.26589, -0.25479],
+    [0.18133, 0.26846, -0.26876],
+    [0.18208, 0.27119, -0.28539],
+    [0.18293, 0.27407, -0.30470],
+    [0.18388, 0.27709, -0.32675],
+    [0.18494, 0.28021, -0.35156],
+    [0.18611, 0.28342, -0.37915],
+    [0.18740, 0.28668, -0.40955],
+    [0.18880, 0.28997, -0.44278],
+    [0.19032, 0.29326, -0.47888],
+    [0.19462, 0.30141, -0.58204],
+    [0.19962, 0.30921, -0.70471],
+    [0.20525, 0.31647, -0.84901],
+    [0.21142, 0.32312, -1.0182],
+    [0.21807, 0.32909, -1.2168],
+    [0.22511, 0.33439, -1.4512],
+    [0.23247, 0.33904, -1.7298],
+    [0.24010, 0.34308, -2.0637],
+    [0.24792, 0.34655, -2.4681],    # Note: 0.24792 is a corrected value 
+                                    # for the error found in W&S as 0.24702
+    [0.25591, 0.34951, -2.9641],
+    [0.26400, 0.35200, -3.5814],
+    [0.27218, 0.35407, -4.3633],
+    [0.28039, 0.35577, -5.3762],
+    [0.28863, 0.35714, -6.7262],
+    [0.29685, 0.35823, -8.5955],
+    [0.30505, 0.35907, -11.324],
+    [0.31320, 0.35968, -15.628],
+    [0.32129, 0.36011, -23.325],
+    [0.32931, 0.36038, -40.770],
+    [0.33724, 0.36051, -116.45]
+]
+
+# The same tables as arrays (see XYZ2CCT_array)
+_robertson_rt = numpy.array(robertson_rt)
+_robertson_uvt = numpy.array(robertson_uvt)
+
+
 def XYZ2CCT(X, Y, Z):
     """
     Convert from XYZ to correlated color temperature.
@@ -854,48 +1053,8 @@ def XYZ2CCT(X, Y, Z):
     1982, pp. 227, 228.
     
     """
-    rt = [       # reciprocal temperature (K)
-         DBL_MIN,  10.0e-6,  20.0e-6,  30.0e-6,  40.0e-6,  50.0e-6,
-         60.0e-6,  70.0e-6,  80.0e-6,  90.0e-6, 100.0e-6, 125.0e-6,
-        150.0e-6, 175.0e-6, 200.0e-6, 225.0e-6, 250.0e-6, 275.0e-6,
-        300.0e-6, 325.0e-6, 350.0e-6, 375.0e-6, 400.0e-6, 425.0e-6,
-        450.0e-6, 475.0e-6, 500.0e-6, 525.0e-6, 550.0e-6, 575.0e-6,
-        600.0e-6
-    ]
-    uvt = [
-        [0.18006, 0.26352, -0.24341],
-        [0.18066, 0.26589, -0.25479],
-        [0.18133, 0.26846, -0.26876],
-        [0.18208, 0.27119, -0.28539],
-        [0.18293, 0.27407, -0.30470],
-        [0.18388, 0.27709, -0.32675],
-        [0.18494, 0.28021, -0.35156],
-        [0.18611, 0.28342, -0.37915],
-        [0.18740, 0.28668, -0.40955],
-        [0.18880, 0.28997, -0.44278],
-        [0.19032, 0.29326, -0.47888],
-        [0.19462, 0.30141, -0.58204],
-        [0.19962, 0.30921, -0.70471],
-        [0.20525, 0.31647, -0.84901],
-        [0.21142, 0.32312, -1.0182],
-        [0.21807, 0.32909, -1.2168],
-        [0.22511, 0.33439, -1.4512],
-        [0.23247, 0.33904, -1.7298],
-        [0.24010, 0.34308, -2.0637],
-        [0.24792, 0.34655, -2.4681],    # Note: 0.24792 is a corrected value 
-                                        # for the error found in W&S as 0.24702
-        [0.25591, 0.34951, -2.9641],
-        [0.26400, 0.35200, -3.5814],
-        [0.27218, 0.35407, -4.3633],
-        [0.28039, 0.35577, -5.3762],
-        [0.28863, 0.35714, -6.7262],
-        [0.29685, 0.35823, -8.5955],
-        [0.30505, 0.35907, -11.324],
-        [0.31320, 0.35968, -15.628],
-        [0.32129, 0.36011, -23.325],
-        [0.32931, 0.36038, -40.770],
-        [0.33724, 0.36051, -116.45]
-    ]
+    rt = robertson_rt
+    uvt = robertson_uvt
     if ((X < 1.0e-20) and (Y < 1.0e-20) and (Z < 1.0e-20)):
         return None # protect against possible divide-by-zero failure
     us = (4.0 * X) / (X + 15.0 * Y + 3.0 * Z)
@@ -1020,8 +1179,9 @@ def XYZ2RGB(X, Y, Z, rgb_space=None, scale=1.0, round_=False, clamp=True):
        gamma = 2.2.
     
     """
-    gamma, whitepoint, rxyY, gxyY, bxyY, matrix = get_rgb_space(rgb_space)
-    RGB = matrix.inverted() * [X, Y, Z]
+    space = RGBSpace.get(rgb_space)
+    gamma = space.gamma
+    RGB = space.from_xyz(X, Y, Z)
     for i, v in enumerate(RGB):
         RGB[i] = specialpow(v, 1.0 / gamma)
         if clamp:
@@ -1075,39 +1235,936 @@ def xy_CCT_delta(x, y, daylight=True, method=2000):
     return cct, d
 
 
-class Matrix3x3(list):
+# Array variants of the converters above.
+#
+# They accept anything numpy.asarray understands with a trailing axis of 3,
+# e.g. a (N, 3) list of triplets or a (height, width, 3) image, and return
+# a float64 array of the same shape. The arithmetic deliberately follows the
+# same order of operations as the scalar functions (numpy.power and math.pow
+# both use the C library's pow()), so results are exactly the same.
+
+
+def _array3(values):
+    """ Return values as float64 array with a trailing axis of 3 """
+    values = numpy.asarray(values, dtype=numpy.float64)
+    if not values.ndim or values.shape[-1] != 3:
+        raise ValueError("Expected array with a trailing axis of 3, got "
+                         "shape %r" % (values.shape, ))
+    return values
+
+
+def _stack3(v0, v1, v2):
+    """ Stack three equally shaped arrays along a new trailing axis """
+    values = numpy.empty(numpy.shape(v0) + (3, ), dtype=numpy.float64)
+    values[..., 0] = v0
+    values[..., 1] = v1
+    values[..., 2] = v2
+    return values
+
+
+def _matrix_apply(matrix, values):
+    """
+    Multiply each triplet in values by a 3x3 matrix.
+
+    Same operation order as Matrix3x3 * triplet (as opposed to numpy.dot,
+    which may sum in a different order), so the results are identical.
+
+    """
+    v0, v1, v2 = values[..., 0], values[..., 1], values[..., 2]
+    return _stack3(v0 * matrix[0][0] + v1 * matrix[0][1] + v2 * matrix[0][2],
+                   v0 * matrix[1][0] + v1 * matrix[1][1] + v2 * matrix[1][2],
+                   v0 * matrix[2][0] + v1 * matrix[2][1] + v2 * matrix[2][2])
+
+
+def _round(values, digits=0):
+    """
+    Round half away from zero like the builtin round()
     
-    """ Simple 3x3 matrix """
+    Like round(), this rounds the exact value of each float, i.e. the
+    product with 10 ** digits is computed without rounding error (as the
+    sum of two floats, see Dekker's algorithm) before it is rounded.
+    
+    """
+    values = numpy.asarray(values, dtype=numpy.float64)
+    magnitude = numpy.abs(values)
+    factor = math.pow(10, digits)
+    product = magnitude * factor
+    # Rounding error of product, magnitude * factor = product + error
+    split = 134217729.0  # 2 ** 27 + 1
+    high = split * magnitude
+    high = high - (high - magnitude)
+    low = magnitude - high
+    factor_high = split * factor
+    factor_high = factor_high - (factor_high - factor)
+    factor_low = factor - factor_high
+    error = (((high * factor_high - product) + high * factor_low +
+              low * factor_high) + low * factor_low)
+    integer = numpy.floor(product)
+    rounded = numpy.where(product - integer - 0.5 >= -error, integer + 1,
+                          integer)
+    return numpy.copysign(rounded, values) / factor
+
+
+def _cbrt(values):
+    """ Array variant of cbrt """
+    return (numpy.where(values >= 0, 1.0, -1.0) *
+            numpy.power(numpy.abs(values), 1.0 / 3.0))
+
+
+def _specialpow_function(b):
+    """
+    Return the function specialpow_array applies to the absolute values for
+    b (see specialpow), so it can be looked up once for many calls.
+
+    """
+    if b >= 0.0:
+        # Power curve
+        return lambda a: numpy.power(a, b)
+    if b in (1.0 / -601, 1.0 / -709):
+        # XYZ -> RGB, Rec. 601/709 TRC
+        return lambda a: numpy.where(a < REC709_K0 / REC709_P, a * REC709_P,
+                                     1.099 * numpy.power(a, 0.45) - 0.099)
+    if b == 1.0 / -240:
+        # XYZ -> RGB, SMPTE 240M TRC
+        return lambda a: numpy.where(a < SMPTE240M_K0 / SMPTE240M_P,
+                                     a * SMPTE240M_P,
+                                     1.1115 * numpy.power(a, 0.45) - 0.1115)
+    if b == 1.0 / -3.0:
+        # XYZ -> RGB, L* TRC
+        return lambda a: numpy.where(a <= LSTAR_E, 0.01 * a * LSTAR_K,
+                                     1.16 * numpy.power(a, 1.0 / 3.0) - 0.16)
+    if b == 1.0 / -2.4:
+        # XYZ -> RGB, sRGB TRC
+        return lambda a: numpy.where(a <= SRGB_K0 / SRGB_P, a * SRGB_P,
+                                     1.055 * numpy.power(a, 1.0 / 2.4) - 0.055)
+    if b == -2.4:
+        # RGB -> XYZ, sRGB TRC
+        return lambda a: numpy.where(a <= SRGB_K0, a / SRGB_P,
+                                     numpy.power((a + 0.055) / 1.055, 2.4))
+    if b == -3.0:
+        # RGB -> XYZ, L* TRC
+        return lambda a: numpy.where(a <= 0.08, 100.0 * a / LSTAR_K,
+                                     numpy.power((a + 0.16) / 1.16, 3.0))
+    if b == -240:
+        # RGB -> XYZ, SMPTE 240M TRC
+        return lambda a: numpy.where(a < SMPTE240M_K0, a / SMPTE240M_P,
+                                     numpy.power((0.1115 + a) / 1.1115,
+                                                 1.0 / 0.45))
+    if b in (-601, -709):
+        # RGB -> XYZ, Rec. 601/709 TRC
+        return lambda a: numpy.where(a < REC709_K0, a / REC709_P,
+                                     numpy.power((a + .099) / 1.099,
+                                                 1.0 / 0.45))
+    raise ValueError("Invalid gamma %s" % b)
+
+
+def _apply_signed(function, a):
+    """ Apply function to the absolute values of a, keeping their sign """
+    a = numpy.asarray(a, dtype=numpy.float64)
+    signScale = numpy.where(a < 0.0, -1.0, 1.0)
+    return function(numpy.abs(a)) * signScale
+
+
+def specialpow_array(a, b):
+    """
+    Array variant of specialpow.
+
+    a can be a scalar or an array of any shape, b has the same meaning as in
+    specialpow.
+
+    """
+    return _apply_signed(_specialpow_function(b), a)
+
+
+def adapt_array(XYZ, whitepoint_source=None, whitepoint_destination=None,
+                cat="Bradford"):
+    """ Array variant of adapt """
+    return ChromaticAdaptation.get(whitepoint_source, whitepoint_destination,
+                                   cat)(XYZ)
+
+
+def apply_bpc_array(XYZ, bp_in, bp_out, wp_out="D50"):
+    """ Array variant of apply_bpc """
+    wp_out = get_whitepoint(wp_out)
+    XYZ = _array3(XYZ)
+    return _stack3(*[((wp_out[i] - bp_out[i]) * XYZ[..., i] -
+                      wp_out[i] * (bp_in[i] - bp_out[i])) /
+                     (wp_out[i] - bp_in[i]) for i in xrange(3)])
+
+
+def CIEDCCT2xyY_array(T, scale=1.0):
+    """
+    Array variant of CIEDCCT2xyY for temperatures in Kelvin (standard
+    illuminant names are not supported). Where CIEDCCT2xyY returns None,
+    x, y and Y are NaN.
+    
+    """
+    T = numpy.asarray(T, dtype=numpy.float64)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        T2 = numpy.power(T, 2)
+        T3 = numpy.power(T, 3)
+        xD = numpy.where(T <= 7000,
+                         ((-4.607 * math.pow(10, 9)) / T3)
+                         + ((2.9678 * math.pow(10, 6)) / T2)
+                         + ((0.09911 * math.pow(10, 3)) / T)
+                         + 0.244063,
+                         ((-2.0064 * math.pow(10, 9)) / T3)
+                         + ((1.9018 * math.pow(10, 6)) / T2)
+                         + ((0.24748 * math.pow(10, 3)) / T)
+                         + 0.237040)
+        yD = -3 * numpy.power(xD, 2) + 2.87 * xD - 0.275
+        xyY = _stack3(xD, yD, scale)
+        xyY[~((4000 <= T) & (T <= 25000))] = numpy.nan
+        return xyY
+
+
+def CIEDCCT2XYZ_array(T, scale=1.0):
+    """ Array variant of CIEDCCT2XYZ, see CIEDCCT2xyY_array """
+    return xyY2XYZ_array(CIEDCCT2xyY_array(T, scale))
+
+
+def Lab2RGB_array(Lab, rgb_space=None, scale=1.0, round_=False, clamp=True):
+    """ Array variant of Lab2RGB """
+    return XYZ2RGB_array(Lab2XYZ_array(Lab), rgb_space, scale, round_, clamp)
+
+
+def Lab2XYZ_array(Lab, whitepoint=None, scale=1.0):
+    """ Array variant of Lab2XYZ """
+    Lab = _array3(Lab)
+    L, a, b = Lab[..., 0], Lab[..., 1], Lab[..., 2]
+    fy = (L + 16) / 116.0
+    fx = a / 500.0 + fy
+    fz = fy - b / 200.0
+    fx3 = numpy.power(fx, 3.0)
+    xr = numpy.where(fx3 > LSTAR_E, fx3, (116.0 * fx - 16) / LSTAR_K)
+    yr = numpy.where(L > LSTAR_K * LSTAR_E, numpy.power((L + 16) / 116.0, 3.0),
+                     L / LSTAR_K)
+    fz3 = numpy.power(fz, 3.0)
+    zr = numpy.where(fz3 > LSTAR_E, fz3, (116.0 * fz - 16) / LSTAR_K)
+    Xr, Yr, Zr = get_whitepoint(whitepoint, scale)
+    return _stack3(xr * Xr, yr * Yr, zr * Zr)
+
+
+def Lab2xyY_array(Lab, whitepoint=None, scale=1.0):
+    """ Array variant of Lab2xyY """
+    return XYZ2xyY_array(Lab2XYZ_array(Lab, whitepoint, scale), whitepoint)
+
+
+def Luv2RGB_array(Luv, rgb_space=None, scale=1.0, round_=False, clamp=True):
+    """ Array variant of Luv2RGB """
+    return XYZ2RGB_array(Luv2XYZ_array(Luv), rgb_space, scale, round_, clamp)
+
+
+def Luv2XYZ_array(Luv, whitepoint=None, scale=1.0):
+    """
+    Array variant of Luv2XYZ.
+
+    Where the scalar function raises ZeroDivisionError (L = 0),
+    the result is NaN.
+
+    """
+    Luv = _array3(Luv)
+    L, u, v = Luv[..., 0], Luv[..., 1], Luv[..., 2]
+    Xr, Yr, Zr = get_whitepoint(whitepoint)
+    Y = numpy.where(L > LSTAR_K * LSTAR_E,
+                    numpy.power((L + 16.0) / 116.0, 3), L / LSTAR_K)
+    uo = (4.0 * Xr) / (Xr + 15.0 * Yr + 3.0 * Zr)
+    vo = (9.0 * Yr) / (Xr + 15.0 * Yr + 3.0 * Zr)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        a = (1.0 / 3.0) * (((52.0 * L) / (u + 13 * L * uo)) -1)
+        b = -5.0 * Y
+        c = -(1.0 / 3.0)
+        d = Y * (((39.0 * L) / (v + 13 * L * vo)) - 5)
+        X = (d - b) / (a - c)
+    Z = X * a + b
+    return _stack3(X * scale, Y * scale, Z * scale)
+
+
+def planckianCT2XYZ_array(T, scale=1.0):
+    """ Array variant of planckianCT2XYZ, see planckianCT2xyY_array """
+    return xyY2XYZ_array(planckianCT2xyY_array(T, scale))
+
+
+def planckianCT2xyY_array(T, scale=1.0):
+    """
+    Array variant of planckianCT2xyY. Where planckianCT2xyY returns None,
+    x, y and Y are NaN.
+    
+    """
+    T = numpy.asarray(T, dtype=numpy.float64)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        T2 = numpy.power(T, 2)
+        T3 = numpy.power(T, 3)
+        x = numpy.where(T <= 4000,
+                        (  -0.2661239 * (math.pow(10, 9) / T3)
+                         -  0.2343580 * (math.pow(10, 6) / T2)
+                         +  0.8776956 * (math.pow(10, 3) / T)
+                         +  0.179910),
+                        (  -3.0258469 * (math.pow(10, 9) / T3)
+                         +  2.1070379 * (math.pow(10, 6) / T2)
+                         +  0.2226347 * (math.pow(10, 3) / T)
+                         +  0.24039))
+        x2 = numpy.power(x, 2)
+        x3 = numpy.power(x, 3)
+        y = numpy.select([T <= 2222, T <= 4000],
+                         [(  -1.1063814  * x3
+                           -  1.34811020 * x2
+                           +  2.18555832 * x
+                           -  0.20219683),
+                          (  -0.9549476  * x3
+                           -  1.37418593 * x2
+                           +  2.09137015 * x
+                           -  0.16748867)],
+                         (   3.0817580  * x3
+                          -  5.87338670 * x2
+                          +  3.75112997 * x
+                          -  0.37001483))
+        xyY = _stack3(x, y, scale)
+        xyY[~((1667 <= T) & (T <= 25000))] = numpy.nan
+        return xyY
+
+
+def RGB2XYZ_array(RGB, rgb_space=None, scale=1.0):
+    """ Array variant of RGB2XYZ """
+    space = RGBSpace.get(rgb_space)
+    XYZ = space.to_xyz(space.trc.decode(_array3(RGB)))
+    if scale != 1.0:
+        XYZ *= scale
+    return XYZ
+
+
+def xyY2CCT_array(xyY):
+    """ Array variant of xyY2CCT, see XYZ2CCT_array """
+    return XYZ2CCT_array(xyY2XYZ_array(xyY))
+
+
+def xyY2Lab_array(xyY, whitepoint=None):
+    """ Array variant of xyY2Lab """
+    return XYZ2Lab_array(xyY2XYZ_array(xyY), whitepoint)
+
+
+def xyY2RGB_array(xyY, rgb_space=None, scale=1.0, round_=False, clamp=True):
+    """ Array variant of xyY2RGB """
+    return XYZ2RGB_array(xyY2XYZ_array(xyY), rgb_space, scale, round_, clamp)
+
+
+def xyY2XYZ_array(xyY):
+    """ Array variant of xyY2XYZ. Where y = 0, X = Y = Z = 0 is returned. """
+    xyY = _array3(xyY)
+    x, y, Y = xyY[..., 0], xyY[..., 1], xyY[..., 2]
+    black = y == 0
+    y = numpy.where(black, 1.0, y)
+    XYZ = _stack3((x * Y) / y, Y, ((1 - x - y) * Y) / y)
+    XYZ[black] = 0
+    return XYZ
+
+
+def XYZ2CCT_array(XYZ):
+    """
+    Array variant of XYZ2CCT. Where XYZ2CCT returns None, the result is NaN.
+    
+    The isotemperature lines bounding each color are found for all colors
+    at once, with one searchsorted over the sign changes of the distances
+    to the lines.
+    
+    """
+    XYZ = _array3(XYZ)
+    X, Y, Z = XYZ[..., 0], XYZ[..., 1], XYZ[..., 2]
+    rt = _robertson_rt
+    u, v, t = _robertson_uvt[:, 0], _robertson_uvt[:, 1], _robertson_uvt[:, 2]
+    count = len(rt)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        us = (4.0 * X) / (X + 15.0 * Y + 3.0 * Z)
+        vs = (6.0 * Y) / (X + 15.0 * Y + 3.0 * Z)
+        # The first line on the other side of (us, vs) than the first line
+        # and the line before it bound (us, vs). If there is none, the
+        # color temperature would be less than the minimum of 1666.7
+        # degrees, or the color too far towards blue.
+        d = ((vs[..., numpy.newaxis] - v) -
+             t * (us[..., numpy.newaxis] - u)).reshape(-1, count)
+        below = d < 0.0
+        changed = (below != below[:, :1]).ravel()
+        # The running count of sign changes is sorted, so the first change
+        # in each row is where it first exceeds the count at the row's start
+        # (the first line never counts as a change)
+        changes = numpy.cumsum(changed)
+        start = numpy.arange(0, changed.size, count)
+        i = (numpy.searchsorted(changes, changes[start] + 1) -
+             start).reshape(us.shape)
+        # Protect against possible divide-by-zero failure
+        valid = (i < count) & ~((X < 1.0e-20) & (Y < 1.0e-20) &
+                                (Z < 1.0e-20))
+        i = numpy.where(valid, i, 1)
+        di = (vs - v[i]) - t[i] * (us - u[i])
+        dm = (vs - v[i - 1]) - t[i - 1] * (us - u[i - 1])
+        di = di / numpy.sqrt(1.0 + t[i] * t[i])
+        dm = dm / numpy.sqrt(1.0 + t[i - 1] * t[i - 1])
+        p = dm / (dm - di)  # p = interpolation parameter, 0.0 : i-1, 1.0 : i
+        return numpy.where(valid, 1.0 / (LERP(rt[i - 1], rt[i], p)),
+                           numpy.nan)
+
+
+def XYZ2Lab_array(XYZ, whitepoint=None):
+    """ Array variant of XYZ2Lab """
+    XYZ = _array3(XYZ)
+    Xr, Yr, Zr = get_whitepoint(whitepoint, 100)
+    xr = XYZ[..., 0] / Xr
+    yr = XYZ[..., 1] / Yr
+    zr = XYZ[..., 2] / Zr
+    fx = numpy.where(xr > LSTAR_E, _cbrt(xr), (LSTAR_K * xr + 16) / 116.0)
+    fy = numpy.where(yr > LSTAR_E, _cbrt(yr), (LSTAR_K * yr + 16) / 116.0)
+    fz = numpy.where(zr > LSTAR_E, _cbrt(zr), (LSTAR_K * zr + 16) / 116.0)
+    return _stack3(116 * fy - 16, 500 * (fx - fy), 200 * (fy - fz))
+
+
+def XYZ2Luv_array(XYZ, whitepoint=None):
+    """ Array variant of XYZ2Luv """
+    XYZ = _array3(XYZ)
+    X, Y, Z = XYZ[..., 0], XYZ[..., 1], XYZ[..., 2]
+    Xr, Yr, Zr = get_whitepoint(whitepoint, 100)
+    yr = Y / Yr
+    L = numpy.where(yr > LSTAR_E, 116.0 * _cbrt(yr) - 16.0, LSTAR_K * yr)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        u_ = (4.0 * X) / (X + 15.0 * Y + 3.0 * Z)
+        v_ = (9.0 * Y) / (X + 15.0 * Y + 3.0 * Z)
+    u_r = (4.0 * Xr) / (Xr + 15.0 * Yr + 3.0 * Zr)
+    v_r = (9.0 * Yr) / (Xr + 15.0 * Yr + 3.0 * Zr)
+    return _stack3(L, 13.0 * L * (u_ - u_r), 13.0 * L * (v_ - v_r))
+
+
+def XYZ2RGB_array(XYZ, rgb_space=None, scale=1.0, round_=False, clamp=True):
+    """ Array variant of XYZ2RGB """
+    space = RGBSpace.get(rgb_space)
+    RGB = space.trc.encode(space.from_xyz(XYZ))
+    if clamp:
+        RGB = numpy.minimum(1.0, numpy.maximum(0.0, RGB))
+    RGB *= scale
+    if round_ is not False:
+        RGB = _round(RGB, round_)
+    return RGB
+
+
+def XYZ2xyY_array(XYZ, whitepoint=None):
+    """
+    Array variant of XYZ2xyY.
+
+    For black (X + Y + Z = 0), x and y are set to the chromaticity
+    coordinates of the reference whitepoint.
+
+    """
+    XYZ = _array3(XYZ)
+    X, Y, Z = XYZ[..., 0], XYZ[..., 1], XYZ[..., 2]
+    total = X + Y + Z
+    black = total == 0
+    total = numpy.where(black, 1.0, total)
+    xyY = _stack3(X / total, Y / total, Y)
+    if black.any():
+        x, y, Y = XYZ2xyY(*get_whitepoint(whitepoint))
+        xyY[black] = (x, y, 0.0)
+    return xyY
+
+
+def xy_CCT_delta_array(x, y, daylight=True, method=2000):
+    """
+    Array variant of xy_CCT_delta
+    
+    Return an array of CCTs and a dict of delta arrays (see delta_batch).
+    Where xy_CCT_delta returns None, they are NaN.
+    
+    """
+    x, y = numpy.broadcast_arrays(numpy.asarray(x, dtype=numpy.float64),
+                                  numpy.asarray(y, dtype=numpy.float64))
+    xyY = _stack3(x, y, 1.0)
+    cct = xyY2CCT_array(xyY)
+    if daylight:
+        # Daylight locus
+        locus = CIEDCCT2XYZ_array(cct, 100.0)
+    else:
+        # Planckian locus
+        locus = planckianCT2XYZ_array(cct, 100.0)
+    xyY[..., 2] = 100.0
+    with numpy.errstate(invalid="ignore"):
+        d = delta_batch(xyY2Lab_array(xyY), XYZ2Lab_array(locus), method)
+    return cct, d
+
+
+# Matrix transforms.
+#
+# Transforms precompute their 3x3 matrix (and its inverse on first use), so
+# applying them costs one matrix-vector product per color. Transforms
+# combine with * like matrices: (a * b)(XYZ) == a(b(XYZ)), as a single
+# matrix. The get() constructors return cached instances; don't modify
+# their matrices. The caches only keep the most recently used instances, as
+# whitepoints and colorspaces can be arbitrary (e.g. measured) values.
+
+
+class LRUCache(object):
+    
+    """ Mapping which keeps the maxsize most recently used items """
+    
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self._items = {}
+        self._used = {}
+        self._clock = 0
+    
+    def __contains__(self, key):
+        return key in self._items
+    
+    def __len__(self):
+        return len(self._items)
+    
+    def __setitem__(self, key, value):
+        if key not in self._items and len(self._items) >= self.maxsize:
+            # Evict the least recently used item
+            key_lru = min(self._used, key=self._used.get)
+            del self._items[key_lru], self._used[key_lru]
+        self._items[key] = value
+        self._clock += 1
+        self._used[key] = self._clock
+    
+    def clear(self):
+        self._items.clear()
+        self._used.clear()
+    
+    def get(self, key, default=None):
+        """ Return the value for key and mark it as most recently used """
+        value = self._items.get(key, default)
+        if key in self._used:
+            self._clock += 1
+            self._used[key] = self._clock
+        return value
+
+
+def _hashable(value):
+    """ Return value (e.g. a whitepoint or matrix) as a hashable cache key """
+    if isinstance(value, Matrix3x3):
+        value = value.tolist()
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(v) for v in value)
+    return value
+
+
+class MatrixTransform(object):
+    
+    """ A linear transform of XYZ, RGB or cone response triplets """
+    
+    def __init__(self, matrix, inverse=None):
+        if not isinstance(matrix, Matrix3x3):
+            matrix = Matrix3x3(matrix)
+        self.matrix = matrix
+        self._inverse = inverse
+    
+    def __call__(self, *values):
+        """
+        Apply to a triplet (returns a list, like Matrix3x3 * triplet)
+        or to an array with a trailing axis of 3 (see _array3)
+        
+        """
+        if len(values) == 3:
+            return self.matrix * values
+        return self.matrix * _array3(values[0])
+    
+    def __mul__(self, transform):
+        return MatrixTransform(self.matrix * transform.matrix)
+    
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.matrix)
+    
+    @property
+    def inverse(self):
+        """ The inverse transform (computed once) """
+        if self._inverse is None:
+            self._inverse = MatrixTransform(self.matrix.inverted(), self)
+        return self._inverse
+
+
+class ChromaticAdaptation(MatrixTransform):
+    
+    """
+    Transform XYZ under source illuminant to XYZ under destination
+    illuminant, see wp_adaption_matrix
+    
+    """
+    
+    cache = LRUCache()
+    
+    def __init__(self, whitepoint_source=None, whitepoint_destination=None,
+                 cat="Bradford"):
+        MatrixTransform.__init__(self, wp_adaption_matrix(whitepoint_source,
+                                                          whitepoint_destination,
+                                                          cat))
+        self.whitepoint_source = get_whitepoint(whitepoint_source)
+        self.whitepoint_destination = get_whitepoint(whitepoint_destination)
+        self.cat = cat
+    
+    @classmethod
+    def get(cls, whitepoint_source=None, whitepoint_destination=None,
+            cat="Bradford"):
+        """ Return a cached chromatic adaptation """
+        cachehash = (_hashable(whitepoint_source),
+                     _hashable(whitepoint_destination), _hashable(cat))
+        adaptation = cls.cache.get(cachehash)
+        if adaptation is None:
+            adaptation = cls.cache[cachehash] = cls(whitepoint_source,
+                                                    whitepoint_destination,
+                                                    cat)
+        return adaptation
+
+
+class RGBSpace(object):
+    
+    """
+    An RGB colorspace (see get_rgb_space) with precomputed transforms
+    between linear RGB and XYZ (relative to the colorspace whitepoint),
+    and its transfer function (trc)
+    
+    """
+    
+    cache = LRUCache()
+    
+    def __init__(self, rgb_space=None):
+        (self.gamma, self.whitepoint, self.red, self.green, self.blue,
+         matrix) = get_rgb_space(rgb_space)
+        self.to_xyz = MatrixTransform(matrix)
+        self.trc = TransferFunction.get(self.gamma)
+    
+    @classmethod
+    def get(cls, rgb_space=None):
+        """ Return a cached RGB colorspace """
+        cachehash = _hashable(rgb_space)
+        space = cls.cache.get(cachehash)
+        if space is None:
+            space = cls.cache[cachehash] = cls(rgb_space)
+        return space
+    
+    @property
+    def from_xyz(self):
+        """ XYZ -> linear RGB """
+        return self.to_xyz.inverse
+    
+    def to_pcs(self, whitepoint="D50", cat="Bradford"):
+        """ Linear RGB -> XYZ adapted to whitepoint, as one transform """
+        return ChromaticAdaptation.get(self.whitepoint, whitepoint,
+                                       cat) * self.to_xyz
+    
+    def from_pcs(self, whitepoint="D50", cat="Bradford"):
+        """ XYZ under whitepoint -> linear RGB, as one transform """
+        return self.from_xyz * ChromaticAdaptation.get(whitepoint,
+                                                       self.whitepoint, cat)
+
+
+# Transfer functions.
+#
+# A TransferFunction encodes linear values (e.g. linear RGB) with a tone
+# response curve and decodes them back, see specialpow. Integer pipelines can
+# use dense lookup tables instead of evaluating the curve; they are built on
+# first use and kept with the (cached) instance.
+
+
+transfer_functions = {"L*": -3.0,
+                      "Rec. 601": -601,
+                      "Rec. 709": -709,
+                      "SMPTE 240M": -240,
+                      "sRGB": -2.4}
+
+
+def _uint_dtype(bits):
+    """ Smallest unsigned integer dtype holding bits """
+    for dtype in (numpy.uint8, numpy.uint16, numpy.uint32):
+        if bits <= numpy.dtype(dtype).itemsize * 8:
+            return dtype
+    raise ValueError("Invalid number of bits %s" % bits)
+
+
+class TransferFunction(object):
+    
+    """
+    A tone response curve
+    
+    gamma is a positive power, or a negative value as in specialpow (-2.4 =
+    sRGB, -3.0 = L*, -240 = SMPTE 240M, -601 = Rec. 601, -709 = Rec. 709),
+    or one of the names in transfer_functions.
+    
+    """
+    
+    cache = LRUCache()
+    
+    def __init__(self, gamma=2.2):
+        self.name = None
+        if isinstance(gamma, basestring):
+            if gamma not in transfer_functions:
+                raise ValueError("Unknown transfer function %r" % gamma)
+            self.name = gamma
+            gamma = transfer_functions[gamma]
+        if not gamma or (gamma < 0 and
+                         gamma not in transfer_functions.values()):
+            raise ValueError("Invalid gamma %s" % gamma)
+        self.gamma = gamma
+        self._decode = _specialpow_function(gamma)
+        self._encode = _specialpow_function(1.0 / gamma)
+        self._luts = {}
+    
+    @classmethod
+    def get(cls, gamma=2.2):
+        """ Return a cached transfer function """
+        function = cls.cache.get(gamma)
+        if function is None:
+            function = cls.cache[gamma] = cls(gamma)
+        return function
+    
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.name or self.gamma)
+    
+    def decode(self, values):
+        """ Encoded -> linear values (scalar or array) """
+        return _apply_signed(self._decode, values)
+    
+    def encode(self, values):
+        """ Linear -> encoded values (scalar or array) """
+        return _apply_signed(self._encode, values)
+    
+    def decode_lut(self, bits=16):
+        """ Linear values of the encoded integers 0..2 ** bits - 1 """
+        key = "decode", bits
+        lut = self._luts.get(key)
+        if lut is None:
+            lut = self.decode(numpy.arange(2 ** bits) / (2.0 ** bits - 1))
+            lut.flags.writeable = False
+            self._luts[key] = lut
+        return lut
+    
+    def encode_lut(self, size=4096):
+        """
+        Encoded values of size linear values from 0 to 1
+        
+        The linear values are spaced quadratically, (i / (size - 1.0)) ** 2,
+        so the table follows the steep start of the curves more closely.
+        
+        """
+        key = "encode", size
+        lut = self._luts.get(key)
+        if lut is None:
+            lut = self.encode(numpy.linspace(0.0, 1.0, size) ** 2)
+            lut.flags.writeable = False
+            self._luts[key] = lut
+        return lut
+    
+    def decode_int(self, values, bits=16):
+        """ Encoded integers 0..2 ** bits - 1 -> linear values, looked up """
+        return self.decode_lut(bits)[values]
+    
+    def encode_int(self, values, bits=16, size=4096):
+        """
+        Linear values (clipped to 0..1) -> encoded integers 0..2 ** bits - 1
+        
+        Raises ValueError for NaN values, like converting them to int does.
+        
+        Interpolates linearly in encode_lut(size) instead of evaluating the
+        curve. With the default size, 16-bit results are within one step of
+        the exact encoding, except for linear values below 1e-5 with power
+        curves steeper than gamma 2, and right at the junction of the linear
+        and power segments of Rec. 709 and SMPTE 240M (which don't quite
+        meet, the exact curves jump by 12 and 3 steps there).
+        
+        """
+        values = numpy.asarray(values, dtype=numpy.float64)
+        if numpy.isnan(values).any():
+            raise ValueError("Can't encode NaN as integer")
+        lut = self.encode_lut(size)
+        position = numpy.sqrt(numpy.clip(values, 0.0, 1.0)) * (size - 1)
+        index = numpy.minimum(position.astype(numpy.intp), size - 2)
+        encoded = lut[index] + (position - index) * (lut[index + 1] -
+                                                     lut[index])
+        # Curves may end a rounding error above 1
+        encoded = numpy.clip(encoded, 0.0, 1.0)
+        return (encoded * (2 ** bits - 1) + 0.5).astype(_uint_dtype(bits))
+
+
+# Color lookup table interpolation.
+#
+# A table is an array of shape (grid points, ..., grid points, output
+# channels) with one axis per input channel. Input values are in the range
+# 0..1 with a trailing axis of input channels and are clipped to that range.
+
+
+def _clut_cells(clut, values):
+    """
+    Locate values in the grid of clut.
+
+    Return the table flattened to (grid points ** inputs, outputs), the flat
+    index of the lower corner of the grid cell for each value, the position
+    of each value inside its cell (0..1 per input channel) and the flat index
+    strides of the input axes.
+
+    """
+    values = numpy.asarray(values, dtype=numpy.float64)
+    if not values.ndim or values.shape[-1] != clut.ndim - 1:
+        raise ValueError("Expected array with a trailing axis of %i, got "
+                         "shape %r" % (clut.ndim - 1, values.shape))
+    # An axis with a single grid point is constant, repeat it so every axis
+    # has at least one cell
+    for axis, points in enumerate(clut.shape[:-1]):
+        if points == 1:
+            clut = numpy.repeat(clut, 2, axis=axis)
+    grid = clut.shape[:-1]
+    gmax = numpy.array(grid) - 1
+    pos = numpy.clip(values, 0.0, 1.0) * gmax
+    index = numpy.minimum(pos.astype(numpy.intp), gmax - 1)
+    strides = numpy.cumprod((1, ) + grid[:0:-1])[::-1]
+    return (clut.reshape(-1, clut.shape[-1]), numpy.dot(index, strides),
+            pos - index, strides)
+
+
+def interp_multilinear(clut, values):
+    """
+    Interpolate values in clut linearly along each input axis.
+
+    Trilinear interpolation for three input channels, quadrilinear for four,
+    and so on.
+
+    """
+    table, base, frac, strides = _clut_cells(clut, values)
+    result = numpy.zeros(base.shape + table.shape[-1:])
+    for corner in xrange(1 << len(strides)):
+        offset = 0
+        weight = numpy.ones(base.shape)
+        for i, stride in enumerate(strides):
+            if corner & (1 << i):
+                offset += stride
+                weight *= frac[..., i]
+            else:
+                weight *= 1 - frac[..., i]
+        result += weight[..., numpy.newaxis] * table[base + offset]
+    return result
+
+
+def interp_tetrahedral(clut, values):
+    """
+    Interpolate values in a clut with three input channels, splitting each
+    grid cell into six tetrahedra along its neutral (black to white) axis.
+
+    """
+    table, base, frac, strides = _clut_cells(clut, values)
+    if len(strides) != 3:
+        raise ValueError("Tetrahedral interpolation needs three input "
+                         "channels, got %i" % len(strides))
+    # Walk from the lower to the upper cell corner along the input axes
+    # in order of descending position inside the cell
+    order = numpy.argsort(-frac, axis=-1)
+    frac = -numpy.sort(-frac, axis=-1)
+    step = strides[order]
+    corner1 = base + step[..., 0]
+    corner2 = corner1 + step[..., 1]
+    corner3 = base + strides.sum()
+    return ((1 - frac[..., 0:1]) * table[base] +
+            (frac[..., 0:1] - frac[..., 1:2]) * table[corner1] +
+            (frac[..., 1:2] - frac[..., 2:3]) * table[corner2] +
+            frac[..., 2:3] * table[corner3])
+
+
+def _matrix3x3_array(matrix):
+    """ Return matrix as 3x3 float64 array, raise ValueError if it isn't """
+    if isinstance(matrix, Matrix3x3):
+        return matrix._array
+    try:
+        rows = len(matrix)
+    except TypeError:
+        raise ValueError('Invalid 3x3 matrix: %r' % (matrix, ))
+    if rows != 3:
+        raise ValueError('Invalid number of rows for 3x3 matrix: %i' % rows)
+    for row in matrix:
+        try:
+            columns = len(row)
+        except TypeError:
+            raise ValueError('Invalid row for 3x3 matrix: %r' % (row, ))
+        if columns != 3:
+            raise ValueError('Invalid number of columns for 3x3 matrix: %i' %
+                             columns)
+    try:
+        array = numpy.array(matrix, dtype=numpy.float64, order="C")
+    except (TypeError, ValueError):
+        array = None
+    if array is None or array.shape != (3, 3):
+        raise ValueError('Invalid 3x3 matrix: %r' % (matrix, ))
+    return array
+
+
+class Matrix3x3(object):
+    
+    """
+    Simple 3x3 matrix, backed by a contiguous 3x3 float64 array
+    
+    Indexing, iteration and comparison work like for a list of lists:
+    rows are returned as lists (copies, assign to matrix[row] or
+    matrix[row, column] to change values). Multiplying by a matrix (or a
+    list of three rows) returns a matrix, by a triplet a list.
+    Multiplying by an array with a trailing axis of 3 transforms every
+    triplet in it at once and returns an array.
+    
+    A matrix created without values (or from an empty sequence) is all
+    zeros. Anything but 3x3 values raises ValueError.
+    
+    """
+    
+    __hash__ = None
     
     def __init__(self, matrix=None):
-        if matrix:
-            self.update(matrix)
+        self._array = numpy.zeros((3, 3))
+        if matrix is None or (hasattr(matrix, "__len__") and
+                              not len(matrix)):
+            # No values
+            return
+        self.update(matrix)
+    
+    def __array__(self, dtype=None):
+        if dtype is None:
+            return self._array
+        return self._array.astype(dtype)
+    
+    def __eq__(self, matrix):
+        try:
+            matrix = numpy.asarray(matrix, dtype=numpy.float64)
+        except (TypeError, ValueError):
+            return False
+        return matrix.shape == (3, 3) and bool((self._array == matrix).all())
+    
+    def __ne__(self, matrix):
+        return not self.__eq__(matrix)
+    
+    def __getitem__(self, index):
+        if isinstance(index, tuple):
+            # matrix[row, column]
+            return self._array[index]
+        return self._array[index].tolist()
+    
+    def __setitem__(self, index, value):
+        self._array[index] = value
+    
+    def __iter__(self):
+        return iter(self._array.tolist())
+    
+    def __len__(self):
+        return 3
     
-    def update(self, matrix):
-        if len(matrix) != 3:
-            raise ValueError('Invalid number of rows for 3x3 matrix: %i' % len(matrix))
-        while len(self):
-            self.pop()
-        for row in matrix:
-            if len(row) != 3:
-                raise ValueError('Invalid number of columns for 3x3 matrix: %i' % len(row))
-            self.append([])
-            for column in row:
-                self[-1].append(column)
+    def __repr__(self):
+        return repr(self.tolist())
     
-    def __add__(self, matrix):
+    def _new(self, array):
+        """ Return a new matrix of the same class backed by array """
         instance = self.__class__()
-        instance.update([[self[0][0] + matrix[0][0],
-                                self[0][1] + matrix[0][1],
-                                self[0][2] + matrix[0][2]],
-                               [self[1][0] + matrix[1][0],
-                                self[1][1] + matrix[1][1],
-                                self[1][2] + matrix[1][2]],
-                               [self[2][0] + matrix[2][0],
-                                self[2][1] + matrix[2][1],
-                                self[2][2] + matrix[2][2]]])
+        instance._array = numpy.ascontiguousarray(array, dtype=numpy.float64)
         return instance
     
+    def tolist(self):
+        return self._array.tolist()
+    
+    def update(self, matrix):
+        self._array = _matrix3x3_array(matrix).copy()
+    
+    def __add__(self, matrix):
+        return self._new(self._array + _matrix3x3_array(matrix))
+    
     def __iadd__(self, matrix):
         # inplace
         self.update(self.__add__(matrix))
@@ -1119,82 +2176,55 @@ class Matrix3x3(list):
         return self
     
     def __mul__(self, matrix):
-        if not isinstance(matrix[0], (list, tuple)):
-            return [matrix[0] * self[0][0] + matrix[1] * self[0][1] + matrix[2] * self[0][2],
-                    matrix[0] * self[1][0] + matrix[1] * self[1][1] + matrix[2] * self[1][2],
-                    matrix[0] * self[2][0] + matrix[1] * self[2][1] + matrix[2] * self[2][2]]
-        instance = self.__class__()
-        instance.update([[self[0][0]*matrix[0][0] + self[0][1]*matrix[1][0] + self[0][2]*matrix[2][0],
-                                self[0][0]*matrix[0][1] + self[0][1]*matrix[1][1] + self[0][2]*matrix[2][1],
-                                self[0][0]*matrix[0][2] + self[0][1]*matrix[1][2] + self[0][2]*matrix[2][2]],
-                               [self[1][0]*matrix[0][0] + self[1][1]*matrix[1][0] + self[1][2]*matrix[2][0],
-                                self[1][0]*matrix[0][1] + self[1][1]*matrix[1][1] + self[1][2]*matrix[2][1],
-                                self[1][0]*matrix[0][2] + self[1][1]*matrix[1][2] + self[1][2]*matrix[2][2]],
-                               [self[2][0]*matrix[0][0] + self[2][1]*matrix[1][0] + self[2][2]*matrix[2][0],
-                                self[2][0]*matrix[0][1] + self[2][1]*matrix[1][1] + self[2][2]*matrix[2][1],
-                                self[2][0]*matrix[0][2] + self[2][1]*matrix[1][2] + self[2][2]*matrix[2][2]]])
-        return instance
+        if isinstance(matrix, numpy.ndarray):
+            # Transform each triplet
+            return _matrix_apply(self._array, _array3(matrix))
+        if len(matrix) != 3:
+            raise ValueError('Invalid number of rows for 3x3 matrix or '
+                             'triplet: %i' % len(matrix))
+        if isinstance(matrix, Matrix3x3) or isinstance(matrix[0], (list, tuple,
+                                                                   numpy.ndarray)):
+            # Each column of matrix is a triplet to transform
+            matrix = _matrix3x3_array(matrix)
+            return self._new(_matrix_apply(self._array, matrix.T).T)
+        (a, b, c), (d, e, f), (g, h, i) = self.tolist()
+        return [matrix[0] * a + matrix[1] * b + matrix[2] * c,
+                matrix[0] * d + matrix[1] * e + matrix[2] * f,
+                matrix[0] * g + matrix[1] * h + matrix[2] * i]
     
     def adjoint(self):
-        return self.cofactors().transposed()
+        return self._new(numpy.transpose(self._cofactors()))
+    
+    def _cofactors(self):
+        (a, b, c), (d, e, f), (g, h, i) = self.tolist()
+        return [[(e*i - f*h), -1 * (d*i - f*g), (d*h - e*g)],
+                [-1 * (b*i - c*h), (a*i - c*g), -1 * (a*h - b*g)],
+                [(b*f - c*e), -1 * (a*f - d*c), (a*e - b*d)]]
     
     def cofactors(self):
-        instance = self.__class__()
-        instance.update([[(self[1][1]*self[2][2] - self[1][2]*self[2][1]),
-                                -1 * (self[1][0]*self[2][2] - self[1][2]*self[2][0]),
-                                (self[1][0]*self[2][1] - self[1][1]*self[2][0])],
-                               [-1 * (self[0][1]*self[2][2] - self[0][2]*self[2][1]),
-                                (self[0][0]*self[2][2] - self[0][2]*self[2][0]),
-                                -1 * (self[0][0]*self[2][1] -self[0][1]*self[2][0])],
-                               [(self[0][1]*self[1][2] - self[0][2]*self[1][1]),
-                                -1 * (self[0][0]*self[1][2] - self[1][0]*self[0][2]),
-                                (self[0][0]*self[1][1] - self[0][1]*self[1][0])]])
-        return instance
+        return self._new(self._cofactors())
     
     def determinant(self):
-        return ((self[0][0]*self[1][1]*self[2][2] + 
-                 self[1][0]*self[2][1]*self[0][2] + 
-                 self[0][1]*self[1][2]*self[2][0]) - 
-                (self[2][0]*self[1][1]*self[0][2] + 
-                 self[1][0]*self[0][1]*self[2][2] + 
-                 self[2][1]*self[1][2]*self[0][0]))
+        (a, b, c), (d, e, f), (g, h, i) = self.tolist()
+        return (a*e*i + d*h*c + b*f*g) - (g*e*c + d*b*i + h*f*a)
     
     def invert(self):
         # inplace
         self.update(self.inverted())
     
     def inverted(self):
-        determinant = self.determinant()
-        matrix = self.adjoint()
-        instance = self.__class__()
-        instance.update([[matrix[0][0] / determinant,
-                                matrix[0][1] / determinant,
-                                matrix[0][2] / determinant],
-                               [matrix[1][0] / determinant,
-                                matrix[1][1] / determinant,
-                                matrix[1][2] / determinant],
-                               [matrix[2][0] / determinant,
-                                matrix[2][1] / determinant,
-                                matrix[2][2] / determinant]])
-        return instance
+        return self._new(numpy.transpose(self._cofactors()) /
+                         self.determinant())
     
     def rounded(self, digits=3):
-        matrix = self.__class__()
-        for row in self:
-            matrix.append([])
-            for column in row:
-                matrix[-1].append(round(column, digits))
-        return matrix
+        return self._new([[round(column, digits) for column in row]
+                          for row in self.tolist()])
                                 
     def transpose(self):
         self.update(self.transposed())
     
     def transposed(self):
-        instance = self.__class__()
-        instance.update([[self[0][0], self[1][0], self[2][0]],
-                               [self[0][1], self[1][1], self[2][1]],
-                               [self[0][2], self[1][2], self[2][2]]])
-        return instance
+        return self._new(self._array.T)
 
 
 class NumberTuple(tuple):
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+
+"""
+In-process gamut volume and coverage.
+
+Computes the volume of a profile's gamut in Lab (D50), and how much of a
+reference gamut like sRGB it covers, as a replacement for Argyll's iccgamut
+and viewgam.
+
+A gamut is described by its radius around a center on the neutral axis
+(L* 50) in a grid of directions, like Argyll's gamut boundaries. The radii
+are found by intersecting the rays from the center with the gamut surface,
+i.e. the faces of the RGB cube transformed to Lab. The volume is then the
+integral of radius ** 3 / 3 over all directions, and the intersection of
+two gamuts has the smaller of both radii in each direction. For surfaces
+which are not star-shaped around the center, the outermost intersection
+counts.
+
+"""
+
+import numpy
+
+import colormath
+import cmm
+
+
+# Center of the gamuts in Lab
+CENTER = (50.0, 0.0, 0.0)
+
+# Directions are the centers of a grid of ANGLE_STEPS angles to the L* axis
+# by 2 * ANGLE_STEPS hue angles
+ANGLE_STEPS = 90
+
+# Steps per edge of each face of the RGB cube in the surface mesh
+SURFACE_STEPS = 32
+
+# Coverage keys of the gamut metadata (see ICCProfile.set_gamut_metadata)
+# and their reference colorspaces (see colormath.rgb_spaces)
+reference_spaces = {"srgb": "sRGB",
+                    "adobe-rgb": "Adobe RGB (1998)"}
+
+
+def cube_surface(steps=SURFACE_STEPS):
+    """
+    Return the vertices and triangles of a mesh of the RGB cube's faces.
+
+    Vertices are a (N, 3) array of device values 0..1, triangles a (M, 3)
+    array of vertex indices.
+
+    """
+    grid = numpy.linspace(0.0, 1.0, steps + 1)
+    u, v = [a.ravel() for a in numpy.meshgrid(grid, grid, indexing="ij")]
+    # Corners of the quads of one face
+    i, j = [a.ravel() for a in numpy.meshgrid(numpy.arange(steps),
+                                              numpy.arange(steps),
+                                              indexing="ij")]
+    corners = [i * (steps + 1) + j, (i + 1) * (steps + 1) + j,
+               (i + 1) * (steps + 1) + j + 1, i * (steps + 1) + j + 1]
+    quads = numpy.concatenate([numpy.column_stack(corners[:3]),
+                               numpy.column_stack([corners[0], corners[2],
+                                                   corners[3]])])
+    vertices = []
+    triangles = []
+    for axis in xrange(3):
+        for value in (0.0, 1.0):
+            face = numpy.empty((len(u), 3))
+            face[:, axis] = value
+            face[:, [n for n in xrange(3) if n != axis]] = numpy.column_stack(
+                [u, v])
+            triangles.append(quads + len(vertices) * len(u))
+            vertices.append(face)
+    return numpy.concatenate(vertices), numpy.concatenate(triangles)
+
+
+def directions(steps=ANGLE_STEPS):
+    """
+    Return the unit vectors (Lab) of the grid of directions, shape
+    (steps, 2 * steps, 3), and the solid angle of each grid cell.
+
+    """
+    step = numpy.pi / steps
+    edges = numpy.arange(steps + 1) * step
+    theta = edges[:-1] + step / 2
+    hue = numpy.arange(2 * steps) * step + step / 2 - numpy.pi
+    sin_theta = numpy.sin(theta)[:, numpy.newaxis]
+    vectors = numpy.empty((steps, 2 * steps, 3))
+    vectors[..., 0] = numpy.cos(theta)[:, numpy.newaxis]
+    vectors[..., 1] = sin_theta * numpy.cos(hue)
+    vectors[..., 2] = sin_theta * numpy.sin(hue)
+    solid_angles = (numpy.cos(edges[:-1]) - numpy.cos(edges[1:])) * step
+    return vectors, numpy.repeat(solid_angles[:, numpy.newaxis], 2 * steps,
+                                 axis=1)
+
+
+def _dot(a, b):
+    return a[:, 0] * b[:, 0] + a[:, 1] * b[:, 1] + a[:, 2] * b[:, 2]
+
+
+def _cross(a, b):
+    return numpy.column_stack([a[:, 1] * b[:, 2] - a[:, 2] * b[:, 1],
+                               a[:, 2] * b[:, 0] - a[:, 0] * b[:, 2],
+                               a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0]])
+
+
+def _candidates(vertices, steps):
+    """
+    Return the triangles and directions (as flat grid indices) of all
+    pairs where the direction may hit the triangle.
+
+    Each triangle lies within the spherical cap around its mean direction
+    through its vertices, so only the directions in that cap are tested.
+
+    """
+    step = numpy.pi / steps
+    hues = 2 * steps
+    units = vertices / numpy.sqrt((vertices ** 2).sum(axis=-1))[...,
+                                                                  numpy.newaxis]
+    center = units.sum(axis=1)
+    center /= numpy.sqrt((center ** 2).sum(axis=-1))[:, numpy.newaxis]
+    radius = numpy.arccos(numpy.clip((units * center[:, numpy.newaxis]).sum(
+        axis=-1), -1.0, 1.0)).max(axis=1)
+    theta = numpy.arccos(numpy.clip(center[:, 0], -1.0, 1.0))
+    hue = numpy.arctan2(center[:, 2], center[:, 1])
+    theta0 = numpy.clip(numpy.floor((theta - radius) / step), 0,
+                        steps - 1).astype(numpy.intp)
+    theta1 = numpy.clip(numpy.floor((theta + radius) / step), 0,
+                        steps - 1).astype(numpy.intp)
+    # Hue range of the cap, all hues if it contains the L* axis
+    pole = (theta - radius <= 0) | (theta + radius >= numpy.pi)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        width = numpy.arcsin(numpy.minimum(1.0, numpy.sin(radius) /
+                                           numpy.sin(theta)))
+    hue0 = numpy.floor((hue - width + numpy.pi) / step).astype(numpy.intp)
+    hue1 = numpy.floor((hue + width + numpy.pi) / step).astype(numpy.intp)
+    full = pole | (hue1 - hue0 + 1 >= hues)
+    hue0[full] = 0
+    hue1[full] = hues - 1
+    rows = theta1 - theta0 + 1
+    columns = hue1 - hue0 + 1
+    counts = rows * columns
+    triangles = numpy.repeat(numpy.arange(len(vertices)), counts)
+    offsets = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) -
+                                                        counts, counts)
+    columns = columns[triangles]
+    row = theta0[triangles] + offsets // columns
+    column = (hue0[triangles] + offsets % columns) % hues
+    return triangles, row * hues + column
+
+
+class Gamut(object):
+
+    """
+    A gamut as its radius around CENTER in a grid of directions (see
+    directions)
+
+    """
+
+    cache = {}
+
+    def __init__(self, radius):
+        self.radius = radius
+
+    @classmethod
+    def from_surface(cls, Lab, triangles, steps=ANGLE_STEPS, chunk=262144):
+        """
+        Create a gamut from its surface, a mesh of Lab vertices (N, 3) and
+        triangles (M, 3) as vertex indices.
+
+        Pairs of triangles and directions are tested in chunks of chunk.
+
+        """
+        vectors, solid_angles = directions(steps)
+        vectors = vectors.reshape(-1, 3)
+        vertices = (numpy.asarray(Lab, dtype=numpy.float64) -
+                    CENTER)[triangles]
+        radius = numpy.zeros(len(vectors))
+        candidates, rays = _candidates(vertices, steps)
+        tolerance = 1e-9
+        for start in xrange(0, len(candidates), chunk):
+            # Moeller-Trumbore ray/triangle intersection, rays start at the
+            # center
+            triangle = vertices[candidates[start:start + chunk]]
+            ray = rays[start:start + chunk]
+            direction = vectors[ray]
+            edge1 = triangle[:, 1] - triangle[:, 0]
+            edge2 = triangle[:, 2] - triangle[:, 0]
+            p = _cross(direction, edge2)
+            determinant = _dot(edge1, p)
+            with numpy.errstate(divide="ignore", invalid="ignore"):
+                inverse = 1.0 / determinant
+                s = -triangle[:, 0]
+                u = _dot(s, p) * inverse
+                q = _cross(s, edge1)
+                v = _dot(direction, q) * inverse
+                t = _dot(edge2, q) * inverse
+                hit = ((u >= -tolerance) & (v >= -tolerance) &
+                       (u + v <= 1 + tolerance) & (t > 0))
+            # The outermost hit of each ray
+            ray, t = ray[hit], t[hit]
+            order = numpy.lexsort((t, ray))
+            ray, t = ray[order], t[order]
+            last = numpy.append(ray[1:] != ray[:-1], True)
+            radius[ray[last]] = numpy.maximum(radius[ray[last]], t[last])
+        return cls(radius.reshape(solid_angles.shape))
+
+    @classmethod
+    def from_device(cls, lookup, steps=ANGLE_STEPS,
+                    surface_steps=SURFACE_STEPS):
+        """
+        Create the gamut of a RGB device from a lookup function, which
+        transforms an array of device values 0..1 (trailing axis 3) to Lab.
+
+        """
+        device, triangles = cube_surface(surface_steps)
+        return cls.from_surface(lookup(device), triangles, steps)
+
+    @classmethod
+    def from_profile(cls, profile, intent="r", steps=ANGLE_STEPS,
+                     surface_steps=SURFACE_STEPS):
+        """
+        Create the gamut of a RGB profile.
+
+        Raises NotImplementedError if the profile is not supported by
+        cmm.Transform, or is not RGB.
+
+        """
+        transform = cmm.Transform(profile, "f", intent, "l")
+        if transform.device_channels != 3:
+            raise NotImplementedError("Unsupported color space %s" %
+                                      profile.colorSpace)
+        return cls.from_device(transform, steps, surface_steps)
+
+    @classmethod
+    def from_rgb_space(cls, rgb_space, steps=ANGLE_STEPS,
+                       surface_steps=SURFACE_STEPS):
+        """
+        Create the gamut of a RGB colorspace (see colormath.get_rgb_space),
+        adapted to D50.
+
+        """
+        space = colormath.RGBSpace.get(rgb_space)
+        to_pcs = space.to_pcs("D50")
+
+        def lookup(RGB):
+            XYZ = to_pcs(space.trc.decode(RGB))
+            return colormath.XYZ2Lab_array(XYZ * 100, "D50")
+
+        return cls.from_device(lookup, steps, surface_steps)
+
+    @classmethod
+    def get(cls, rgb_space):
+        """ Return the cached gamut of a RGB colorspace """
+        cachehash = colormath._hashable(rgb_space)
+        gamut = cls.cache.get(cachehash)
+        if gamut is None:
+            gamut = cls.cache[cachehash] = cls.from_rgb_space(rgb_space)
+        return gamut
+
+    @property
+    def volume(self):
+        """ Volume in cubic Lab units """
+        return self._volume(self.radius)
+
+    def _volume(self, radius):
+        vectors, solid_angles = directions(len(radius))
+        return (radius ** 3 / 3.0 * solid_angles).sum()
+
+    def intersection(self, gamut):
+        """ Volume of the intersection with another gamut """
+        return self._volume(numpy.minimum(self.radius, gamut.radius))
+
+    def coverage(self, gamut):
+        """ Fraction of another gamut's volume which this gamut covers """
+        return self.intersection(gamut) / gamut.volume
+
+
+def calculate_gamut(profile, intent="r"):
+    """
+    Calculate gamut volume and coverage of the reference spaces.
+
+    Return gamut volume (scaled to sRGB = 1.0) and coverage (dict) as tuple,
+    like Worker.calculate_gamut.
+
+    Raises NotImplementedError if the profile is not supported (see
+    Gamut.from_profile).
+
+    """
+    gamut = Gamut.from_profile(profile, intent)
+    gamut_volume = gamut.volume / Gamut.get("sRGB").volume
+    gamut_coverage = {}
+    for key, rgb_space in reference_spaces.iteritems():
+        gamut_coverage[key] = gamut.coverage(Gamut.get(rgb_space))
+    return gamut_volume, gamut_coverage
@@ -92,7 +92,9 @@ class OrderedDict(dict):
         return reversed(self._keys)
     
     def __setitem__(self, key, value):
-        if not key in self._keys:
+        # Membership test through the dict, not the key list, so adding
+        # n keys stays linear
+        if not dict.__contains__(self, key):
             self._keys.append(key)
         dict.__setitem__(self, key, value)
     
@@ -102,8 +104,10 @@ class OrderedDict(dict):
         """
         for key in iter(self._keys[i:j]):
             dict.__delitem__(self, key)
-        self._keys[i:j] = self.__class__(iterable).keys()
-        self.update(iterable)
+        items = self.__class__(iterable)
+        self._keys[i:j] = items.keys()
+        for key, value in items.iteritems():
+            dict.__setitem__(self, key, value)
     
     def clear(self):
         dict.clear(self)
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for CGATS.
+
+Run from the directory containing the colorkit package:
+
+    python -m unittest discover -s colorkit/icc/tests -t .
+
+"""
+
+import copy
+import unittest
+from StringIO import StringIO
+
+from colorkit.icc import CGATS
+from colorkit.icc import colormath
+
+
+TI3 = """CTI3
+
+DESCRIPTOR "Argyll Calibration Target chart information 3"
+ORIGINATOR "Argyll dispread"
+CREATED "Wed Jan 01 00:00:00 2014"
+KEYWORD "DEVICE_CLASS"
+DEVICE_CLASS "DISPLAY"
+COLOR_REP "RGB_XYZ"
+
+NUMBER_OF_FIELDS 8
+BEGIN_DATA_FORMAT
+SAMPLE_ID SAMPLE_NAME RGB_R RGB_G RGB_B XYZ_X XYZ_Y XYZ_Z  # comment
+END_DATA_FORMAT
+
+NUMBER_OF_SETS 9
+BEGIN_DATA
+1 P0 0.0000 0.0000 0.0000 0.500000 0.520000 0.600000
+2 P1 -0.0 0.0000 0.0000 0.400000 0.500000 0.700000
+3 P2 0.0000 0.0000 0.0000 1.878980 61.763550 61.209572
+4 "P3" 100.0000 100.0000 100.0000 61.693400 94.374808 68.182030
+5 P4 100.0000 100.0000 100.0000 95.0456 100 108.9058
+6 P5 25.0000 25.0000 0.0000 6.022547 -0.25 1e-05
+7 P6 25.0000 100.0000 75.0000 21.038256 12.892630 31.542835
+8 P7 0.0000 75.0000 0.0000 36.371077 57.019677 -43.860151
+9 P8 12.5 75.0000 0.0000 98.837384 10.204481 20.887676
+END_DATA
+"""
+
+# The text of TI3 as written before DATA was stored as columns
+TI3_OUT = ('CTI3   \n'
+           '\n'
+           'ORIGINATOR "Argyll dispread"\n'
+           'CREATED "Wed Jan 01 00:00:00 2014"\n'
+           'DESCRIPTOR "Argyll Calibration Target chart information 3"\n'
+           'KEYWORD "DEVICE_CLASS"\n'
+           'DEVICE_CLASS "DISPLAY"\n'
+           'COLOR_REP "RGB_XYZ"\n'
+           '\n'
+           'NUMBER_OF_FIELDS 8\n'
+           'BEGIN_DATA_FORMAT\n'
+           'SAMPLE_ID SAMPLE_NAME RGB_R RGB_G RGB_B XYZ_X XYZ_Y XYZ_Z\n'
+           'END_DATA_FORMAT\n'
+           '\n'
+           'NUMBER_OF_SETS 9\n'
+           'BEGIN_DATA\n'
+           '1 P0 0.0000000 0.0000000 0.0000000 0.5000000 0.5200000 0.6000000\n'
+           '2 P1 -0.000000 0.0000000 0.0000000 0.4000000 0.5000000 0.7000000\n'
+           '3 P2 0.0000000 0.0000000 0.0000000 1.8789800 61.763550 61.209572\n'
+           '4 P3 100.00000 100.00000 100.00000 61.693400 94.374808 68.182030\n'
+           '5 P4 100.00000 100.00000 100.00000 95.045600 100.00000 108.90580\n'
+           '6 P5 25.000000 25.000000 0.0000000 6.0225470 -0.2500000 1e-05\n'
+           '7 P6 25.000000 100.00000 75.000000 21.038256 12.892630 31.542835\n'
+           '8 P7 0.0000000 75.000000 0.0000000 36.371077 57.019677 -43.860151\n'
+           '9 P8 12.500000 75.000000 0.0000000 98.837384 10.204481 20.887676\n'
+           'END_DATA')
+
+
+class CGATSTest(unittest.TestCase):
+
+    def test_str(self):
+        for columnar in (True, False):
+            self.assertEqual(str(CGATS.CGATS(TI3, columnar=columnar)),
+                             TI3_OUT)
+
+    def test_round_trip(self):
+        cgats = CGATS.CGATS(TI3)
+        self.assertEqual(str(CGATS.CGATS(str(cgats))), TI3_OUT)
+
+    def test_iterlines(self):
+        cgats = CGATS.CGATS(TI3)
+        for chunksize in (1, 2, 4, 9, 1000):
+            lines = list(cgats.iterlines(chunksize))
+            self.assertEqual("\n".join(lines), TI3_OUT)
+            start = lines.index("BEGIN_DATA") + 1
+            self.assertEqual(len(lines) - start - 1, -(-9 // chunksize))
+
+    def test_write(self):
+        stream = StringIO()
+        CGATS.CGATS(TI3).write(stream)
+        self.assertEqual(stream.getvalue(), TI3_OUT)
+
+    def test_samples(self):
+        columnar = CGATS.CGATS(TI3)[0].DATA
+        rows = CGATS.CGATS(TI3, columnar=False)[0].DATA
+        fields = rows.parent.DATA_FORMAT.values()
+        self.assertTrue(columnar.get_columns() is not None)
+        for key in rows:
+            for field in fields:
+                self.assertEqual(repr(columnar[key][field]),
+                                 repr(rows[key][field]))
+        for field in fields:
+            self.assertEqual(columnar.get_values(field),
+                             rows.get_values(field))
+            self.assertEqual(columnar.get_values(field, [8, 2]),
+                             [rows[8][field], rows[2][field]])
+
+    def test_modified(self):
+        cgats = [CGATS.CGATS(TI3), CGATS.CGATS(TI3, columnar=False)]
+        for data in [item[0].DATA for item in cgats]:
+            data[3].XYZ_Y = -12.5
+            data[5].RGB_R = 0.0
+        self.assertEqual(str(cgats[0]), str(cgats[1]))
+        self.assertNotEqual(str(cgats[0]), TI3_OUT)
+
+    def test_query(self):
+        columnar = CGATS.CGATS(TI3)
+        rows = CGATS.CGATS(TI3, columnar=False)
+        # Columns are indexed by field, rows one by one. Both must give
+        # the same results
+        for query, query_value in (("DEVICE_CLASS", None),
+                                   ("NUMBER_OF_SETS", None),
+                                   ("DATA_FORMAT", None),
+                                   (("RGB_R", "RGB_G"), 100.0),
+                                   ({"RGB_R": 25, "RGB_B": 0}, None),
+                                   ({"SAMPLE_NAME": "P3"}, None),
+                                   ("SAMPLE_ID", None),
+                                   ("XYZ_Y", -1),
+                                   ("MISSING", None)):
+            for method in ("queryi", "queryv", "queryi1", "queryv1"):
+                self.assertEqual(
+                    str(getattr(columnar, method)(query, query_value)),
+                    str(getattr(rows, method)(query, query_value)))
+        self.assertEqual(columnar.queryv1("DEVICE_CLASS"), "DISPLAY")
+        self.assertEqual(columnar.queryv1("NUMBER_OF_SETS"), 9)
+        self.assertEqual([sample.SAMPLE_ID for sample in
+                          columnar.queryi({"RGB_R": 100,
+                                           "RGB_G": 100}).values()], [4, 5])
+        self.assertEqual(columnar.queryi1({"SAMPLE_NAME": "P3"}).SAMPLE_ID,
+                         4)
+        self.assertEqual(columnar.queryv(("SAMPLE_ID", "XYZ_Y"))[2].values(),
+                         [3, 61.76355])
+        self.assertEqual(columnar.queryi1("XYZ_Y", -1), None)
+        self.assertEqual(len(columnar.queryi("XYZ_Y", -1)), 0)
+
+    def test_query_modified(self):
+        cgats = CGATS.CGATS(TI3)
+        self.assertEqual(len(cgats.queryi("RGB_R", 0)), 4)
+        index = cgats._index
+        self.assertEqual(cgats.queryv1("RGB_G", 75.0), 75.0)
+        self.assertTrue(cgats._index is index)
+        # Modifications invalidate the index
+        cgats[0].DATA[6].RGB_R = 0.0
+        self.assertEqual([sample.SAMPLE_ID for sample in
+                          cgats.queryi("RGB_R", 0).values()], [1, 2, 3, 7, 8])
+        self.assertFalse(cgats._index is index)
+        cgats[0].DEVICE_CLASS = "OUTPUT"
+        self.assertEqual(cgats.queryv1("DEVICE_CLASS"), "OUTPUT")
+
+    def test_copy(self):
+        for columnar in (True, False):
+            cgats = CGATS.CGATS(TI3, columnar=columnar)
+            for clone in (cgats.copy(), copy.copy(cgats), copy.deepcopy(cgats),
+                          cgats.copy(False)):
+                self.assertEqual(str(clone), TI3_OUT)
+                data = clone[0].DATA
+                self.assertTrue(data.root is clone)
+                self.assertTrue(data.parent is clone[0])
+                self.assertTrue(data[0].root is clone)
+                self.assertFalse(clone.modified)
+                # Changes on either side don't affect the other
+                data[0].RGB_R = 50.0
+                cgats[0].DATA[1].RGB_G = 75.0
+                self.assertTrue(clone.modified)
+                self.assertEqual(data[0].RGB_R, 50.0)
+                self.assertEqual(cgats[0].DATA[0].RGB_R, 0.0)
+                self.assertEqual(data[1].RGB_G, 0.0)
+                self.assertEqual(cgats[0].DATA[1].RGB_G, 75.0)
+                cgats[0].DATA[1].RGB_G = 0.0
+                self.assertEqual(str(cgats), TI3_OUT)
+                cgats.modified = False
+        # A copy of a part of the structure becomes its own root
+        data = CGATS.CGATS(TI3)[0].DATA.copy()
+        self.assertTrue(data.root is data)
+        self.assertEqual(data[3].SAMPLE_NAME, "P3")
+
+    def test_apply_bpc(self):
+        rows = CGATS.CGATS(TI3, columnar=False)[0].DATA
+        samples = [[rows[key][field] for field in
+                    ("RGB_R", "RGB_G", "RGB_B", "XYZ_X", "XYZ_Y", "XYZ_Z")]
+                   for key in rows]
+        # Averages of all blacks (none has Y = 0) and whites up to the first
+        # with Y = 100
+        black = [sum(values) / 3.0 for values in
+                 zip(*[sample[3:] for sample in samples[:3]])]
+        white = [sum(values) / 2.0 for values in
+                 zip(*[sample[3:] for sample in samples[3:5]])]
+        expected = [colormath.apply_bpc(X, Y, Z, black, (0, 0, 0), white)
+                    for R, G, B, X, Y, Z in samples]
+        for columnar in (True, False):
+            cgats = CGATS.CGATS(TI3, columnar=columnar)
+            self.assertTrue(cgats.apply_bpc())
+            data = cgats[0].DATA
+            for key, XYZ in enumerate(expected):
+                for field, value in zip(("XYZ_X", "XYZ_Y", "XYZ_Z"), XYZ):
+                    self.assertAlmostEqual(data[key][field], value, 12)
+        # No black patch
+        cgats = CGATS.CGATS(TI3.replace("1 P0 0.0000", "1 P0 1.0000")
+                               .replace("2 P1 -0.0", "2 P1 1.0")
+                               .replace("3 P2 0.0000", "3 P2 1.0000"))
+        self.assertFalse(cgats.apply_bpc())
+        self.assertFalse(cgats.modified)
+
+    def test_scale_rgb(self):
+        for columnar in (True, False):
+            cgats = CGATS.CGATS(TI3, columnar=columnar)
+            rows = CGATS.CGATS(TI3, columnar=False)[0].DATA
+            cgats.scale_rgb()
+            data = cgats[0].DATA
+            for key in rows:
+                for field in ("RGB_R", "RGB_G", "RGB_B"):
+                    self.assertEqual(data[key][field], rows[key][field] * 2.55)
+                self.assertEqual(data[key].XYZ_Y, rows[key].XYZ_Y)
+        # Integer values stay integers
+        cgats = CGATS.CGATS(TI3)
+        cgats[0].DATA[8].RGB_R = 12
+        cgats.scale_rgb(2)
+        self.assertEqual(repr(cgats[0].DATA[8].RGB_R), "24")
+        self.assertEqual(repr(cgats[0].DATA[8].RGB_G), "150.0")
+
+    def test_rpad_values(self):
+        values = [0.0, -0.0, 1e-05, -2.5e-07, 12.5, -3.25, 100.0, 12.5,
+                  -0.0, 99.123456789, 123456789.0]
+        for width in (4, 7, 9):
+            expected = [CGATS.rpad(value, width + (1 if value < 0 else 0))
+                        for value in values]
+            self.assertEqual(CGATS.rpad_values(values, width), expected)
+            self.assertEqual(CGATS.rpad_values(values + [3, "A"], width),
+                             expected + ["3", "A"])
+        self.assertEqual(CGATS.rpad_values([], 7), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,571 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for ICCProfile.
+
+Run from the directory containing the colorkit package:
+
+    python -m unittest discover -s colorkit/icc/tests -t .
+
+"""
+
+import math
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from hashlib import md5
+
+import numpy
+
+from colorkit.icc import ICCProfile as ICCP
+
+
+def curv(gamma=None):
+    """ Return a 4-byte aligned 'curv' tag, identity if gamma is None """
+    if gamma is None:
+        return "curv\0\0\0\0" + struct.pack(">I", 0)
+    return "curv\0\0\0\0" + struct.pack(">IH", 1, int(gamma * 256)) + "\0\0"
+
+
+def para(functionType, *params):
+    """ Return a 'para' tag """
+    return ("para\0\0\0\0" + struct.pack(">H", functionType) + "\0\0" +
+            "".join(struct.pack(">i", int(round(param * 65536)))
+                    for param in params))
+
+
+def mAB(gridPoints, clut, outputChannels=3, B=None):
+    """
+    Return a lutAtoBType tag with identity A and B curves (unless B is
+    given) and a 16-bit CLUT.
+
+    """
+    inputChannels = len(gridPoints)
+    B = B or curv() * outputChannels
+    A = curv() * inputChannels
+    clut = ("".join(chr(points) for points in gridPoints).ljust(16, "\0") +
+            "\2\0\0\0" + numpy.asarray(clut, dtype=">u2").tostring())
+    offsetB = 32
+    offsetCLUT = offsetB + len(B)
+    offsetA = offsetCLUT + len(clut) + (-len(clut) % 4)
+    return ("mAB \0\0\0\0" + chr(inputChannels) + chr(outputChannels) +
+            "\0\0" + struct.pack(">5I", offsetB, 0, 0, offsetCLUT, offsetA) +
+            B + clut.ljust(offsetA - offsetCLUT, "\0") + A)
+
+
+class LUTTypeTest(unittest.TestCase):
+
+    def test_clut(self):
+        # Output = input for a 2x2x2 grid
+        grid = numpy.indices((2, 2, 2)).transpose(1, 2, 3, 0) * 65535
+        lut = ICCP.LUTAtoBType(mAB((2, 2, 2), grid), "A2B0")
+        values = numpy.random.RandomState(3).rand(100, 3)
+        for interpolation in ("tetrahedral", "trilinear"):
+            numpy.testing.assert_allclose(lut.apply(values, interpolation),
+                                          values, atol=1e-12)
+
+    def test_clut_single_grid_point(self):
+        # The second input channel has a single grid point, i.e. it does
+        # not affect the output
+        grid = numpy.zeros((3, 1, 2, 3))
+        grid[..., 0] = numpy.array([0, 32767, 65534])[:, numpy.newaxis,
+                                                      numpy.newaxis]
+        grid[..., 2] = numpy.array([0, 65535])
+        lut = ICCP.LUTAtoBType(mAB((3, 1, 2), grid), "A2B0")
+        values = numpy.random.RandomState(4).rand(100, 3)
+        expected = values * (65534 / 65535.0, 0, 1)
+        for interpolation in ("tetrahedral", "trilinear"):
+            numpy.testing.assert_allclose(lut.apply(values, interpolation),
+                                          expected, atol=1e-12)
+        # Constant table
+        lut = ICCP.LUTAtoBType(mAB((1, 1, 1), [[0, 32768, 65535]]), "A2B0")
+        numpy.testing.assert_allclose(lut.apply(values),
+                                      [[0, 32768 / 65535.0, 1]] * 100)
+
+    def test_parametric_curves(self):
+        grid = numpy.indices((2, 2, 2)).transpose(1, 2, 3, 0) * 65535
+        B = para(0, 2.0) + para(3, 2.4, 1 / 1.055, 0.055 / 1.055,
+                                1 / 12.92, 0.04045) + curv(2.5)
+        lut = ICCP.LUTAtoBType(mAB((2, 2, 2), grid, B=B), "A2B0")
+        values = numpy.linspace(0, 1, 101)[:, numpy.newaxis].repeat(3, axis=1)
+        result = lut.apply(values)
+        numpy.testing.assert_allclose(result[:, 0], values[:, 0] ** 2,
+                                      atol=1e-4)
+        numpy.testing.assert_allclose(result[:, 1],
+                                      numpy.where(values[:, 1] >= 0.04045,
+                                                  ((values[:, 1] + 0.055) /
+                                                   1.055) ** 2.4,
+                                                  values[:, 1] / 12.92),
+                                      atol=1e-4)
+        numpy.testing.assert_allclose(result[:, 2], values[:, 2] ** 2.5,
+                                      atol=1e-4)
+
+    def test_invalid_parametric_curve(self):
+        grid = numpy.zeros((2, 2, 2, 3))
+        B = para(7, 1.0) + curv() * 2
+        self.assertRaises(ICCP.ICCProfileInvalidError, ICCP.LUTAtoBType,
+                          mAB((2, 2, 2), grid, B=B), "A2B0")
+        self.assertRaises(ICCP.ICCProfileInvalidError,
+                          ICCP.ParametricCurveType, para(5, 1.0))
+
+
+
+class CurveTypeTest(unittest.TestCase):
+
+    def assertCurve(self, trc, entries):
+        self.assertEqual(list(trc), entries)
+        self.assertEqual(trc.array.tolist(), entries)
+        self.assertEqual(list(ICCP.CurveType(trc.get_tagData())), entries)
+
+    def test_decode(self):
+        trc = ICCP.CurveType(curv(2.5))
+        self.assertCurve(trc, [2.5])
+        trc = ICCP.CurveType(curv())
+        self.assertEqual(list(trc), [1.0])
+        trc = ICCP.CurveType()
+        trc.set_trc(-2.4, 256)
+        tagData = trc.tagData
+        trc = ICCP.CurveType(tagData)
+        self.assertEqual(trc.get_tagData(), tagData)
+        self.assertCurve(trc, list(ICCP.CurveType(tagData)))
+        self.assertEqual(trc.get_transfer_function()[0], ("sRGB", -2.4))
+
+    def test_modify(self):
+        trc = ICCP.CurveType()
+        trc.set_trc(2.2, 8)
+        entries = list(trc)
+        # Each modification must discard the cached array and tag data
+        for modify in (lambda l: l.__setitem__(1, 100),
+                       lambda l: l.__setitem__(slice(0, 8, 2), [1, 2, 3, 4]),
+                       lambda l: l.__setslice__(2, 4, [10, 20, 30]),
+                       lambda l: l.__delitem__(0),
+                       lambda l: l.__delslice__(0, 1),
+                       lambda l: l.extend([60000, 65535]),
+                       lambda l: l.append(65535),
+                       lambda l: l.insert(0, 0),
+                       lambda l: l.pop(),
+                       lambda l: l.remove(30),
+                       lambda l: l.reverse(),
+                       lambda l: l.sort()):
+            trc.array
+            trc.get_tagData()
+            modify(trc)
+            modify(entries)
+            self.assertCurve(trc, entries)
+        trc[:] = entries = [0, 32768, 65535]
+        self.assertCurve(trc, entries)
+        trc += [65535]
+        self.assertTrue(isinstance(trc, ICCP.CurveType))
+        self.assertCurve(trc, entries + [65535])
+        trc *= 2
+        self.assertTrue(isinstance(trc, ICCP.CurveType))
+        self.assertCurve(trc, (entries + [65535]) * 2)
+        self.assertEqual(trc.pop(0), 0)
+
+    def test_transfer_function_cache(self):
+        trc = ICCP.CurveType()
+        trc.set_trc(-2.4, 1024)
+        self.assertEqual(trc.get_transfer_function()[0], ("sRGB", -2.4))
+        lstar = ICCP.CurveType()
+        lstar.set_trc(-3.0, 1024)
+        trc[:] = list(lstar)
+        self.assertEqual(trc.get_transfer_function()[0], ("L*", -3.0))
+
+
+def vcgt(data, entrySize=2):
+    """ Return a table type 'vcgt' tag for a list of channels """
+    dtype = {1: ">u1", 2: ">u2"}[entrySize]
+    return ("vcgt\0\0\0\0" + struct.pack(">IHHH", 0, len(data), len(data[0]),
+                                         entrySize) +
+            numpy.asarray(data, dtype=dtype).tostring())
+
+
+class VideoCardGammaTableTypeTest(unittest.TestCase):
+
+    """
+    Compare the table operations to the per-entry loops they replaced
+    (the reference functions below).
+
+    """
+
+    def setUp(self):
+        random = numpy.random.RandomState(5)
+        ramp = numpy.linspace(0, 1, 256)
+        # Increasing curves with some noise
+        self.data = [numpy.maximum.accumulate(numpy.clip(
+            65535 * ramp ** gamma + random.normal(0, 100, 256), 0,
+            65535)).astype(int).tolist() for gamma in (0.9, 1.0, 1.2)]
+        self.tag = ICCP.VideoCardGammaTableType(vcgt(self.data), "vcgt")
+
+    def reference_resize(self, data, length):
+        resized = []
+        for channel in data:
+            resized.append([])
+            for j in xrange(0, length):
+                j *= (len(channel) - 1) / float(length - 1)
+                if int(j) != j:
+                    floor = channel[int(math.floor(j))]
+                    ceil = channel[min(int(math.ceil(j)), len(channel) - 1)]
+                    interpolated = xrange(floor, ceil + 1)
+                    fraction = j - int(j)
+                    v = interpolated[int(round(fraction * (ceil - floor)))]
+                else:
+                    v = channel[int(j)]
+                resized[-1].append(v)
+        return resized
+
+    def test_decode(self):
+        self.assertEqual(self.tag.channels, 3)
+        self.assertEqual(self.tag.entryCount, 256)
+        self.assertEqual(self.tag.data.tolist(), self.data)
+        self.assertEqual(self.tag.tagData, vcgt(self.data))
+        tag = ICCP.VideoCardGammaTableType(vcgt(self.data, 1), "vcgt")
+        self.assertEqual(tag.data.tolist(), (numpy.array(self.data) %
+                                             256).tolist())
+
+    def test_normalized_values(self):
+        values = zip(*[[entry / 65535.0 for entry in channel]
+                       for channel in self.data])
+        self.assertEqual(self.tag.getNormalizedValues(), values)
+        step = 256 / float(17 - 1)
+        self.assertEqual(self.tag.getNormalizedValues(17),
+                         [value for i, value in enumerate(values)
+                          if i == 0 or (i + 1) % step < 1 or i + 1 == 256])
+
+    def test_resize(self):
+        for length in (16, 100, 256, 1024):
+            tag = self.tag.resized(length)
+            self.assertEqual(tag.entryCount, length)
+            self.assertEqual(tag.data.tolist(),
+                             self.reference_resize(self.data, length))
+
+    def test_smooth_cr(self):
+        self.tag.smooth_cr(64)
+        resized = self.reference_resize(self.data, 64)
+        step = 63 / 255.0
+        self.assertEqual(self.tag.data.tolist(),
+                         [[int(round(ICCP.CRInterpolation(channel)(j * step)))
+                           for j in xrange(256)] for channel in resized])
+
+    def test_smooth_avg(self):
+        for window in ((1.0, 1.0, 1.0), (0.5, 1.0, 2.0, 1.0, 0.5)):
+            tag = ICCP.VideoCardGammaTableType(vcgt(self.data), "vcgt")
+            tag.smooth_avg(2, window)
+            data = self.data
+            for x in xrange(2):
+                smoothed = []
+                for channel in data:
+                    smoothed.append([])
+                    for j, v in enumerate(channel):
+                        tl = min(j, len(channel) - 1 - j,
+                                 (len(window) - 1) / 2)
+                        if tl:
+                            weights = window[len(window) / 2 - tl:
+                                             len(window) / 2 + tl + 1]
+                            v = int(round(sum(float(weight) * value
+                                              for weight, value in
+                                              zip(weights,
+                                                  channel[j - tl:j + tl + 1]))
+                                          / sum(weights)))
+                        smoothed[-1].append(v)
+                data = smoothed
+            self.assertEqual(tag.data.tolist(), data)
+            self.assertEqual(ICCP.VideoCardGammaTableType(tag.tagData,
+                                                          "vcgt").data.tolist(),
+                             data)
+
+
+    def test_overshoot(self):
+        # Catmull-Rom overshoots at the edges of steps, which must be
+        # clipped instead of wrapping around when encoded
+        step = [[0] * 128 + [65535] * 128] * 3
+        for entrySize, vmax in ((1, 255), (2, 65535)):
+            data = (numpy.array(step) * vmax / 65535).tolist()
+            tag = ICCP.VideoCardGammaTableType(vcgt(data, entrySize), "vcgt")
+            tag.smooth_cr(8)
+            smoothed = numpy.asarray(tag.data)
+            self.assertTrue(smoothed.min() < 0 and smoothed.max() > vmax)
+            decoded = ICCP.VideoCardGammaTableType(tag.tagData, "vcgt").data
+            self.assertEqual(decoded.tolist(),
+                             numpy.clip(smoothed, 0, vmax).tolist())
+            self.assertTrue(numpy.all(numpy.diff(decoded.astype(int)) >= 0))
+
+class NamedColor2TypeTest(unittest.TestCase):
+
+    def make_tag(self, pcs, deviceCoordCount):
+        """ Create tag data color by color """
+        rng = numpy.random.RandomState(20)
+        tag = ICCP.NamedColor2Type(pcs=pcs)
+        tag.deviceCoordCount = deviceCoordCount
+        tag._prefix = "Test "
+        tag._suffix = " CV"
+        tag.vendorData = "\0\0\0\1"
+        if pcs == "Lab":
+            values = rng.uniform((0, -128, -128), (100, 127, 127), (50, 3))
+        else:
+            values = rng.uniform(0, 100, (50, 3))
+        for i, pcsvalues in enumerate(values.tolist()):
+            device = rng.randint(0, 65536, deviceCoordCount).tolist()
+            tag.add_color("Color %i\xe9" % i, *device,
+                          **dict(zip(ICCP.namedColor2_pcs_keys(pcs),
+                                     pcsvalues)))
+        return tag.tagData
+
+    def test_round_trip(self):
+        for pcs in ("Lab", "XYZ"):
+            for deviceCoordCount in (0, 1, 4):
+                tagData = self.make_tag(pcs, deviceCoordCount)
+                tag = ICCP.NamedColor2Type(tagData, "ncl2", pcs)
+                columns = tag.columns
+                self.assertEqual(columns.device.shape,
+                                 (50, deviceCoordCount))
+                # The bulk decoded colors are those of the dict
+                for name, rootName, pcsvalues, device in zip(
+                        columns.names, columns.rootNames.tolist(),
+                        columns.pcs.tolist(), columns.device.tolist()):
+                    color = tag[name]
+                    self.assertEqual(color.name, name)
+                    self.assertEqual(color.rootName.rstrip("\0"), rootName)
+                    self.assertEqual(color.pcs.values(), pcsvalues)
+                    self.assertEqual(list(color.device), device)
+                tag = ICCP.NamedColor2Type.from_arrays(
+                    columns.names, columns.device, columns.pcs, pcs,
+                    tag.prefix, tag.suffix, tag.vendorData)
+                self.assertEqual(tag.get_tagData(), tagData)
+                self.assertEqual(tag.tagData, tagData)
+                self.assertEqual(tag.keys(), columns.names)
+                self.assertEqual(tag.deviceCoordCount, deviceCoordCount)
+                self.assertEqual((tag.prefix, tag.suffix), (u"Test ", u" CV"))
+
+    def test_from_arrays_invalid(self):
+        self.assertRaises(ICCP.ICCProfileInvalidError,
+                          ICCP.NamedColor2Type.from_arrays,
+                          ["a", "b"], [[0], [0]], [[0, 0, 0]])
+        self.assertRaises(ICCP.ICCProfileInvalidError,
+                          ICCP.NamedColor2Type.from_arrays,
+                          ["a", "a"], [[0], [0]], [[0, 0, 0]] * 2)
+        self.assertRaises(ICCP.ICCProfileInvalidError,
+                          ICCP.NamedColor2Type.from_arrays,
+                          ["a" * 32], [[0]], [[0, 0, 0]])
+        tag = ICCP.NamedColor2Type.from_arrays([], [], [])
+        self.assertEqual(len(tag), 0)
+        self.assertEqual(tag.tagData, tag.get_tagData())
+
+class chromaticAdaptionTagTest(unittest.TestCase):
+
+    def test_tagData(self):
+        matrix = [[1.0478, 0.0229, -0.0502], [0.0295, 0.9905, -0.0171],
+                  [-0.0092, 0.0151, 0.7517]]
+        tag = ICCP.chromaticAdaptionTag()
+        tag.update(matrix)
+        tag = ICCP.chromaticAdaptionTag(tag.tagData, "chad")
+        self.assertEqual(tag.rounded(4), matrix)
+        numpy.testing.assert_allclose((tag * tag.inverted()).tolist(),
+                                      numpy.identity(3), atol=1e-12)
+
+
+def make_profile(filename, monitor_name, gamma=2.2):
+    """
+    Create a display profile from EDID values, write it to filename
+    (unless None) and return it.
+
+    """
+    edid = {"edid": "\0" * 128, "hash": monitor_name,
+            "monitor_name": monitor_name, "manufacturer": "Test",
+            "manufacturer_id": "TST", "product_id": 1,
+            "year_of_manufacture": 2012, "week_of_manufacture": 1,
+            "white_x": 0.3127, "white_y": 0.329, "red_x": 0.64, "red_y": 0.33,
+            "green_x": 0.3, "green_y": 0.6, "blue_x": 0.15, "blue_y": 0.06,
+            "gamma": gamma}
+    profile = ICCP.ICCProfile.from_edid(edid)
+    profile.calculateID()
+    if filename:
+        profile.write(filename)
+    return profile
+
+
+class ProfileDataTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = make_profile(None, "Test").data
+        self.profile = ICCP.ICCProfile(self.data)
+
+    def test_cached_tagData(self):
+        trc = self.profile.tags.rTRC
+        tagData = trc.get_tagData()
+        # Unchanged tags are written back as read
+        self.assertTrue(trc.get_tagData() is tagData)
+        self.assertEqual(tagData, trc.tagData)
+        self.assertEqual(self.profile.data, self.data)
+        trc[0] = 0
+        self.assertFalse(trc.get_tagData() is tagData)
+        self.assertEqual(trc.get_tagData(), trc.tagData)
+        self.assertEqual(ICCP.CurveType(trc.get_tagData())[0], 0)
+        self.assertNotEqual(self.profile.data, self.data)
+
+    def test_calculateID(self):
+        data = self.data
+        expected = md5(data[:44] + "\0" * 4 + data[48:64] + "\0" * 4 +
+                       data[68:84] + "\0" * 16 + data[100:]).digest()
+        self.assertEqual(self.profile.calculateID(False), expected)
+        self.assertEqual(self.profile.ID, data[84:100])
+        self.assertEqual(self.profile.ID, expected)
+        self.profile.tags.rTRC.append(1.0)
+        self.assertNotEqual(self.profile.calculateID(), expected)
+        self.assertEqual(self.profile.ID, self.profile.calculateID(False))
+
+
+class LazyTagDictTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp, "test.icc")
+        make_profile(self.filename, "Test")
+        self.profile = ICCP.ICCProfile(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_decode_on_access(self):
+        profile = ICCP.ICCProfile(self.filename, lazy=True)
+        tags = profile.tags
+        self.assertTrue(isinstance(tags, ICCP.LazyTagDict))
+        self.assertEqual(tags.keys(), self.profile.tags.keys())
+        self.assertFalse(any(tags.is_decoded(key) for key in tags))
+        # Assembling the profile data doesn't decode anything
+        self.assertEqual(profile.data, self.profile.data)
+        self.assertFalse(any(tags.is_decoded(key) for key in tags))
+        self.assertEqual(tags.rXYZ.values(), self.profile.tags.rXYZ.values())
+        self.assertTrue(tags.is_decoded("rXYZ"))
+        self.assertFalse(tags.is_decoded("gXYZ"))
+        # Shared tags are decoded once
+        self.assertTrue(tags.rTRC is tags.get("gTRC"))
+        self.assertEqual(list(tags.rTRC), list(self.profile.tags.rTRC))
+        for key in tags:
+            self.assertEqual(tags.tagData(key),
+                             self.profile.tags[key].tagData)
+        self.assertEqual(profile.getDescription(),
+                         self.profile.getDescription())
+
+    def test_modify(self):
+        profile = ICCP.ICCProfile(self.filename, lazy=True)
+        tags = profile.tags
+        tags.detach()
+        del tags["gXYZ"]
+        tags.bXYZ = self.profile.tags.rXYZ
+        self.assertTrue(tags.is_decoded("bXYZ"))
+        self.assertEqual(tags.pop("rXYZ").values(),
+                         self.profile.tags.rXYZ.values())
+        self.assertFalse("gXYZ" in tags or "rXYZ" in tags)
+        profile = ICCP.ICCProfile(profile.data)
+        self.assertEqual(profile.tags.bXYZ.values(),
+                         self.profile.tags.rXYZ.values())
+        self.assertFalse("gXYZ" in profile.tags)
+
+
+class ProfileIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.dirs = [os.path.join(self.tmp, name) for name in ("a", "b")]
+        os.makedirs(os.path.join(self.dirs[0], "sub"))
+        os.makedirs(self.dirs[1])
+        self.profiles = {}
+        for path, description in (("a/sub/one.icc", "One"),
+                                  ("b/one.icc", "One"),
+                                  ("b/two.icc", "Two")):
+            path = os.path.join(self.tmp, *path.split("/"))
+            self.profiles[path] = make_profile(path, description)
+        with open(os.path.join(self.dirs[1], "readme.txt"), "w") as f:
+            f.write("Not a profile")
+        self.filename = os.path.join(self.tmp, "index", "profile_index.json")
+        self.index = ICCP.ProfileIndex(self.dirs, self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def path(self, path):
+        return os.path.join(self.tmp, *path.split("/"))
+
+    def test_find(self):
+        # First match in order of paths
+        self.assertEqual(self.index.find("one.icc"),
+                         self.path("a/sub/one.icc"))
+        self.assertEqual(self.index.find("two.icc"), self.path("b/two.icc"))
+        self.assertEqual(self.index.find("readme.txt"), None)
+        self.assertEqual(self.index.find("three.icc"), None)
+
+    def test_find_new_profile(self):
+        self.index.refresh_interval = 3600
+        self.index.find("one.icc")
+        path = self.path("b/three.icc")
+        make_profile(path, "Three")
+        # Misses within miss_interval don't rescan
+        self.index.miss_interval = 3600
+        self.assertEqual(self.index.find("three.icc"), None)
+        self.index.miss_interval = 0
+        self.assertEqual(self.index.find("three.icc"), path)
+
+    def test_query(self):
+        path = self.path("b/two.icc")
+        ID = self.profiles[path].ID.encode("hex")
+        self.assertEqual([item[0] for item in self.index.query(ID=ID)],
+                         [path])
+        self.assertEqual([item[0] for item in
+                          self.index.query(description="One")],
+                         [self.path("a/sub/one.icc"), self.path("b/one.icc")])
+        self.assertEqual(self.index.query(description="One", ID=ID), [])
+        self.assertEqual(self.index.query(ID="0" * 32), [])
+        info = self.index.query(ID=ID)[0][1]
+        self.assertEqual(info["description"], "Two")
+        self.assertEqual(info["colorSpace"], "RGB")
+        self.assertEqual(len(self.index.query(colorSpace="RGB",
+                                              profileClass="mntr")), 3)
+        self.assertEqual(len(self.index.query(tags="rTRC")), 3)
+        self.assertEqual(self.index.query(tags="A2B0"), [])
+
+    def test_persistence(self):
+        self.index.update()
+        self.assertTrue(os.path.isfile(self.filename))
+        self.assertEqual(os.listdir(os.path.dirname(self.filename)),
+                         ["profile_index.json"])
+        index = ICCP.ProfileIndex(self.dirs, self.filename)
+        index._load()
+        self.assertEqual(index._dirs, self.index._dirs)
+        self.assertEqual(index.items(), self.index.items())
+
+    def test_non_ascii_directory(self):
+        try:
+            name = u"caf\xe9".encode(ICCP.fs_enc)
+        except UnicodeEncodeError:
+            raise unittest.SkipTest("filesystem encoding %s can't encode "
+                                    "non-ASCII names" % ICCP.fs_enc)
+        dirname = os.path.join(self.tmp, name)
+        path = os.path.join(dirname, "three.icc")
+        os.makedirs(dirname)
+        make_profile(path, "Three")
+        path = path.decode(ICCP.fs_enc)
+        index = ICCP.ProfileIndex([dirname], self.filename)
+        self.assertEqual(index.find("three.icc"), path)
+        # Reloaded from JSON (unicode keys), the directory is unchanged
+        index = ICCP.ProfileIndex([dirname], self.filename)
+        index._load()
+        self.assertFalse(index._scan(index.paths[0]))
+        self.assertEqual(index.find("three.icc"), path)
+        self.assertEqual([item[0] for item in
+                          index.query(description="Three")], [path])
+
+    def test_save_error(self):
+        self.index.update()
+        # Byte string paths which are not valid UTF-8 can't be written as
+        # JSON, which must not raise
+        self.index._dirs["\xff"] = {"mtime": 0, "dirs": [], "profiles": {}}
+        self.index._save()
+        self.assertEqual(os.listdir(os.path.dirname(self.filename)),
+                         ["profile_index.json"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for cmm.
+
+Run from the directory containing the colorkit package:
+
+    python -m unittest discover -s colorkit/icc/tests -t .
+
+"""
+
+import unittest
+
+import numpy
+
+from colorkit.icc import ICCProfile as ICCP
+from colorkit.icc import cmm
+from colorkit.icc import colormath
+from colorkit.icc.tests.test_ICCProfile import make_profile
+
+
+class TransformTest(unittest.TestCase):
+
+    def setUp(self):
+        self.profile = ICCP.ICCProfile(make_profile(None, "Test").data)
+        self.RGB = numpy.random.RandomState(3).rand(200, 3)
+
+    def test_matrix_forward(self):
+        tags = self.profile.tags
+        matrix = [[tags.rXYZ.X, tags.gXYZ.X, tags.bXYZ.X],
+                  [tags.rXYZ.Y, tags.gXYZ.Y, tags.bXYZ.Y],
+                  [tags.rXYZ.Z, tags.gXYZ.Z, tags.bXYZ.Z]]
+        XYZ = cmm.lookup(self.profile, self.RGB, pcs="x")
+        expected = [colormath.Matrix3x3(matrix) *
+                    [tags.rTRC.apply(r), tags.gTRC.apply(g),
+                     tags.bTRC.apply(b)]
+                    for r, g, b in self.RGB.tolist()]
+        numpy.testing.assert_allclose(XYZ, expected, atol=1e-12)
+        Lab = cmm.lookup(self.profile, self.RGB, pcs="l")
+        numpy.testing.assert_allclose(
+            Lab, colormath.XYZ2Lab_array(numpy.array(expected) * 100,
+                                         [v * 100 for v in
+                                          self.profile.illuminant.values()]),
+            atol=1e-9)
+
+    def test_round_trip(self):
+        for pcs in ("l", "x"):
+            for intent in ("r", "a"):
+                PCS = cmm.lookup(self.profile, self.RGB * 100, "f", intent,
+                                 pcs, 100)
+                numpy.testing.assert_allclose(
+                    cmm.lookup(self.profile, PCS, "b", intent, pcs, 100),
+                    self.RGB * 100, atol=1e-3)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, cmm.Transform, self.profile, "x")
+        self.assertRaises(ValueError, cmm.Transform, self.profile, "f", "x")
+        self.assertRaises(ValueError, cmm.lookup, self.profile, [0.5, 0.5])
+        profile = ICCP.ICCProfile(make_profile(None, "Test").data)
+        del profile.tags["rXYZ"]
+        self.assertRaises(NotImplementedError, cmm.Transform, profile)
+
+
+if __name__ == "__main__":
+    unittest.main()
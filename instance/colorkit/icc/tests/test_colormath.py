@@ -0,0 +1,438 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for colormath, mainly that the array variants give the same results
+as the scalar functions.
+
+Run from the directory containing the colorkit package:
+
+    python -m unittest discover -s colorkit/icc/tests -t .
+
+"""
+
+import unittest
+
+import numpy
+
+from colorkit.icc import colormath
+
+
+RGB_SPACES = ("sRGB", "Adobe RGB (1998)", "ECI RGB v2", "Rec. 709 RGB",
+              "SMPTE 240M RGB", "Apple RGB")
+
+
+def scalar_rows(function, values, *args, **kwargs):
+    """ Apply a scalar converter to each triplet of a (N, 3) array """
+    return numpy.array([function(*(tuple(row) + args), **kwargs)
+                        for row in values], dtype=numpy.float64)
+
+
+class ArrayConverterTest(unittest.TestCase):
+
+    def setUp(self):
+        random = numpy.random.RandomState(42)
+        self.RGB = numpy.concatenate([random.rand(500, 3),
+                                      [[0, 0, 0], [1, 1, 1], [1, 0, 0],
+                                       [0.5, 0.5, 0.5]]])
+        self.XYZ = random.rand(500, 3) * (0.95, 1.0, 1.09)
+        self.Lab = numpy.column_stack([random.uniform(0, 100, 500),
+                                       random.uniform(-128, 127, 500),
+                                       random.uniform(-128, 127, 500)])
+
+    def assertSame(self, array, scalar):
+        numpy.testing.assert_array_equal(array, scalar)
+
+    def test_rgb_xyz(self):
+        for rgb_space in RGB_SPACES:
+            XYZ = colormath.RGB2XYZ_array(self.RGB, rgb_space)
+            self.assertSame(XYZ, scalar_rows(colormath.RGB2XYZ, self.RGB,
+                                             rgb_space))
+            self.assertSame(colormath.XYZ2RGB_array(XYZ, rgb_space),
+                            scalar_rows(colormath.XYZ2RGB, XYZ, rgb_space))
+
+    def test_xyz_rgb_rounded(self):
+        for clamp in (True, False):
+            for round_ in (0, 2, 3):
+                self.assertSame(colormath.XYZ2RGB_array(self.XYZ, "sRGB",
+                                                        255, round_, clamp),
+                                scalar_rows(colormath.XYZ2RGB, self.XYZ,
+                                            "sRGB", 255, round_, clamp))
+
+    def test_lab(self):
+        for whitepoint in ("D50", "D65", (0.95, 1.0, 1.1)):
+            XYZ = colormath.Lab2XYZ_array(self.Lab, whitepoint)
+            self.assertSame(XYZ, scalar_rows(colormath.Lab2XYZ, self.Lab,
+                                             whitepoint))
+            self.assertSame(colormath.XYZ2Lab_array(XYZ * 100, whitepoint),
+                            scalar_rows(colormath.XYZ2Lab, XYZ * 100,
+                                        whitepoint))
+            self.assertSame(colormath.Lab2xyY_array(self.Lab, whitepoint),
+                            scalar_rows(colormath.Lab2xyY, self.Lab,
+                                        whitepoint))
+
+    def test_lab_rgb(self):
+        for clamp in (True, False):
+            self.assertSame(colormath.Lab2RGB_array(self.Lab, "sRGB", 255, 0,
+                                                    clamp),
+                            scalar_rows(colormath.Lab2RGB, self.Lab, "sRGB",
+                                        255, 0, clamp))
+            Luv = colormath.XYZ2Luv_array(self.XYZ * 100)
+            self.assertSame(colormath.Luv2RGB_array(Luv, "sRGB", 1.0, False,
+                                                    clamp),
+                            scalar_rows(colormath.Luv2RGB, Luv, "sRGB", 1.0,
+                                        False, clamp))
+
+    def test_luv(self):
+        Luv = colormath.XYZ2Luv_array(self.XYZ * 100)
+        self.assertSame(Luv, scalar_rows(colormath.XYZ2Luv, self.XYZ * 100))
+        self.assertSame(colormath.Luv2XYZ_array(Luv),
+                        scalar_rows(colormath.Luv2XYZ, Luv))
+
+    def test_xyy(self):
+        xyY = colormath.XYZ2xyY_array(self.XYZ)
+        self.assertSame(xyY, scalar_rows(colormath.XYZ2xyY, self.XYZ))
+        self.assertSame(colormath.xyY2XYZ_array(xyY),
+                        scalar_rows(colormath.xyY2XYZ, xyY))
+        self.assertSame(colormath.xyY2Lab_array(xyY),
+                        scalar_rows(colormath.xyY2Lab, xyY))
+
+    def test_adapt(self):
+        for cat in ("Bradford", "CAT02", "XYZ scaling"):
+            self.assertSame(colormath.adapt_array(self.XYZ, "D65", "D50", cat),
+                            scalar_rows(colormath.adapt, self.XYZ, "D65",
+                                        "D50", cat))
+
+    def test_round(self):
+        random = numpy.random.RandomState(0)
+        for digits in xrange(5):
+            values = numpy.concatenate([
+                random.uniform(-300, 300, 10000),
+                numpy.arange(-1000, 1000) / 2.0 / 10 ** digits,
+                [0.0, -0.0, 0.5, -0.5, 2.675, 1.005, 0.125, -0.125]])
+            rounded = colormath._round(values, digits)
+            expected = numpy.array([round(value, digits) for value in values])
+            self.assertSame(rounded, expected)
+            self.assertSame(numpy.signbit(rounded), numpy.signbit(expected))
+
+
+
+class DeltaBatchTest(unittest.TestCase):
+
+    methods = ("76", "94", "2k", "cmc", "cmc21")
+
+    def setUp(self):
+        random = numpy.random.RandomState(7)
+        self.lab1 = numpy.column_stack([random.uniform(0, 100, 200),
+                                        random.uniform(-100, 100, 200),
+                                        random.uniform(-100, 100, 200)])
+        self.lab2 = self.lab1 + random.normal(0, 5, (200, 3))
+
+    def test_rows(self):
+        for method in self.methods:
+            deltas = colormath.delta_batch(self.lab1, self.lab2, method)
+            for i in xrange(0, 200, 7):
+                expected = colormath.delta(*(tuple(self.lab1[i]) +
+                                             tuple(self.lab2[i]) + (method, )))
+                for key, value in expected.iteritems():
+                    self.assertAlmostEqual(deltas[key][i], value, 9,
+                                           (method, key, i))
+
+    def test_pairwise(self):
+        for method in self.methods:
+            deltas = colormath.delta_batch(self.lab1[:20], self.lab2[:30],
+                                           method, pairwise=True)["E"]
+            self.assertEqual(deltas.shape, (20, 30))
+            numpy.testing.assert_allclose(
+                deltas[4], colormath.delta_batch(self.lab1[4], self.lab2[:30],
+                                                 method)["E"])
+
+    def test_pairwise_single_sample(self):
+        deltas = colormath.delta_batch([50, 0, 0], [[50, 1, 1], [60, 0, 0]],
+                                       pairwise=True)["E"]
+        numpy.testing.assert_allclose(deltas, [2 ** 0.5, 10])
+        deltas = colormath.delta_batch([[50, 1, 1], [60, 0, 0]], [50, 0, 0],
+                                       pairwise=True)["E"]
+        self.assertEqual(deltas.shape, (2, ))
+
+
+def matrix_product(a, b):
+    """ Product of two 3x3 matrices (lists of rows) """
+    return [[a[i][0] * b[0][j] + a[i][1] * b[1][j] + a[i][2] * b[2][j]
+             for j in xrange(3)] for i in xrange(3)]
+
+
+def matrix_inverse(m):
+    """ Inverse of a 3x3 matrix (list of rows) by cofactors """
+    determinant = ((m[0][0] * m[1][1] * m[2][2] +
+                    m[1][0] * m[2][1] * m[0][2] +
+                    m[0][1] * m[1][2] * m[2][0]) -
+                   (m[2][0] * m[1][1] * m[0][2] +
+                    m[1][0] * m[0][1] * m[2][2] +
+                    m[2][1] * m[1][2] * m[0][0]))
+    cofactors = [[(m[1][1] * m[2][2] - m[1][2] * m[2][1]),
+                  -1 * (m[1][0] * m[2][2] - m[1][2] * m[2][0]),
+                  (m[1][0] * m[2][1] - m[1][1] * m[2][0])],
+                 [-1 * (m[0][1] * m[2][2] - m[0][2] * m[2][1]),
+                  (m[0][0] * m[2][2] - m[0][2] * m[2][0]),
+                  -1 * (m[0][0] * m[2][1] - m[0][1] * m[2][0])],
+                 [(m[0][1] * m[1][2] - m[0][2] * m[1][1]),
+                  -1 * (m[0][0] * m[1][2] - m[1][0] * m[0][2]),
+                  (m[0][0] * m[1][1] - m[0][1] * m[1][0])]]
+    return [[cofactors[j][i] / determinant for j in xrange(3)]
+            for i in xrange(3)]
+
+
+def scalar_or_nan(function, values, *args):
+    """ Apply a scalar function to each value, with NaN for None results """
+    results = []
+    for value in values:
+        result = function(*(tuple(numpy.atleast_1d(value)) + args))
+        results.append(numpy.nan if result is None else result)
+    return results
+
+
+class LocusTest(unittest.TestCase):
+
+    def setUp(self):
+        self.T = numpy.concatenate([numpy.linspace(1000, 30000, 301),
+                                    [1667, 4000, 7000, 25000]])
+        random = numpy.random.RandomState(24)
+        # Around the locus, and some colors far off it, which have no CCT
+        x = random.uniform(0.22, 0.55, 300)
+        y = x * (-0.8 * x + 0.97) + random.normal(0, 0.02, 300)
+        self.xy = numpy.column_stack([numpy.concatenate([x, [0.2, 0.7]]),
+                                      numpy.concatenate([y, [0.1, 0.3]])])
+
+    def test_daylight(self):
+        xyY = scalar_or_nan(colormath.CIEDCCT2xyY, self.T)
+        xyY = [(value, ) * 3 if value is numpy.nan else value
+               for value in xyY]
+        numpy.testing.assert_array_equal(
+            colormath.CIEDCCT2xyY_array(self.T), xyY)
+        # CIEDCCT2XYZ fails outside of the daylight locus
+        T = self.T[(self.T >= 4000) & (self.T <= 25000)]
+        numpy.testing.assert_array_equal(
+            colormath.CIEDCCT2XYZ_array(T, 100.0),
+            [colormath.CIEDCCT2XYZ(value, 100.0) for value in T.tolist()])
+
+    def test_planckian(self):
+        xyY = scalar_or_nan(colormath.planckianCT2xyY, self.T)
+        xyY = [(value, ) * 3 if value is numpy.nan else value
+               for value in xyY]
+        numpy.testing.assert_array_equal(
+            colormath.planckianCT2xyY_array(self.T), xyY)
+
+    def test_cct(self):
+        numpy.testing.assert_array_equal(
+            colormath.xyY2CCT_array(colormath._stack3(self.xy[:, 0],
+                                                      self.xy[:, 1], 1.0)),
+            scalar_or_nan(colormath.xyY2CCT, self.xy))
+        self.assertTrue(numpy.isnan(colormath.xyY2CCT_array([0.2, 0.1, 1])))
+
+    def test_xyz_cct(self):
+        random = numpy.random.RandomState(25)
+        XYZ = numpy.concatenate([random.uniform(0, 1.2, (1000, 3)),
+                                 [[0, 0, 0]]])
+        numpy.testing.assert_array_equal(colormath.XYZ2CCT_array(XYZ),
+                                         scalar_or_nan(colormath.XYZ2CCT,
+                                                       XYZ))
+        self.assertEqual(colormath.XYZ2CCT_array(XYZ[:6].reshape(2, 3,
+                                                                 3)).shape,
+                         (2, 3))
+        self.assertEqual(colormath.XYZ2CCT_array(numpy.zeros((0, 3))).shape,
+                         (0, ))
+
+    def test_cct_delta(self):
+        for daylight in (True, False):
+            cct, d = colormath.xy_CCT_delta_array(self.xy[:, 0],
+                                                  self.xy[:, 1], daylight)
+            for i, (x, y) in enumerate(self.xy.tolist()):
+                expected_cct, expected_d = colormath.xy_CCT_delta(x, y,
+                                                                  daylight)
+                if expected_cct is None:
+                    self.assertTrue(numpy.isnan(cct[i]))
+                else:
+                    self.assertEqual(cct[i], expected_cct)
+                if expected_d is None:
+                    self.assertTrue(numpy.isnan(d["E"][i]))
+                else:
+                    for key, value in expected_d.iteritems():
+                        self.assertAlmostEqual(d[key][i], value, 9)
+
+
+class Matrix3x3Test(unittest.TestCase):
+
+    def setUp(self):
+        random = numpy.random.RandomState(9)
+        self.matrices = [random.uniform(-2, 2, (3, 3)).tolist()
+                         for i in xrange(20)]
+        self.matrices.append(colormath.get_cat_matrix("Bradford").tolist())
+
+    def test_rows(self):
+        m = colormath.Matrix3x3(self.matrices[0])
+        self.assertEqual(len(m), 3)
+        # Rows are lists, like those of the former list of lists
+        self.assertEqual(list(m), self.matrices[0])
+        self.assertEqual(m[1], self.matrices[0][1])
+        self.assertEqual(m[1:], self.matrices[0][1:])
+        self.assertEqual(m[1][2], self.matrices[0][1][2])
+        self.assertEqual(m[1, 2], self.matrices[0][1][2])
+        (a, b, c), row2, row3 = m
+        self.assertEqual([a, b, c], self.matrices[0][0])
+        self.assertEqual(m, self.matrices[0])
+        self.assertNotEqual(m, self.matrices[1])
+        m[1] = [1, 2, 3]
+        m[2, 0] = 4
+        self.assertEqual(m.tolist()[1:], [[1.0, 2.0, 3.0],
+                                          [4.0] + self.matrices[0][2][1:]])
+
+    def test_empty(self):
+        for m in (colormath.Matrix3x3(), colormath.Matrix3x3(None),
+                  colormath.Matrix3x3([]), colormath.Matrix3x3(())):
+            self.assertEqual(m.tolist(), [[0.0] * 3] * 3)
+            self.assertEqual(m * [1, 2, 3], [0.0] * 3)
+
+    def test_invalid_shape(self):
+        for matrix in ([[1, 2, 3]], [[1, 2, 3]] * 4, [[1, 2]] * 3,
+                       [[1, 2, 3], [4, 5, 6], [7, 8]], [1, 2, 3],
+                       [[1, 2, 3], [4, 5, 6], [[7], [8], [9]]],
+                       numpy.ones((2, 3)), numpy.ones((3, 3, 1)), 1):
+            self.assertRaises(ValueError, colormath.Matrix3x3, matrix)
+            m = colormath.Matrix3x3(self.matrices[0])
+            self.assertRaises(ValueError, m.update, matrix)
+            self.assertEqual(m, self.matrices[0])
+            self.assertRaises(ValueError, m.__add__, matrix)
+        m = colormath.Matrix3x3(self.matrices[0])
+        for matrix in ([[1, 2, 3]] * 4, [[1, 2]] * 3,
+                       [[1, 2, 3], [4, 5, 6], [7, 8]],
+                       [[1, 2, 3], [4, 5, 6], [[7], [8], [9]]]):
+            self.assertRaises(ValueError, m.__mul__, matrix)
+        self.assertRaises(ValueError, m.__mul__, [1, 2])
+        self.assertRaises(ValueError, m.__mul__, [1, 2, 3, 4])
+        self.assertRaises(ValueError, m.__mul__, numpy.ones((5, 2)))
+
+    def test_product(self):
+        for a, b in zip(self.matrices, self.matrices[1:]):
+            self.assertEqual((colormath.Matrix3x3(a) *
+                              colormath.Matrix3x3(b)).tolist(),
+                             matrix_product(a, b))
+            self.assertEqual((colormath.Matrix3x3(a) * b).tolist(),
+                             matrix_product(a, b))
+
+    def test_triplet(self):
+        for m in self.matrices:
+            for triplet in m:
+                self.assertEqual(colormath.Matrix3x3(m) * triplet,
+                                 [row[0] * triplet[0] + row[1] * triplet[1] +
+                                  row[2] * triplet[2] for row in m])
+
+    def test_array(self):
+        values = numpy.random.RandomState(10).rand(4, 50, 3)
+        for m in self.matrices:
+            result = colormath.Matrix3x3(m) * values
+            self.assertEqual(result.shape, values.shape)
+            numpy.testing.assert_array_equal(
+                result.reshape(-1, 3),
+                [colormath.Matrix3x3(m) * triplet
+                 for triplet in values.reshape(-1, 3).tolist()])
+
+    def test_inverted(self):
+        for m in self.matrices:
+            self.assertEqual(colormath.Matrix3x3(m).inverted().tolist(),
+                             matrix_inverse(m))
+
+    def test_rounded(self):
+        for m in self.matrices:
+            self.assertEqual(colormath.Matrix3x3(m).rounded(4).tolist(),
+                             [[round(v, 4) for v in row] for row in m])
+
+
+
+class TransferFunctionTest(unittest.TestCase):
+
+    gammas = sorted(colormath.transfer_functions) + [1.8, 2.2]
+
+    values = numpy.linspace(-0.5, 1.5, 201)
+
+    def test_scalar(self):
+        for gamma in self.gammas:
+            tf = colormath.TransferFunction(gamma)
+            b = colormath.transfer_functions.get(gamma, gamma)
+            for v in self.values.tolist():
+                self.assertEqual(tf.decode(v), colormath.specialpow(v, b))
+                self.assertEqual(tf.encode(v),
+                                 colormath.specialpow(v, 1.0 / b))
+            self.assertTrue(numpy.all(tf.decode(self.values) ==
+                                      colormath.specialpow_array(self.values,
+                                                                 b)))
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, colormath.TransferFunction, "Foo")
+        self.assertRaises(ValueError, colormath.TransferFunction, -1.0)
+        self.assertRaises(ValueError, colormath.specialpow_array, 0.5, -1.0)
+
+    def test_encode_int(self):
+        tf = colormath.TransferFunction("sRGB")
+        for bits in (8, 10, 16):
+            vmax = 2 ** bits - 1
+            encoded = tf.encode_int([-numpy.inf, -1.0, 0.0, 1.0, 2.0,
+                                     numpy.inf], bits)
+            self.assertEqual(encoded.tolist(), [0, 0, 0, vmax, vmax, vmax])
+            self.assertTrue(encoded.dtype.itemsize * 8 >= bits)
+            # Within a step of the exact values
+            values = numpy.linspace(0.0, 1.0, 1001)
+            exact = tf.encode(values) * vmax
+            self.assertTrue(numpy.all(numpy.abs(tf.encode_int(values, bits) -
+                                                exact) <= 1))
+        self.assertRaises(ValueError, tf.encode_int, [0.5, numpy.nan])
+
+    def test_decode_int(self):
+        tf = colormath.TransferFunction(2.2)
+        values = numpy.arange(256)
+        self.assertTrue(numpy.allclose(tf.decode_int(values, 8),
+                                       tf.decode(values / 255.0)))
+
+
+class CacheTest(unittest.TestCase):
+
+    def test_lru(self):
+        cache = colormath.LRUCache(3)
+        for key in "abc":
+            cache[key] = key.upper()
+        self.assertEqual(cache.get("a"), "A")
+        cache["d"] = "D"
+        # b was least recently used
+        self.assertEqual(len(cache), 3)
+        self.assertFalse("b" in cache)
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual([cache.get(key) for key in "acd"], ["A", "C", "D"])
+        cache["a"] = "a"
+        cache["e"] = "E"
+        self.assertFalse("c" in cache)
+        self.assertEqual(cache.get("a"), "a")
+
+    def test_adapt_whitepoints(self):
+        # Measured whitepoints must not fill the caches
+        random = numpy.random.RandomState(21)
+        whitepoints = random.uniform(0.9, 1.1, (1000, 3))
+        whitepoints[:, 1] = 1.0
+        XYZ = (0.4, 0.3, 0.2)
+        for whitepoint in whitepoints.tolist():
+            whitepoint = tuple(whitepoint)
+            self.assertEqual(colormath.adapt(*XYZ + (whitepoint, "D50")),
+                             colormath.wp_adaption_matrix(whitepoint, "D50") *
+                             list(XYZ))
+            colormath.adapt_array(XYZ, whitepoint, "D65")
+        self.assertTrue(len(colormath.ChromaticAdaptation.cache) <=
+                        colormath.ChromaticAdaptation.cache.maxsize)
+
+    def test_transfer_functions(self):
+        for gamma in numpy.linspace(1.0, 3.0, 1000).tolist():
+            colormath.TransferFunction.get(gamma)
+        self.assertTrue(len(colormath.TransferFunction.cache) <=
+                        colormath.TransferFunction.cache.maxsize)
+        self.assertTrue(colormath.TransferFunction.get("sRGB") is
+                        colormath.TransferFunction.get("sRGB"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for gamut.
+
+Run from the directory containing the colorkit package:
+
+    python -m unittest discover -s colorkit/icc/tests -t .
+
+"""
+
+import math
+import unittest
+
+import numpy
+
+from colorkit.icc import ICCProfile as ICCP
+from colorkit.icc import gamut
+from colorkit.icc.tests.test_ICCProfile import make_profile
+
+
+class GamutTest(unittest.TestCase):
+
+    def test_sphere(self):
+        # A sphere of radius 40 around the center
+        vertices, triangles = gamut.cube_surface(24)
+        vertices = vertices - 0.5
+        vertices /= numpy.sqrt((vertices ** 2).sum(axis=-1))[:, numpy.newaxis]
+        sphere = gamut.Gamut.from_surface(vertices * 40 + gamut.CENTER,
+                                          triangles)
+        self.assertAlmostEqual(sphere.volume / (4 / 3.0 * math.pi * 40 ** 3),
+                               1, 2)
+        self.assertTrue(numpy.all(sphere.radius <= 40))
+        self.assertAlmostEqual(sphere.coverage(sphere), 1)
+
+    def test_reference_volumes(self):
+        # The volumes Argyll's iccgamut reports
+        srgb = gamut.Gamut.get("sRGB")
+        adobe_rgb = gamut.Gamut.get("Adobe RGB (1998)")
+        self.assertAlmostEqual(srgb.volume / ICCP.GAMUT_VOLUME_SRGB, 1, 2)
+        self.assertAlmostEqual(adobe_rgb.volume / ICCP.GAMUT_VOLUME_ADOBERGB,
+                               1, 2)
+        self.assertTrue(gamut.Gamut.get("sRGB") is srgb)
+
+    def test_coverage(self):
+        srgb = gamut.Gamut.get("sRGB")
+        adobe_rgb = gamut.Gamut.get("Adobe RGB (1998)")
+        self.assertAlmostEqual(srgb.coverage(srgb), 1)
+        self.assertTrue(adobe_rgb.coverage(srgb) > 0.99)
+        coverage = srgb.coverage(adobe_rgb)
+        self.assertTrue(coverage < 0.8)
+        self.assertTrue(coverage > srgb.volume / adobe_rgb.volume - 0.01)
+        self.assertAlmostEqual(srgb.intersection(adobe_rgb),
+                               adobe_rgb.intersection(srgb))
+
+    def test_calculate_gamut(self):
+        # A display profile with sRGB primaries
+        profile = ICCP.ICCProfile(make_profile(None, "sRGB-ish").data)
+        volume, coverage = gamut.calculate_gamut(profile)
+        self.assertAlmostEqual(volume, 1, 2)
+        self.assertEqual(sorted(coverage), ["adobe-rgb", "srgb"])
+        self.assertTrue(coverage["srgb"] > 0.99)
+        self.assertTrue(coverage["adobe-rgb"] < 0.8)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for worker.Worker profile lookups.
+
+Skipped unless worker can be imported, which needs the full GUI
+environment (wxPython etc.). Run from the directory containing the colorkit
+package:
+
+    python -m unittest discover -s colorkit/icc/tests -t .
+
+"""
+
+import unittest
+
+import numpy
+
+from colorkit.icc import CGATS
+from colorkit.icc import ICCProfile as ICCP
+from colorkit.icc import cmm
+from colorkit.icc.tests.test_ICCProfile import make_profile
+
+try:
+    from colorkit.icc import worker
+except ImportError:
+    worker = None
+
+
+class FakePopen(object):
+
+    """ Stands in for an xicclu process with canned output """
+
+    output = ""
+
+    def __init__(self, args, **kwargs):
+        self.args = args
+        self.input = None
+
+    def poll(self):
+        return None
+
+    def communicate(self, input=None):
+        self.input = input
+        return self.output, None
+
+    def wait(self):
+        return 0
+
+
+@unittest.skipIf(worker is None, "worker needs the GUI environment")
+class XiccluTest(unittest.TestCase):
+
+    def setUp(self):
+        self.worker = worker.Worker()
+        self.profile = ICCP.ICCProfile(make_profile(None, "Test").data)
+        self.RGB = [[0.0, 0.0, 0.0], [0.5, 0.5, 0.5], [1.0, 0.25, 0.0]]
+        self.saved = (worker.cmm.lookup, worker.get_argyll_util, worker.sp.Popen)
+
+    def tearDown(self):
+        (worker.cmm.lookup, worker.get_argyll_util,
+         worker.sp.Popen) = self.saved
+        self.worker.wrapup(False)
+
+    def test_in_process(self):
+        for direction, pcs in (("f", "x"), ("f", "l"), ("b", None)):
+            values = self.RGB
+            if direction == "b":
+                values = cmm.lookup(self.profile, values)
+            numpy.testing.assert_array_equal(
+                self.worker.xicclu(self.profile, values, "r", direction, pcs),
+                cmm.lookup(self.profile, values, direction, "r", pcs))
+
+    def test_xicclu_output(self):
+        def lookup(*args):
+            raise NotImplementedError("Unsupported profile")
+        worker.cmm.lookup = lookup
+        worker.get_argyll_util = lambda name, paths=None: u"/usr/bin/xicclu"
+        FakePopen.output = "\n".join([
+            "0.000000 0.000000 0.000000 [RGB] -> MatrixFwd -> "
+            "0.000000 0.000000 0.000000 [XYZ]",
+            "0.500000 0.500000 0.500000 [RGB] -> MatrixFwd -> "
+            "0.203440 0.214041 0.176728 [XYZ]",
+            "1.000000 0.250000 0.000000 [RGB] -> MatrixFwd -> "
+            "0.452000 0.254000 -0.001000 [XYZ] (clip)"]) + "\n"
+        processes = []
+        def Popen(args, **kwargs):
+            processes.append(FakePopen(args, **kwargs))
+            return processes[-1]
+        worker.sp.Popen = Popen
+        values = self.worker.xicclu(self.profile, self.RGB, "a", "f", "x")
+        numpy.testing.assert_array_equal(values,
+                                         [[0, 0, 0],
+                                          [0.203440, 0.214041, 0.176728],
+                                          [0.452, 0.254, -0.001]])
+        args = processes[0].args
+        self.assertEqual(args[1:], ["-ff", "-ia", "-px", "-s1", "temp.icc"])
+        self.assertEqual(processes[0].input.splitlines(),
+                         ["0.0 0.0 0.0", "0.5 0.5 0.5", "1.0 0.25 0.0"])
+
+    def test_ti1_lookup_unsupported_colorspace(self):
+        ti1 = CGATS.CGATS("CTI1\n\nNUMBER_OF_FIELDS 2\nBEGIN_DATA_FORMAT\n"
+                          "SAMPLE_ID GRAY_L\nEND_DATA_FORMAT\n\n"
+                          "NUMBER_OF_SETS 1\nBEGIN_DATA\n1 50\nEND_DATA\n")
+        self.profile.colorSpace = "GRAY"
+        self.assertRaises(ValueError, self.worker.ti1_lookup_to_ti3, ti1,
+                          self.profile)
+
+
+if __name__ == "__main__":
+    unittest.main()
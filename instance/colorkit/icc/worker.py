@@ -29,13 +29,16 @@ elif sys.platform == "win32":
 if sys.platform == "win32":
 	import pywintypes
 	import win32api
+import numpy
 
 # custom
 import CGATS
 import ICCProfile as ICCP
+import cmm
 import colormath
 import config
 import defaultpaths
+import gamut
 import localization as lang
 import wexpect
 from argyll_cgats import (add_options_to_ti3, extract_fix_copy_cal, ti3_to_ti1, 
@@ -1133,79 +1136,28 @@ class Worker(object):
 													   profile.colorSpace)))
 		
 		# Create input RGB values
-		RGB_triplets = []
-		seen = {}
 		step = 1.0 / (size - 1)
-		RGB_triplet = [0.0, 0.0, 0.0]
 		# Set the fastest and slowest changing columns, from right to left
 		if format == "3dl":
-			columns = (0, 1, 2)
+			columns = [0, 1, 2]
 		else:
-			columns = (2, 1, 0)
-		for i in xrange(0, size):
-			# Red
-			RGB_triplet[columns[0]] = step * i
-			for j in xrange(0, size):
-				# Green
-				RGB_triplet[columns[1]] = step * j
-				for k in xrange(0, size):
-					# Blue
-					RGB_triplet[columns[2]] = step * k
-					RGB_triplets.append(list(RGB_triplet))
-
-		# Convert RGB triplets to list of strings
-		for i, RGB_triplet in enumerate(RGB_triplets):
-			RGB_triplets[i] = " ".join(str(n) for n in RGB_triplet)
+			columns = [2, 1, 0]
+		RGB_triplets = numpy.empty((size ** 3, 3))
+		RGB_triplets[:, columns] = numpy.indices((size, ) * 3).reshape(3, -1).T
+		RGB_triplets *= step
 		if debug:
 			safe_print(len(RGB_triplets), "RGB triplets")
-			safe_print("\n".join(RGB_triplets))
-		
-		# Setup xicclu
-		xicclu = get_argyll_util("xicclu").encode(fs_enc)
-		cwd = self.create_tempdir()
-		if isinstance(cwd, Exception):
-			raise cwd
-		if sys.platform == "win32":
-			startupinfo = sp.STARTUPINFO()
-			startupinfo.dwFlags |= sp.STARTF_USESHOWWINDOW
-			startupinfo.wShowWindow = sp.SW_HIDE
-		else:
-			startupinfo = None
+			safe_print("\n".join(" ".join(str(n) for n in RGB_triplet)
+								 for RGB_triplet in RGB_triplets))
 
 		pcs = "x"
 
-		# Prepare 'input' profile
-		profile_in.write(os.path.join(cwd, "profile_in.icc"))
-
-		# Lookup RGB -> XYZ values through 'input' profile using xicclu
-		stderr = tempfile.SpooledTemporaryFile()
-		p = sp.Popen([xicclu, "-ff", "-i" + intent, "-p" + pcs, "profile_in.icc"], 
-					 stdin=sp.PIPE, stdout=sp.PIPE, stderr=stderr, 
-					 cwd=cwd.encode(fs_enc), startupinfo=startupinfo)
-		self.subprocess = p
-		if p.poll() not in (0, None):
-			stderr.seek(0)
-			raise Error(stderr.read().strip())
-		try:
-			odata = p.communicate("\n".join(RGB_triplets))[0].splitlines()
-		except IOError:
-			stderr.seek(0)
-			raise Error(stderr.read().strip())
-		if p.wait() != 0:
-			raise IOError(''.join(odata))
-		stderr.close()
-
-		# Convert xicclu output to XYZ triplets
-		XYZ_triplets = []
-		for line in odata:
-			line = "".join(line.strip().split("->")).split()
-			XYZ_triplets.append(" ".join([n for n in line[5:8]]))
+		# Lookup RGB -> XYZ values through 'input' profile
+		XYZ_triplets = self.xicclu(profile_in, RGB_triplets, intent, "f", pcs)
 		if debug:
 			safe_print(len(XYZ_triplets), "XYZ triplets")
-			safe_print("\n".join(XYZ_triplets))
-
-		# Prepare 'output' profile
-		profile_out.write(os.path.join(cwd, "profile_out.icc"))
+			safe_print("\n".join(" ".join(str(n) for n in XYZ_triplet)
+								 for XYZ_triplet in XYZ_triplets))
 		
 		# Apply calibration?
 		if apply_cal:
@@ -1217,6 +1169,10 @@ class Worker(object):
 					CGATS.CGATSInvalidOperationError, CGATS.CGATSKeyError, 
 					CGATS.CGATSTypeError, CGATS.CGATSValueError), exception:
 				raise Error(lang.getstr("cal_extraction_failed"))
+			cwd = self.create_tempdir()
+			if isinstance(cwd, Exception):
+				raise cwd
+			profile_out.write(os.path.join(cwd, "profile_out.icc"))
 			cgats.write(os.path.join(cwd, "profile_out.cal"))
 			applycal = get_argyll_util("applycal")
 			if not applycal:
@@ -1241,78 +1197,36 @@ class Worker(object):
 			# Black point compensation
 			
 			# Get 'input' profile black point
-			bp_in = [float(n) for n in XYZ_triplets[0].split()]
+			bp_in = list(XYZ_triplets[0])
 			if debug:
 				safe_print("bp_in", bp_in)
 
-			# Lookup 'output' profile black point
-			stderr = tempfile.SpooledTemporaryFile()
-			p = sp.Popen([xicclu, "-ff", "-i" + intent, "-p" + pcs, "profile_out.icc"], 
-						 stdin=sp.PIPE, stdout=sp.PIPE, stderr=stderr, 
-						 cwd=cwd.encode(fs_enc), startupinfo=startupinfo)
-			self.subprocess = p
-			if p.poll() not in (0, None):
-				stderr.seek(0)
-				raise Error(stderr.read().strip())
-			try:
-				odata = p.communicate("0 0 0\n1 1 1")[0].splitlines()
-			except IOError:
-				stderr.seek(0)
-				raise Error(stderr.read().strip())
-			if p.wait() != 0:
-				# error
-				raise IOError(''.join(odata))
-			stderr.close()
-
-			bp_out = [float(n) for n in "".join(odata[0].strip().split("->")).split()[5:8]]
+			# Lookup 'output' profile black and white point
+			bp_out, wp_out = [list(XYZ) for XYZ in
+							  self.xicclu(profile_out, [[0, 0, 0], [1, 1, 1]],
+										  intent, "f", pcs)]
 			if debug:
 				safe_print("bp_out", bp_out)
-
-			# Get 'output' profile white point
-			wp_out = [float(n) for n in "".join(odata[1].strip().split("->")).split()[5:8]]
-			if debug:
 				safe_print("wp_out", wp_out)
 			
 			# Apply black point compensation
-			for i, XYZ_triplet in enumerate(XYZ_triplets):
-				X, Y, Z = [float(n) for n in XYZ_triplet.split()]
-				XYZ_triplets[i] = " ".join(str(n) for n in
-										   colormath.apply_bpc(X, Y, Z, bp_in,
-															   bp_out, wp_out))
+			XYZ_triplets = colormath.apply_bpc_array(XYZ_triplets, bp_in, bp_out,
+													 wp_out)
 		if debug:
 			safe_print(len(XYZ_triplets), "XYZ triplets")
-			safe_print("\n".join(XYZ_triplets))
+			safe_print("\n".join(" ".join(str(n) for n in XYZ_triplet)
+								 for XYZ_triplet in XYZ_triplets))
 
-		# Lookup XYZ -> RGB values through 'output' profile using xicclu
-		stderr = tempfile.SpooledTemporaryFile()
-		p = sp.Popen([xicclu, "-fb", "-i" + intent, "-p" + pcs, "profile_out.icc"], 
-					 stdin=sp.PIPE, stdout=sp.PIPE, stderr=stderr, 
-					 cwd=cwd.encode(fs_enc), startupinfo=startupinfo)
-		self.subprocess = p
-		if p.poll() not in (0, None):
-			stderr.seek(0)
-			raise Error(stderr.read().strip())
-		try:
-			odata = p.communicate("\n".join(XYZ_triplets))[0].splitlines()
-		except IOError:
-			stderr.seek(0)
-			raise Error(stderr.read().strip())
-		if p.wait() != 0:
-			# error
-			raise IOError(''.join(odata))
-		stderr.close()
+		# Lookup XYZ -> RGB values through 'output' profile
+		RGB_triplets = self.xicclu(profile_out, XYZ_triplets, intent, "b", pcs)
 
 		# Remove temporary files
 		self.wrapup(False)
 		
-		# Convert xicclu output to RGB triplets
-		RGB_triplets = []
-		for line in odata:
-			line = "".join(line.strip().split("->")).split()
-			RGB_triplets.append(" ".join([n for n in line[5:8]]))
 		if debug:
 			safe_print(len(RGB_triplets), "RGB triplets")
-			safe_print("\n".join(RGB_triplets))
+			safe_print("\n".join(" ".join(str(n) for n in RGB_triplet)
+								 for RGB_triplet in RGB_triplets))
 
 		lut = [["# Created with %s %s" % (appname, version)]]
 		if format == "3dl":
@@ -1331,9 +1245,8 @@ class Worker(object):
 				lut[-1] += ["%i" % int(round(i * step * (math.pow(2, input_bits) - 1)))]
 			for RGB_triplet in RGB_triplets:
 				lut.append([])
-				RGB_triplet = RGB_triplet.split()
 				for component in (0, 1, 2):
-					lut[-1] += [("%i" % int(round(float(RGB_triplet[component]) * maxval))).rjust(pad, " ")]
+					lut[-1] += [("%i" % int(round(RGB_triplet[component] * maxval))).rjust(pad, " ")]
 		elif format == "cube":
 			if maxval is None:
 				maxval = 1.0
@@ -1345,9 +1258,8 @@ class Worker(object):
 			lut.append([])
 			for RGB_triplet in RGB_triplets:
 				lut.append([])
-				RGB_triplet = RGB_triplet.split()
 				for component in (0, 1, 2):
-					lut[-1] += ["%.6f" % (float(RGB_triplet[component]) * maxval)]
+					lut[-1] += ["%.6f" % (RGB_triplet[component] * maxval)]
 		lut.append([])
 		for i, line in enumerate(lut):
 			lut[i] = " ".join(line)
@@ -3891,7 +3803,17 @@ class Worker(object):
 		Return gamut volume (int, scaled to sRGB = 1.0) and
 		coverage (dict) as tuple.
 		
+		The calculation is done in-process if the profile is supported by
+		the gamut module, otherwise Argyll's iccgamut and viewgam are used
+		(which also leave compressed gamut and VRML files next to the
+		profile).
+		
 		"""
+		try:
+			return gamut.calculate_gamut(ICCP.ICCProfile(profile_path))
+		except (IOError, NotImplementedError), exception:
+			if verbose >= 2:
+				safe_print(appname + ": Using iccgamut/viewgam -", exception)
 		outname = os.path.splitext(profile_path)[0]
 		gamut_volume = None
 		gamut_coverage = {}
@@ -3999,7 +3921,7 @@ class Worker(object):
 				cgats = CGATS.CGATS(cgats, True)
 			else:
 				# Always make a copy and do not alter a passed in CGATS instance!
-				cgats = CGATS.CGATS(str(cgats))
+				cgats = cgats.copy()
 			if 0 in cgats:
 				# only look at the first section
 				cgats[0].filename = cgats.filename
@@ -4032,8 +3954,8 @@ class Worker(object):
 	def ti1_lookup_to_ti3(self, ti1, profile, pcs=None, absolute=False):
 		"""
 		Read TI1 (filename or CGATS instance), lookup device->pcs values 
-		colorimetrically through profile using Argyll's xicclu 
-		utility and return TI3 (CGATS instance)
+		colorimetrically through profile (see xicclu) and return TI3 
+		(CGATS instance)
 		
 		"""
 		
@@ -4067,8 +3989,10 @@ class Worker(object):
 		# required fields for ti1
 		if colorspace == "CMYK":
 			required = ("CMYK_C", "CMYK_M", "CMYK_Y", "CMYK_K")
-		else:
+		elif colorspace == "RGB":
 			required = ("RGB_R", "RGB_G", "RGB_B")
+		else:
+			raise ValueError('Unknown color representation ' + colorspace)
 		ti1_filename = ti1.filename
 		try:
 			ti1 = verify_cgats(ti1, required, True)
@@ -4123,50 +4047,29 @@ class Worker(object):
 		
 		idata = []
 		for primaries in device_data.values():
-			idata.append(' '.join(str(n) for n in primaries.values()))
-		##safe_print('\n'.join(idata))
+			idata.append(primaries.values())
+		##safe_print('\n'.join(' '.join(str(n) for n in device) for device in idata))
 
-		# lookup device->cie values through profile using xicclu
-		xicclu = get_argyll_util("xicclu").encode(fs_enc)
-		cwd = self.create_tempdir()
-		if isinstance(cwd, Exception):
-			raise cwd
-		profile.write(os.path.join(cwd, "temp.icc"))
-		if sys.platform == "win32":
-			startupinfo = sp.STARTUPINFO()
-			startupinfo.dwFlags |= sp.STARTF_USESHOWWINDOW
-			startupinfo.wShowWindow = sp.SW_HIDE
-		else:
-			startupinfo = None
-		p = sp.Popen([xicclu, '-ff', '-i' + ('a' if absolute else 'r'), '-p' + pcs, '-s100', "temp.icc"], 
-					 stdin=sp.PIPE, stdout=sp.PIPE, stderr=sp.STDOUT, 
-					 cwd=cwd.encode(fs_enc), startupinfo=startupinfo)
-		odata = p.communicate('\n'.join(idata))[0].splitlines()
-		if p.wait() != 0:
-			# error
-			raise IOError(''.join(odata))
-		##safe_print('\n'.join(odata))
+		# lookup device->cie values through profile
+		odata = self.xicclu(profile, idata, 'a' if absolute else 'r', 'f',
+							pcs, 100)
+		##safe_print('\n'.join(' '.join(str(n) for n in cie) for cie in odata))
 		
 		gray = []
 		igray = []
 		igray_idx = []
 		if colorspace == "RGB":
 			# treat r=g=b specially: set expected a=b=0
-			for i, line in enumerate(odata):
-				line = line.strip().split('->')
-				line = ''.join(line).split()
-				if line[-1] == '(clip)':
-					line.pop()
-				r, g, b = [float(n) for n in line[:3]]
+			for i, (device, cie) in enumerate(zip(idata, odata)):
+				r, g, b = device
 				if r == g == b < 100:
 					# if grayscale and not white
-					cie = [float(n) for n in line[5:-1]]
 					if pcs == 'x':
-						# Need to scale XYZ coming from xicclu
+						# Need to scale XYZ coming from the lookup
 						# Lab is already scaled
 						cie = colormath.XYZ2Lab(*[n * 100.0 for n in cie])
 					cie = (cie[0], 0, 0)  # set a=b=0
-					igray.append("%s %s %s" % cie)
+					igray.append(cie)
 					igray_idx.append(i)
 					if pcs == 'x':
 						cie = colormath.Lab2XYZ(*cie)
@@ -4179,38 +4082,13 @@ class Worker(object):
 						gray.append((r, g, b))
 					if False:  # NEVER?
 						# set cie in odata to a=b=0
-						line[5:-1] = [str(n) for n in cie]
-						odata[i] = ' -> '.join([' '.join(line[:4]), line[4], 
-												' '.join(line[5:])])
+						odata[i] = cie
 			
 		if igray and False:  # NEVER?
-			# lookup cie->device values for grays through profile using xicclu
+			# lookup cie->device values for grays through profile
 			gray = []
-			xicclu = get_argyll_util("xicclu").encode(fs_enc)
-			cwd = self.create_tempdir()
-			if isinstance(cwd, Exception):
-				raise cwd
-			profile.write(os.path.join(cwd, "temp.icc"))
-			if sys.platform == "win32":
-				startupinfo = sp.STARTUPINFO()
-				startupinfo.dwFlags |= sp.STARTF_USESHOWWINDOW
-				startupinfo.wShowWindow = sp.SW_HIDE
-			else:
-				startupinfo = None
-			p = sp.Popen([xicclu, '-fb', '-ir', '-pl', '-s100', "temp.icc"], 
-						 stdin=sp.PIPE, stdout=sp.PIPE, stderr=sp.STDOUT, 
-						 cwd=cwd.encode(fs_enc), startupinfo=startupinfo)
-			ogray = p.communicate('\n'.join(igray))[0].splitlines()
-			if p.wait() != 0:
-				# error
-				raise IOError(''.join(odata))
-			for i, line in enumerate(ogray):
-				line = line.strip().split('->')
-				line = ''.join(line).split()
-				if line[-1] == '(clip)':
-					line.pop()
-				cie = [float(n) for n in line[:3]]
-				rgb = [float(n) for n in line[5:-1]]
+			ogray = self.xicclu(profile, igray, 'r', 'b', 'l', 100)
+			for i, (cie, rgb) in enumerate(zip(igray, ogray)):
 				if colormath.Lab2XYZ(cie[0], 0, 0)[1] * 100.0 >= 1:
 					# only add if luminance is greater or equal 1% because 
 					# dark tones fluctuate too much
@@ -4219,9 +4097,7 @@ class Worker(object):
 				for n, channel in enumerate(("R", "G", "B")):
 					data[igray_idx[i] + 
 						 white_added_count]["RGB_" + channel] = rgb[n]
-				oline = odata[igray_idx[i]].strip().split('->', 1)
-				odata[igray_idx[i]] = ' [RGB] ->'.join([' '.join(line[5:-1])] + 
-													   oline[1:])
+				idata[igray_idx[i]] = rgb
 		
 		self.wrapup(False)
 
@@ -4234,59 +4110,51 @@ class Worker(object):
 		ofile.write('DEVICE_CLASS "' + ('DISPLAY' if colorspace == 'RGB' else 
 										'OUTPUT') + '"\n')
 		include_sample_name = False
-		i = 0
-		offset = 0 if colorspace == "RGB" else 1
-		for line in odata:
-			line = line.strip().split('->')
-			line = ''.join(line).split()
-			if line[-1] == '(clip)':
-				line.pop()
-			if i == 0:
-				icolor = line[3 + offset].strip('[]')
-				if icolor == 'RGB':
-					olabel = 'RGB_R RGB_G RGB_B'
-				elif icolor == 'CMYK':
-					olabel = 'CMYK_C CMYK_M CMYK_Y CMYK_K'
-				else:
-					raise ValueError('Unknown color representation ' + icolor)
-				ocolor = line[-1].strip('[]').upper()
-				if ocolor == 'LAB':
-					ilabel = 'LAB_L LAB_A LAB_B'
-				elif ocolor == 'XYZ':
-					ilabel = 'XYZ_X XYZ_Y XYZ_Z'
-				else:
-					raise ValueError('Unknown CIE color representation ' + ocolor)
-				ofile.write('KEYWORD "COLOR_REP"\n')
-				ofile.write('COLOR_REP "' + icolor + '_' + ocolor + '"\n')
-				
-				ofile.write('\n')
-				ofile.write('NUMBER_OF_FIELDS ')
-				if include_sample_name:
-					ofile.write(str(2 + len(icolor) + len(ocolor)) + '\n')
-				else:
-					ofile.write(str(1 + len(icolor) + len(ocolor)) + '\n')
-				ofile.write('BEGIN_DATA_FORMAT\n')
-				ofile.write('SAMPLE_ID ')
-				if include_sample_name:
-					ofile.write('SAMPLE_NAME ' + olabel + ' ' + ilabel + '\n')
-				else:
-					ofile.write(olabel + ' ' + ilabel + '\n')
-				ofile.write('END_DATA_FORMAT\n')
-				ofile.write('\n')
-				ofile.write('NUMBER_OF_SETS ' + str(len(odata)) + '\n')
-				ofile.write('BEGIN_DATA\n')
-			i += 1
-			cie = [float(n) for n in line[5 + offset:-1]]
+		if colorspace == 'RGB':
+			icolor = 'RGB'
+			olabel = 'RGB_R RGB_G RGB_B'
+		elif colorspace == 'CMYK':
+			icolor = 'CMYK'
+			olabel = 'CMYK_C CMYK_M CMYK_Y CMYK_K'
+		else:
+			raise ValueError('Unknown color representation ' + colorspace)
+		if pcs == 'l':
+			ocolor = 'LAB'
+			ilabel = 'LAB_L LAB_A LAB_B'
+		else:
+			ocolor = 'XYZ'
+			ilabel = 'XYZ_X XYZ_Y XYZ_Z'
+		ofile.write('KEYWORD "COLOR_REP"\n')
+		ofile.write('COLOR_REP "' + icolor + '_' + ocolor + '"\n')
+		ofile.write('\n')
+		ofile.write('NUMBER_OF_FIELDS ')
+		if include_sample_name:
+			ofile.write(str(2 + len(icolor) + len(ocolor)) + '\n')
+		else:
+			ofile.write(str(1 + len(icolor) + len(ocolor)) + '\n')
+		ofile.write('BEGIN_DATA_FORMAT\n')
+		ofile.write('SAMPLE_ID ')
+		if include_sample_name:
+			ofile.write('SAMPLE_NAME ' + olabel + ' ' + ilabel + '\n')
+		else:
+			ofile.write(olabel + ' ' + ilabel + '\n')
+		ofile.write('END_DATA_FORMAT\n')
+		ofile.write('\n')
+		ofile.write('NUMBER_OF_SETS ' + str(len(odata)) + '\n')
+		ofile.write('BEGIN_DATA\n')
+		for i, (device, cie) in enumerate(zip(idata, odata)):
 			if pcs == 'x':
-				# Need to scale XYZ coming from xicclu, Lab is already scaled
+				# Need to scale XYZ coming from the lookup, Lab is already
+				# scaled
 				cie = [round(n * 100.0, 5 - len(str(int(abs(n * 100.0))))) 
 					   for n in cie]
+			device = [str(n) for n in device]
 			cie = [str(n) for n in cie]
 			if include_sample_name:
-				ofile.write(str(i) + ' ' + data[i - 1][1].strip('"') + ' ' + 
-							' '.join(line[:3 + offset]) + ' ' + ' '.join(cie) + '\n')
+				ofile.write(str(i + 1) + ' ' + data[i][1].strip('"') + ' ' + 
+							' '.join(device) + ' ' + ' '.join(cie) + '\n')
 			else:
-				ofile.write(str(i) + ' ' + ' '.join(line[:3 + offset]) + ' ' + 
+				ofile.write(str(i + 1) + ' ' + ' '.join(device) + ' ' + 
 							' '.join(cie) + '\n')
 		ofile.write('END_DATA\n')
 		ofile.seek(0)
@@ -4295,8 +4163,8 @@ class Worker(object):
 	def ti3_lookup_to_ti1(self, ti3, profile):
 		"""
 		Read TI3 (filename or CGATS instance), lookup cie->device values 
-		colorimetrically through profile using Argyll's xicclu 
-		utility and return TI1 and compatible TI3 (CGATS instances)
+		colorimetrically through profile (see xicclu) and return TI1 and 
+		compatible TI3 (CGATS instances)
 		
 		"""
 		
@@ -4311,7 +4179,7 @@ class Worker(object):
 		ti3_filename = ti3.filename
 		if copy:
 			# Make a copy and do not alter a passed in CGATS instance!
-			ti3 = CGATS.CGATS(str(ti3))
+			ti3 = ti3.copy()
 		
 		try:
 			ti3v = verify_cgats(ti3, ("LAB_L", "LAB_A", "LAB_B"), True)
@@ -4382,29 +4250,12 @@ class Worker(object):
 			if color_rep == 'XYZ':
 				# assume scale 0...100 in ti3, we need to convert to 0...1
 				cie = [n / 100.0 for n in cie]
-			idata.append(' '.join(str(n) for n in cie))
-		##safe_print('\n'.join(idata))
+			idata.append(cie)
+		##safe_print('\n'.join(' '.join(str(n) for n in cie) for cie in idata))
 
-		# lookup cie->device values through profile.icc using xicclu
-		xicclu = get_argyll_util("xicclu").encode(fs_enc)
-		cwd = self.create_tempdir()
-		if isinstance(cwd, Exception):
-			raise cwd
-		profile.write(os.path.join(cwd, "temp.icc"))
-		if sys.platform == "win32":
-			startupinfo = sp.STARTUPINFO()
-			startupinfo.dwFlags |= sp.STARTF_USESHOWWINDOW
-			startupinfo.wShowWindow = sp.SW_HIDE
-		else:
-			startupinfo = None
-		p = sp.Popen([xicclu, '-fb', '-ir', '-p' + pcs, '-s100', "temp.icc"], 
-					 stdin=sp.PIPE, stdout=sp.PIPE, stderr=sp.STDOUT, 
-					 cwd=cwd.encode(fs_enc), startupinfo=startupinfo)
-		odata = p.communicate('\n'.join(idata))[0].splitlines()
-		if p.wait() != 0:
-			# error
-			raise IOError(''.join(odata))
-		##safe_print('\n'.join(odata))
+		# lookup cie->device values through profile
+		odata = self.xicclu(profile, idata, 'r', 'b', pcs, 100)
+		##safe_print('\n'.join(' '.join(str(n) for n in device) for device in odata))
 		self.wrapup(False)
 		
 		# write output ti1/ti3
@@ -4413,65 +4264,55 @@ class Worker(object):
 		ti1out.write('\n')
 		ti1out.write('DESCRIPTOR "Argyll Calibration Target chart information 1"\n')
 		include_sample_name = False
-		i = 0
-		for line in odata:
-			line = line.strip().split('->')
-			line = ''.join(line).split()
-			if line[-1] == '(clip)':
-				line.pop()
-			if i == 0:
-				icolor = line[3].strip('[]').upper()
-				if icolor == 'LAB':
-					ilabel = 'LAB_L LAB_A LAB_B'
-				elif icolor == 'XYZ':
-					ilabel = 'XYZ_X XYZ_Y XYZ_Z'
-				else:
-					raise ValueError('Unknown CIE color representation ' + icolor)
-				ocolor = line[-1].strip('[]')
-				if ocolor == 'RGB':
-					olabel = 'RGB_R RGB_G RGB_B'
-				elif ocolor == 'CMYK':
-					olabel = 'CMYK_C CMYK_M CMYK_Y CMYK_K'
-				else:
-					raise ValueError('Unknown color representation ' + ocolor)
-				olabels = olabel.split()
-				# add device fields to DATA_FORMAT if not yet present
-				if not olabels[0] in ti3v.DATA_FORMAT.values() and \
-				   not olabels[1] in ti3v.DATA_FORMAT.values() and \
-				   not olabels[2] in ti3v.DATA_FORMAT.values() and \
-				   (ocolor == 'RGB' or (ocolor == 'CMYK' and 
-				    not olabels[3] in ti3v.DATA_FORMAT.values())):
-					ti3v.DATA_FORMAT.add_data(olabels)
-				# add required fields to DATA_FORMAT if not yet present
-				if not required[0] in ti3v.DATA_FORMAT.values() and \
-				   not required[1] in ti3v.DATA_FORMAT.values() and \
-				   not required[2] in ti3v.DATA_FORMAT.values():
-					ti3v.DATA_FORMAT.add_data(required)
-				ti1out.write('KEYWORD "COLOR_REP"\n')
-				ti1out.write('COLOR_REP "' + ocolor + '"\n')
-				ti1out.write('\n')
-				ti1out.write('NUMBER_OF_FIELDS ')
-				if include_sample_name:
-					ti1out.write(str(2 + len(icolor) + len(ocolor)) + '\n')
-				else:
-					ti1out.write(str(1 + len(icolor) + len(ocolor)) + '\n')
-				ti1out.write('BEGIN_DATA_FORMAT\n')
-				ti1out.write('SAMPLE_ID ')
-				if include_sample_name:
-					ti1out.write('SAMPLE_NAME ' + olabel + ' ' + ilabel + '\n')
-				else:
-					ti1out.write(olabel + ' ' + ilabel + '\n')
-				ti1out.write('END_DATA_FORMAT\n')
-				ti1out.write('\n')
-				ti1out.write('NUMBER_OF_SETS ' + str(len(odata)) + '\n')
-				ti1out.write('BEGIN_DATA\n')
+		icolor = color_rep
+		ilabel = ' '.join(required)
+		if colorspace == 'RGB':
+			ocolor = 'RGB'
+			olabel = 'RGB_R RGB_G RGB_B'
+		elif colorspace == 'CMYK':
+			ocolor = 'CMYK'
+			olabel = 'CMYK_C CMYK_M CMYK_Y CMYK_K'
+		else:
+			raise ValueError('Unknown color representation ' + colorspace)
+		olabels = olabel.split()
+		# add device fields to DATA_FORMAT if not yet present
+		if not olabels[0] in ti3v.DATA_FORMAT.values() and \
+		   not olabels[1] in ti3v.DATA_FORMAT.values() and \
+		   not olabels[2] in ti3v.DATA_FORMAT.values() and \
+		   (ocolor == 'RGB' or (ocolor == 'CMYK' and 
+		    not olabels[3] in ti3v.DATA_FORMAT.values())):
+			ti3v.DATA_FORMAT.add_data(olabels)
+		# add required fields to DATA_FORMAT if not yet present
+		if not required[0] in ti3v.DATA_FORMAT.values() and \
+		   not required[1] in ti3v.DATA_FORMAT.values() and \
+		   not required[2] in ti3v.DATA_FORMAT.values():
+			ti3v.DATA_FORMAT.add_data(required)
+		ti1out.write('KEYWORD "COLOR_REP"\n')
+		ti1out.write('COLOR_REP "' + ocolor + '"\n')
+		ti1out.write('\n')
+		ti1out.write('NUMBER_OF_FIELDS ')
+		if include_sample_name:
+			ti1out.write(str(2 + len(icolor) + len(ocolor)) + '\n')
+		else:
+			ti1out.write(str(1 + len(icolor) + len(ocolor)) + '\n')
+		ti1out.write('BEGIN_DATA_FORMAT\n')
+		ti1out.write('SAMPLE_ID ')
+		if include_sample_name:
+			ti1out.write('SAMPLE_NAME ' + olabel + ' ' + ilabel + '\n')
+		else:
+			ti1out.write(olabel + ' ' + ilabel + '\n')
+		ti1out.write('END_DATA_FORMAT\n')
+		ti1out.write('\n')
+		ti1out.write('NUMBER_OF_SETS ' + str(len(odata)) + '\n')
+		ti1out.write('BEGIN_DATA\n')
+		for i, device in enumerate(odata):
 			if i < len(wp):
 				if ocolor == 'RGB':
 					device = '100.00 100.00 100.00'.split()
 				else:
 					device = '0 0 0 0'.split()
 			else:
-				device = line[5:-1]
+				device = ['%f' % n for n in device]
 			cie = (wp + cie_data.values())[i].values()
 			cie = [str(n) for n in cie]
 			if include_sample_name:
@@ -4483,11 +4324,10 @@ class Worker(object):
 			if i > len(wp) - 1:  # don't include whitepoint patches in ti3
 				# set device values in ti3
 				for n, v in enumerate(olabels):
-					ti3v.DATA[i - len(wp)][v] = float(line[5 + n])
+					ti3v.DATA[i - len(wp)][v] = float(device[n])
 				# set PCS values in ti3
 				for n, v in enumerate(cie):
 					ti3v.DATA[i - len(wp)][required[n]] = float(v)
-			i += 1
 		ti1out.write('END_DATA\n')
 		ti1out.seek(0)
 		return CGATS.CGATS(ti1out), ti3v
@@ -4653,3 +4493,67 @@ class Worker(object):
 								   tuple(safe_unicode(s) for s in 
 										 (self.tempdir, exception)))
 		return True
+
+	def xicclu(self, profile, idata, intent="r", direction="f", pcs=None,
+			   scale=1):
+		"""
+		Lookup values through profile.
+		
+		idata is a sequence of device or PCS values depending on direction.
+		The options have the same meaning as the respective xicclu
+		options. Returns the looked up values as NumPy array.
+		
+		The lookup is done in-process if the profile is supported by the
+		cmm module, otherwise Argyll's xicclu is used.
+		
+		"""
+		try:
+			return cmm.lookup(profile, idata, direction, intent, pcs, scale)
+		except NotImplementedError, exception:
+			if verbose >= 2:
+				safe_print(appname + ": Using xicclu -", exception)
+		if not pcs:
+			pcs = {"Lab": "l"}.get(profile.connectionColorSpace, "x")
+		xicclu = get_argyll_util("xicclu")
+		if not xicclu:
+			raise Error(lang.getstr("argyll.util.not_found", "xicclu"))
+		cwd = self.create_tempdir()
+		if isinstance(cwd, Exception):
+			raise cwd
+		profile.write(os.path.join(cwd, "temp.icc"))
+		if sys.platform == "win32":
+			startupinfo = sp.STARTUPINFO()
+			startupinfo.dwFlags |= sp.STARTF_USESHOWWINDOW
+			startupinfo.wShowWindow = sp.SW_HIDE
+		else:
+			startupinfo = None
+		idata = numpy.asarray(idata, dtype=numpy.float64)
+		stderr = tempfile.SpooledTemporaryFile()
+		p = sp.Popen([xicclu.encode(fs_enc), "-f" + direction, "-i" + intent,
+					  "-p" + pcs, "-s%s" % scale, "temp.icc"], 
+					 stdin=sp.PIPE, stdout=sp.PIPE, stderr=stderr, 
+					 cwd=cwd.encode(fs_enc), startupinfo=startupinfo)
+		self.subprocess = p
+		if p.poll() not in (0, None):
+			stderr.seek(0)
+			raise Error(stderr.read().strip())
+		try:
+			odata = p.communicate("\n".join(" ".join(repr(v) for v in values)
+											for values in idata))[0].splitlines()
+		except IOError:
+			stderr.seek(0)
+			raise Error(stderr.read().strip())
+		if p.wait() != 0:
+			raise IOError(''.join(odata))
+		stderr.close()
+		self.wrapup(False)
+		# Each line looks like '<input values> [<input color rep>] -> 
+		# <method> -> <output values> [<output color rep>] (clip)'
+		channels = idata.shape[-1]
+		values = []
+		for line in odata:
+			line = "".join(line.strip().split("->")).split()
+			if line[-1] == "(clip)":
+				line.pop()
+			values.append([float(n) for n in line[channels + 2:-1]])
+		return numpy.array(values)
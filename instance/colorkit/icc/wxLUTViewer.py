@@ -4,19 +4,17 @@
 from decimal import Decimal
 import math
 import os
-import subprocess as sp
 import sys
-import tempfile
 import traceback
 
 import numpy
 
 from argyll_cgats import cal_to_fake_profile
-from config import fs_enc, get_bitmap_as_icon, getcfg, geticon, setcfg
+from config import get_bitmap_as_icon, getcfg, geticon, setcfg
 from meta import name as appname
 from util_decimal import float2dec
 from util_os import waccess
-from worker import Error, Worker, get_argyll_util, show_result_dialog
+from worker import Error, Worker, show_result_dialog
 from wxaddons import FileDrop, wx
 from wxenhancedplot import _Numeric
 from wxwindows import InfoDialog
@@ -668,23 +666,6 @@ class LUTFrame(wx.Frame):
 									(profile.profileClass,
 									 profile.colorSpace)))
 		
-		# Setup xicclu
-		xicclu = get_argyll_util("xicclu").encode(fs_enc)
-		if not xicclu:
-			return
-		cwd = self.client.worker.create_tempdir()
-		if isinstance(cwd, Exception):
-			raise cwd
-		if sys.platform == "win32":
-			startupinfo = sp.STARTUPINFO()
-			startupinfo.dwFlags |= sp.STARTF_USESHOWWINDOW
-			startupinfo.wShowWindow = sp.SW_HIDE
-		else:
-			startupinfo = None
-
-		# Prepare profile
-		profile.write(os.path.join(cwd, "profile.icc"))
-		
 		# Prepare input Lab values
 		XYZ_triplets = []
 		Lab_triplets = []
@@ -698,35 +679,11 @@ class LUTFrame(wx.Frame):
 															  whitepoint_destination=profile.tags.wtpt.values())])
 			else:
 				a = b = 0
-			Lab_triplets.append(" ".join([str(i * (100.0 / (size - 1))),
-										  str(a), str(b)]))
+			Lab_triplets.append([i * (100.0 / (size - 1)), a, b])
 		
-		# Lookup Lab -> RGB values through 'input' profile using xicclu
-		stderr = tempfile.SpooledTemporaryFile()
-		p = sp.Popen([xicclu, "-fb", "-i" + intent, "-pl", "profile.icc"], 
-					 stdin=sp.PIPE, stdout=sp.PIPE, stderr=stderr, 
-					 cwd=cwd.encode(fs_enc), startupinfo=startupinfo)
-		self.client.worker.subprocess = p
-		if p.poll() not in (0, None):
-			stderr.seek(0)
-			raise Error(stderr.read().strip())
-		try:
-			odata = p.communicate("\n".join(Lab_triplets))[0].splitlines()
-		except IOError:
-			stderr.seek(0)
-			raise Error(stderr.read().strip())
-		if p.wait() != 0:
-			raise IOError(''.join(odata))
-		stderr.close()
-
-		# Remove temporary files
-		self.client.worker.wrapup(False)
-
-		rgb_triplets = []
-		for i, line in enumerate(odata):
-			line = "".join(line.strip().split("->")).split()
-			rgb_triplet = [float(n) for n in line[channels + 2:channels + 5]]
-			rgb_triplets.append(rgb_triplet)
+		# Lookup Lab -> RGB values through profile
+		rgb_triplets = self.client.worker.xicclu(profile, Lab_triplets,
+												 intent, "b", "l")
 		
 		self.rTRC = CoordinateType()
 		self.gTRC = CoordinateType()
@@ -734,7 +691,7 @@ class LUTFrame(wx.Frame):
 		for j, rgb in enumerate(rgb_triplets):
 			for i, v in enumerate(rgb):
 				v *= 255
-				y = colormath.Lab2XYZ(float(Lab_triplets[j].split()[0]), 0, 0)[1] * 100
+				y = colormath.Lab2XYZ(Lab_triplets[j][0], 0, 0)[1] * 100
 				if i == 0:
 					self.rTRC.append([y, v])
 				elif i == 1:
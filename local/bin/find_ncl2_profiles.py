@@ -7,33 +7,31 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from colorkit.icc import ICCProfile as iccp
-from colorkit.icc.defaultpaths import iccprofiles, iccprofiles_home
 from colorkit.icc.safe_print import safe_print
 
-pths = set(iccprofiles_home + iccprofiles)
-pths.add('/Users/fish/Library/ColorSync/Profiles')
-pths.add('/Users/fish/Dropbox/ost2/face/icc/uploads')
-pths.add('/Users/fish/Dropbox/ost2/face/icc/s3')
+pths = list(iccp.profile_index.paths)
+pths.append('/Users/fish/Library/ColorSync/Profiles')
+pths.append('/Users/fish/Dropbox/ost2/face/icc/uploads')
+pths.append('/Users/fish/Dropbox/ost2/face/icc/s3')
 
-for p in pths:
-    if os.path.isdir(p):
-        for f in os.listdir(p):
-            try:
-                profile = iccp.ICCProfile(os.path.join(p, f))
-            except:
-                pass
-            else:
-                if "ncl2" in profile.tags:
-                    safe_print(f)
-                    safe_print(profile.tags.ncl2)
-                    safe_print("")
-                    
-                    #profile.print_info()
-                    for label, value in profile.get_info():
-                        if not value:
-                            safe_print(unicode(label))
-                        else:
-                            safe_print(unicode(label) + u":", unicode(value))
-                    
-                    safe_print("")
+for path, info in iccp.ProfileIndex(pths).query(tags="ncl2"):
+    f = os.path.basename(path)
+    try:
+        profile = iccp.ICCProfile(path)
+    except:
+        pass
+    else:
+        if "ncl2" in profile.tags:
+            safe_print(f)
+            safe_print(profile.tags.ncl2)
+            safe_print("")
+            
+            #profile.print_info()
+            for label, value in profile.get_info():
+                if not value:
+                    safe_print(unicode(label))
+                else:
+                    safe_print(unicode(label) + u":", unicode(value))
+            
+            safe_print("")
 